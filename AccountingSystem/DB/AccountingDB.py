@@ -8,7 +8,9 @@ import random
 from DIRAC.Core.Base.DB import DB
 from DIRAC import S_OK, S_ERROR, gMonitor, gConfig
 from DIRAC.Core.Utilities import List, ThreadSafe, Time, DEncode
+from DIRAC.Core.Utilities.LRUCache import LRUCache
 from DIRAC.AccountingSystem.private.ObjectLoader import loadObjects
+from DIRAC.AccountingSystem.private.BucketSchedule import BucketSchedule
 from DIRAC.AccountingSystem.Client.Types.BaseAccountingType import BaseAccountingType
 from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 
@@ -27,7 +29,7 @@ class AccountingDB( DB ):
     self.__queuedRecordsToInsert = []
     self.dbCatalog = {}
     self.dbBucketsLength = {}
-    self.__keysCache = {}
+    self.__keysCache = LRUCache( self.getCSOption( "KeyIdCacheSize", 100000 ) )
     maxParallelInsertions = self.getCSOption( "ParallelRecordInsertions", 10 )
     self.__threadPool = ThreadPool( 1, maxParallelInsertions )
     self.__threadPool.daemonize()
@@ -68,6 +70,35 @@ class AccountingDB( DB ):
     self.__lastCompactionEpoch = Time.toEpoch( lcd )
 
     self.__registerTypes()
+    self.__warmUpKeysCache()
+
+  def __warmUpKeysCache( self ):
+    """
+    Load the key ids of all the types in the cache up to its size
+    """
+    free = self.__keysCache.getMaxSize() - len( self.__keysCache )
+    loaded = 0
+    for typeName in self.dbCatalog:
+      for keyName in self.dbCatalog[ typeName ][ 'keys' ]:
+        if free <= 0:
+          break
+        #The most recent ids are the most likely to be used
+        retVal = self._query( "SELECT `id`, `value` FROM `%s` ORDER BY `id` DESC LIMIT %d" % ( _getTableName( "key", typeName, keyName ),
+                                                                                           free ) )
+        if not retVal[ 'OK' ]:
+          self.log.error( "Can't load key ids in the cache", "for %s %s: %s" % ( typeName, keyName, retVal[ 'Message' ] ) )
+          continue
+        for keyId, keyValue in retVal[ 'Value' ]:
+          self.__keysCache.add( ( typeName, keyName, str( keyValue ) ), keyId )
+        loaded += len( retVal[ 'Value' ] )
+        free -= len( retVal[ 'Value' ] )
+    self.log.info( "Loaded %s key ids in the cache" % loaded )
+
+  def getKeysCacheStats( self ):
+    """
+    Get the size, hits and misses of the key ids cache
+    """
+    return S_OK( self.__keysCache.getStats() )
 
   def __loadTablesCreated( self ):
     result = self._query( "show tables" )
@@ -452,6 +483,8 @@ class AccountingDB( DB ):
       return retVal
     retVal = self._update( "DELETE FROM `%s` WHERE name='%s'" % ( _getTableName( "catalog", "Types" ), typeName ) )
     del( self.dbCatalog[ typeName ] )
+    #The key ids of the type are not valid any more
+    self.__keysCache.purgeAll()
     return S_OK()
 
   def __getIdForKeyValue( self, typeName, keyName, keyValue, conn = False ):
@@ -482,33 +515,33 @@ class AccountingDB( DB ):
       keyValue = keyValue[:64]
 
     #Look into the cache
-    if typeName not in self.__keysCache:
-      self.__keysCache[ typeName ] = {}
-    typeCache = self.__keysCache[ typeName ]
-    if keyName not in typeCache:
-      typeCache[ keyName ] = {}
-    keyCache = typeCache[ keyName ]
-    if keyValue in keyCache:
-      return S_OK( keyCache[ keyValue ] )
+    cacheKey = ( typeName, keyName, keyValue )
+    keyId = self.__keysCache.get( cacheKey )
+    if keyId is not None:
+      return S_OK( keyId )
     #Retrieve key
     keyTable = _getTableName( "key", typeName, keyName )
     retVal = self.__getIdForKeyValue( typeName, keyName, keyValue )
     if retVal[ 'OK' ]:
-      keyCache[ keyValue ] = retVal[ 'Value' ]
+      self.__keysCache.add( cacheKey, retVal[ 'Value' ] )
       return retVal
     #Key is not in there
     retVal = self._getConnection()
     if not retVal[ 'OK' ]:
       return retVal
     connection = retVal[ 'Value' ]
-    self.log.info( "Value %s for key %s didn't exist, inserting" % ( keyValue, keyName ) )
-    retVal = self._insert( keyTable, [ 'id', 'value' ], [ 0, keyValue ], connection )
-    if not retVal[ 'OK' ] and retVal[ 'Message' ].find( "Duplicate key" ) == -1:
-      return retVal
-    result = self.__getIdForKeyValue( typeName, keyName, keyValue, connection )
+    try:
+      self.log.info( "Value %s for key %s didn't exist, inserting" % ( keyValue, keyName ) )
+      retVal = self._insert( keyTable, [ 'id', 'value' ], [ 0, keyValue ], connection )
+      if not retVal[ 'OK' ] and retVal[ 'Message' ].find( "Duplicate" ) == -1:
+        return retVal
+      #Ids are never modified, so whichever thread inserted the value the id is the same
+      result = self.__getIdForKeyValue( typeName, keyName, keyValue, connection )
+    finally:
+      connection.release()
     if not result[ 'OK' ]:
       return result
-    keyCache[ keyValue ] = result[ 'Value' ]
+    self.__keysCache.add( cacheKey, result[ 'Value' ] )
     return result
 
   def calculateBucketLengthForTime( self, typeName, now, when ):
@@ -522,31 +555,20 @@ class AccountingDB( DB ):
         return granuT[1]
     return self.maxBucketTime
 
+  def getBucketSchedule( self, typeName, nowEpoch = False ):
+    """
+    Get the bucket schedule of a type to split records in buckets
+    """
+    if not nowEpoch:
+      nowEpoch = int( Time.toEpoch( Time.dateTime() ) )
+    return BucketSchedule( self.dbBucketsLength[ typeName ], nowEpoch, self.maxBucketTime )
+
   def calculateBuckets( self, typeName, startTime, endTime, nowEpoch = False ):
     """
     Magic function for calculating buckets between two times and
     the proportional part for each bucket
     """
-    if not nowEpoch:
-      nowEpoch = int( Time.toEpoch( Time.dateTime() ) )
-    bucketTimeLength = self.calculateBucketLengthForTime( typeName, nowEpoch, startTime )
-    currentBucketStart = startTime - startTime % bucketTimeLength
-    if startTime == endTime:
-      return [ ( currentBucketStart,
-                 1,
-                 bucketTimeLength ) ]
-    buckets = []
-    totalLength = endTime - startTime
-    while currentBucketStart < endTime:
-      start = max( currentBucketStart, startTime )
-      end = min( currentBucketStart + bucketTimeLength, endTime )
-      proportion = float( end - start ) / totalLength
-      buckets.append( ( currentBucketStart,
-                        proportion,
-                        bucketTimeLength ) )
-      currentBucketStart += bucketTimeLength
-      bucketTimeLength = self.calculateBucketLengthForTime( typeName, nowEpoch, currentBucketStart )
-    return buckets
+    return self.getBucketSchedule( typeName, nowEpoch ).calculateBuckets( startTime, endTime )
 
   def __insertInQueueTable( self, typeName, startTime, endTime, valuesList ):
     sqlFields = [ 'id', 'taken', 'takenSince' ] + self.dbCatalog[ typeName ][ 'typeFields' ]
@@ -595,17 +617,34 @@ class AccountingDB( DB ):
     Do the real insert and delete from the in buffer table
     """
     self.log.verbose( "Received bundle to process", "of %s elements" % len( recordTuples ) )
+    typeRecords = {}
     for record in recordTuples:
-      iD, typeName, startTime, endTime, valuesList, insertionEpoch = record
-      result = self.insertRecordDirectly( typeName, startTime, endTime, valuesList )
+      typeRecords.setdefault( record[1], [] ).append( record )
+    for typeName in typeRecords:
+      records = typeRecords[ typeName ]
+      inTableName = _getTableName( "in", typeName )
+      result = self.insertRecordBundleDirectly( typeName, [ ( record[2], record[3], record[4] ) for record in records ] )
       if not result[ 'OK' ]:
-        self._update( "UPDATE `%s` SET taken=0 WHERE id=%s" % ( _getTableName( "in", typeName ), iD ) )
-        self.log.error( "Can't insert row", result[ 'Message' ] )
+        self.log.error( "Can't insert bundle", result[ 'Message' ] )
+        failedIds = [ str( record[0] ) for record in records ]
+        insertedRecords = []
+      else:
+        failedIds = []
+        for iPos in result[ 'Value' ][ 'Failed' ]:
+          self.log.error( "Can't insert row", result[ 'Value' ][ 'Failed' ][ iPos ] )
+          failedIds.append( str( records[ iPos ][0] ) )
+        insertedRecords = [ records[ iPos ] for iPos in result[ 'Value' ][ 'Successful' ] ]
+      if failedIds:
+        self._update( "UPDATE `%s` SET taken=0 WHERE id in (%s)" % ( inTableName, ", ".join( failedIds ) ) )
+      if not insertedRecords:
         continue
-      result = self._update( "DELETE FROM `%s` WHERE id=%s" % ( _getTableName( "in", typeName ), iD ) )
+      idList = [ str( record[0] ) for record in insertedRecords ]
+      result = self._update( "DELETE FROM `%s` WHERE id in (%s)" % ( inTableName, ", ".join( idList ) ) )
       if not result[ 'OK' ]:
-        self.log.error( "Can't delete row from the IN table", result[ 'Message' ] )
-      gMonitor.addMark( "insertiontime", Time.toEpoch() - insertionEpoch )
+        self.log.error( "Can't delete rows from the IN table", result[ 'Message' ] )
+      now = Time.toEpoch()
+      for record in insertedRecords:
+        gMonitor.addMark( "insertiontime", now - record[5] )
 
 
   def insertRecordDirectly( self, typeName, startTime, endTime, valuesList ):
@@ -651,7 +690,156 @@ class AccountingDB( DB ):
         return retVal
       return self.__commitTransaction( connObj )
     finally:
-      connObj.close()
+      connObj.release()
+
+  def insertRecordBundleDirectly( self, typeName, recordsList, maxRowsPerInsert = 1000 ):
+    """
+    Add a bundle of entries of the same type
+      - recordsList is a list of ( startTime, endTime, valuesList )
+      The buckets are aggregated in memory and written with one multi-row
+      INSERT ... ON DUPLICATE KEY UPDATE, in the same transaction as the records
+      Returns S_OK( { 'Successful' : [ record positions ], 'Failed' : { record position : error } } )
+    """
+    if not typeName in self.dbCatalog:
+      return S_ERROR( "Type %s has not been defined in the db" % typeName )
+    successful = []
+    failed = {}
+    if not recordsList:
+      return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+    self.log.info( "Adding bundle of records", "%s records for type %s" % ( len( recordsList ), typeName ) )
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    valueFields = self.dbCatalog[ typeName ][ 'values' ]
+    numKeys = len( keyFields )
+    numValues = len( valueFields )
+    bucketSchedule = self.getBucketSchedule( typeName )
+    #Local cache of the key ids for this bundle
+    keyIds = {}
+    typeRows = []
+    buckets = {}
+    for iPos in range( len( recordsList ) ):
+      startTime, endTime, valuesList = recordsList[ iPos ]
+      if len( valuesList ) != numKeys + numValues:
+        failed[ iPos ] = "Fields mismatch for record %s. %s fields and %s expected" % ( typeName,
+                                                                                        len( valuesList ),
+                                                                                        numKeys + numValues )
+        continue
+      recordKeys = []
+      for keyPos in range( numKeys ):
+        keyName = keyFields[ keyPos ]
+        cacheKey = ( keyName, valuesList[ keyPos ] )
+        if cacheKey not in keyIds:
+          retVal = self.__addKeyValue( typeName, keyName, valuesList[ keyPos ] )
+          if not retVal[ 'OK' ]:
+            failed[ iPos ] = retVal[ 'Message' ]
+            break
+          keyIds[ cacheKey ] = retVal[ 'Value' ]
+        recordKeys.append( keyIds[ cacheKey ] )
+      if iPos in failed:
+        continue
+      successful.append( iPos )
+      recordKeys = tuple( recordKeys )
+      recordValues = valuesList[ numKeys: ]
+      typeRows.append( recordKeys + tuple( recordValues ) + ( startTime, endTime ) )
+      for bucketStartTime, proportion, bucketLength in bucketSchedule.calculateBuckets( startTime, endTime ):
+        bucketKey = ( bucketStartTime, bucketLength, recordKeys )
+        if bucketKey not in buckets:
+          buckets[ bucketKey ] = [ 0 ] * ( numValues + 1 )
+        bucketValues = buckets[ bucketKey ]
+        for valPos in range( numValues ):
+          bucketValues[ valPos ] += float( recordValues[ valPos ] ) * proportion
+        #HACK: One more value to count total entries
+        bucketValues[ -1 ] += proportion
+    if not typeRows:
+      return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return retVal
+    connObj = retVal[ 'Value' ]
+    try:
+      for i in range( max( 1, self.__deadLockRetries ) ):
+        retVal = self.__insertBundleInTransaction( typeName, typeRows, buckets, maxRowsPerInsert, connObj )
+        #If failed because of dead lock try restarting the whole transaction
+        if retVal[ 'OK' ] or retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+          break
+      if not retVal[ 'OK' ]:
+        return retVal
+    finally:
+      connObj.release()
+    gMonitor.addMark( "registeradded", len( successful ) )
+    gMonitor.addMark( "registeradded:%s" % typeName, len( successful ) )
+    return S_OK( { 'Successful' : successful, 'Failed' : failed } )
+
+  def __insertBundleInTransaction( self, typeName, typeRows, buckets, maxRowsPerInsert, connObj ):
+    """
+    Insert the raw records and add them to the buckets in one transaction,
+    so that a bundle that fails can be inserted again without counting twice
+    """
+    retVal = self.__startTransaction( connObj )
+    if not retVal[ 'OK' ]:
+      return retVal
+    typeFields = self.dbCatalog[ typeName ][ 'typeFields' ]
+    rowSQL = "( %s )" % ", ".join( [ "%s" ] * len( typeFields ) )
+    for iPos in range( 0, len( typeRows ), maxRowsPerInsert ):
+      chunk = typeRows[ iPos : iPos + maxRowsPerInsert ]
+      params = []
+      for row in chunk:
+        params.extend( row )
+      cmd = "INSERT INTO `%s` ( %s ) VALUES %s" % ( _getTableName( "type", typeName ),
+                                                    ", ".join( [ "`%s`" % f for f in typeFields ] ),
+                                                    ", ".join( [ rowSQL ] * len( chunk ) ) )
+      #_update would commit
+      retVal = self._query( cmd, conn = connObj, params = tuple( params ) )
+      if not retVal[ 'OK' ]:
+        self.__rollbackTransaction( connObj )
+        return retVal
+    retVal = self.__upsertBuckets( typeName, buckets, maxRowsPerInsert, connObj = connObj, inTransaction = True )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    retVal = self.__commitTransaction( connObj )
+    if not retVal[ 'OK' ]:
+      self.__rollbackTransaction( connObj )
+      return retVal
+    return S_OK()
+
+  def __upsertBuckets( self, typeName, buckets, maxRowsPerInsert = 1000, connObj = False, inTransaction = False ):
+    """
+    Add values to buckets creating them if needed
+      - buckets is a dict ( bucketStart, bucketLength, ( key ids ) ) -> [ values..., entries ]
+      - inTransaction: the statements are not committed and a dead lock isn't retried,
+        it rolls back the whole transaction
+    """
+    keyFields = self.dbCatalog[ typeName ][ 'keys' ]
+    valueFields = self.dbCatalog[ typeName ][ 'values' ]
+    tableName = _getTableName( "bucket", typeName )
+    bucketFields = [ 'startTime', 'bucketLength' ] + keyFields + valueFields + [ 'entriesInBucket' ]
+    rowSQL = "( %s )" % ", ".join( [ "%s" ] * len( bucketFields ) )
+    updateSQL = ", ".join( [ "`%s`=`%s`+VALUES(`%s`)" % ( f, f, f ) for f in valueFields + [ 'entriesInBucket' ] ] )
+    #Sorted to always lock the rows in the same order
+    bucketKeys = sorted( buckets )
+    for iPos in range( 0, len( bucketKeys ), maxRowsPerInsert ):
+      chunk = bucketKeys[ iPos : iPos + maxRowsPerInsert ]
+      params = []
+      for bucketKey in chunk:
+        bucketStartTime, bucketLength, recordKeys = bucketKey
+        params.extend( ( bucketStartTime, bucketLength ) + tuple( recordKeys ) )
+        params.extend( buckets[ bucketKey ] )
+      cmd = "INSERT INTO `%s` ( %s ) VALUES %s ON DUPLICATE KEY UPDATE %s" % ( tableName,
+                                                                             ", ".join( [ "`%s`" % f for f in bucketFields ] ),
+                                                                             ", ".join( [ rowSQL ] * len( chunk ) ),
+                                                                             updateSQL )
+      if inTransaction:
+        retVal = self._query( cmd, conn = connObj, params = tuple( params ) )
+      else:
+        for i in range( max( 1, self.__deadLockRetries ) ):
+          retVal = self._update( cmd, conn = connObj, params = tuple( params ) )
+          #If failed because of dead lock try restarting
+          if retVal[ 'OK' ] or retVal[ 'Message' ].find( "try restarting transaction" ) == -1:
+            break
+      if not retVal[ 'OK' ]:
+        return retVal
+    return S_OK()
 
   def deleteRecord( self, typeName, startTime, endTime, valuesList ):
     """
@@ -695,37 +883,40 @@ class AccountingDB( DB ):
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
-    retVal = self.__startTransaction( connObj )
-    if not retVal[ 'OK' ]:
-      return retVal
-    retVal = self._query( "SELECT COUNT( startTime ) FROM `%s` WHERE %s" % ( mainTable,
-                                                                             " AND ".join( sqlCond ) ),
-                          conn = connObj )
-    if not retVal[ 'OK' ]:
-      return retVal
-    #Record is not in the db
-    if len( retVal[ 'Value' ] ) == 0:
-      return S_OK( 0 )
-    numInsertions = retVal[ 'Value' ][0][0]
-    if numInsertions == 0:
-      return S_OK( 0 )
-    #Delete from type
-    retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( mainTable, " AND ".join( sqlCond ) ),
-                           conn = connObj )
-    if not retVal[ 'OK' ]:
-      return retVal
-    #Deleted from type, now the buckets
-    #HACK: One more record to split in the buckets to be able to count total entries
-    sqlValues.append( 1 )
-    retVal = self.__deleteFromBuckets( typeName, startTime, endTime, sqlValues, numInsertions, connObj = connObj )
-    if not retVal[ 'OK' ]:
-      self.__rollbackTransaction( connObj )
-      return retVal
-    retVal = self.__commitTransaction( connObj )
-    if not retVal[ 'OK' ]:
-      self.__rollbackTransaction( connObj )
-      return retVal
-    return S_OK( numInsertions )
+    try:
+      retVal = self.__startTransaction( connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+      retVal = self._query( "SELECT COUNT( startTime ) FROM `%s` WHERE %s" % ( mainTable,
+                                                                               " AND ".join( sqlCond ) ),
+                            conn = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+      #Record is not in the db
+      if len( retVal[ 'Value' ] ) == 0:
+        return S_OK( 0 )
+      numInsertions = retVal[ 'Value' ][0][0]
+      if numInsertions == 0:
+        return S_OK( 0 )
+      #Delete from type
+      retVal = self._update( "DELETE FROM `%s` WHERE %s" % ( mainTable, " AND ".join( sqlCond ) ),
+                             conn = connObj )
+      if not retVal[ 'OK' ]:
+        return retVal
+      #Deleted from type, now the buckets
+      #HACK: One more record to split in the buckets to be able to count total entries
+      sqlValues.append( 1 )
+      retVal = self.__deleteFromBuckets( typeName, startTime, endTime, sqlValues, numInsertions, connObj = connObj )
+      if not retVal[ 'OK' ]:
+        self.__rollbackTransaction( connObj )
+        return retVal
+      retVal = self.__commitTransaction( connObj )
+      if not retVal[ 'OK' ]:
+        self.__rollbackTransaction( connObj )
+        return retVal
+      return S_OK( numInsertions )
+    finally:
+      connObj.release()
 
   def __splitInBuckets( self, typeName, startTime, endTime, valuesList, connObj = False ):
     """
@@ -735,42 +926,13 @@ class AccountingDB( DB ):
     buckets = self.calculateBuckets( typeName, startTime, endTime )
     #Separate key values from normal values
     numKeys = len( self.dbCatalog[ typeName ][ 'keys' ] )
-    keyValues = valuesList[ :numKeys ]
+    keyValues = tuple( valuesList[ :numKeys ] )
     valuesList = valuesList[ numKeys: ]
     self.log.verbose( "Splitting entry", " in %s buckets" % len( buckets ) )
-    for bucketInfo in buckets:
-      bucketStartTime = bucketInfo[0]
-      bucketProportion = bucketInfo[1]
-      bucketLength = bucketInfo[2]
-      #INSERT!
-      retVal = self.__insertBucket( typeName,
-                                    bucketStartTime,
-                                    bucketLength,
-                                    keyValues,
-                                    valuesList, bucketProportion, connObj = connObj )
-      #If OK insert is successful
-      if retVal[ 'OK' ]:
-        continue
-      #if not OK and NOT duplicate keys error then real error
-      if retVal[ 'Message' ].find( 'Duplicate entry' ) == -1:
-        return retVal
-      #Duplicate keys!!. If that's the case..
-      #Update!
-      for i in range( max( 1, self.__deadLockRetries ) ):
-        retVal = self.__updateBucket( typeName,
-                                      bucketStartTime,
-                                      bucketLength,
-                                      keyValues,
-                                      valuesList, bucketProportion, connObj = connObj )
-        if not retVal[ 'OK' ]:
-          #If failed because of dead lock try restarting
-          if retVal[ 'Message' ].find( "try restarting transaction" ):
-            continue
-          return retVal
-        #If OK, break loop
-        if retVal[ 'OK' ]:
-          break
-    return S_OK()
+    bucketsValues = {}
+    for bucketStartTime, bucketProportion, bucketLength in buckets:
+      bucketsValues[ ( bucketStartTime, bucketLength, keyValues ) ] = [ float( value ) * bucketProportion for value in valuesList ]
+    return self.__upsertBuckets( typeName, bucketsValues, connObj = connObj )
 
   def __deleteFromBuckets( self, typeName, startTime, endTime, valuesList, numInsertions, connObj = False ):
     """
@@ -864,47 +1026,6 @@ class AccountingDB( DB ):
     cmd += self.__generateSQLConditionForKeys( typeName, keyValues )
     return self._update( cmd, conn = connObj )
 
-  def __updateBucket( self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj = False ):
-    """
-    Update a bucket when coming from the raw insert
-    """
-    tableName = _getTableName( "bucket", typeName )
-    cmd = "UPDATE `%s` SET " % tableName
-    sqlValList = []
-    for pos in range( len( self.dbCatalog[ typeName ][ 'values' ] ) ):
-      valueField = self.dbCatalog[ typeName ][ 'values' ][ pos ]
-      value = bucketValues[ pos ]
-      fullFieldName = "`%s`.`%s`" % ( tableName, valueField )
-      sqlValList.append( "%s=%s+(%s*%s)" % ( fullFieldName, fullFieldName, value, proportion ) )
-    sqlValList.append( "`%s`.`entriesInBucket`=`%s`.`entriesInBucket`+(%s*%s)" % ( tableName,
-                                                                                    tableName,
-                                                                                    bucketValues[-1],
-                                                                                    proportion ) )
-    cmd += ", ".join( sqlValList )
-    cmd += " WHERE `%s`.`startTime`='%s' AND `%s`.`bucketLength`='%s' AND " % ( 
-                                                                            tableName,
-                                                                            startTime,
-                                                                            tableName,
-                                                                            bucketLength )
-    cmd += self.__generateSQLConditionForKeys( typeName, keyValues )
-    return self._update( cmd, conn = connObj )
-
-  def __insertBucket( self, typeName, startTime, bucketLength, keyValues, bucketValues, proportion, connObj = False ):
-    """
-    Insert a bucket when coming from the raw insert
-    """
-    sqlFields = [ '`startTime`', '`bucketLength`', '`entriesInBucket`' ]
-    sqlValues = [ startTime, bucketLength, "(%s*%s)" % ( bucketValues[-1], proportion )]
-    for keyPos in range( len( self.dbCatalog[ typeName ][ 'keys' ] ) ):
-      sqlFields.append( "`%s`" % self.dbCatalog[ typeName ][ 'keys' ][ keyPos ] )
-      sqlValues.append( keyValues[ keyPos ] )
-    for valPos in range( len( self.dbCatalog[ typeName ][ 'values' ] ) ):
-      sqlFields.append( "`%s`" % self.dbCatalog[ typeName ][ 'values' ][ valPos ] )
-      sqlValues.append( "(%s*%s)" % ( bucketValues[ valPos ], proportion ) )
-    cmd = "INSERT INTO `%s` ( %s ) " % ( _getTableName( "bucket", typeName ), ", ".join( sqlFields ) )
-    cmd += "VALUES ( %s )" % ", ".join( [ str( val ) for val in sqlValues ] )
-    return self._update( cmd, conn = connObj )
-
   def __checkFieldsExistsInType( self, typeName, fields, tableType ):
     """
     Check wether a list of fields exist for a given typeName
@@ -1148,42 +1269,44 @@ class AccountingDB( DB ):
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
-    #retVal = self.__startTransaction( connObj )
-    #if not retVal[ 'OK' ]:
-    #  return retVal
-    for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
-      self.log.info( "[COMPACT] Query %d of %d" % ( bPos + 1, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-      secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
-      bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
-      timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
-      nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
-      self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s" % ( Time.fromEpoch( timeLimit ), bucketLength ) )
-      #Retrieve the data
-      retVal = self.__selectForCompactBuckets( typeName, timeLimit, bucketLength, nextBucketLength, connObj )
-      if not retVal[ 'OK' ]:
-        #self.__rollbackTransaction( connObj )
-        return retVal
-      bucketsData = retVal[ 'Value' ]
-      self.log.info( "[COMPACT] Got %d records to compact" % len( bucketsData ) )
-      if len( bucketsData ) == 0:
-        continue
-      retVal = self.__deleteForCompactBuckets( typeName, timeLimit, bucketLength, connObj )
-      if not retVal[ 'OK' ]:
-        #self.__rollbackTransaction( connObj )
-        return retVal
-      self.log.info( "[COMPACT] Compacting %s records %s seconds size for %s" % ( len( bucketsData ), bucketLength, typeName ) )
-      #Add data
-      for record in bucketsData:
-        startTime = record[-2]
-        endTime = record[-1]
-        valuesList = record[:-2]
-        retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj )
+    try:
+      #retVal = self.__startTransaction( connObj )
+      #if not retVal[ 'OK' ]:
+      #  return retVal
+      for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
+        self.log.info( "[COMPACT] Query %d of %d" % ( bPos + 1, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
+        secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
+        bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
+        timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
+        nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
+        self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s" % ( Time.fromEpoch( timeLimit ), bucketLength ) )
+        #Retrieve the data
+        retVal = self.__selectForCompactBuckets( typeName, timeLimit, bucketLength, nextBucketLength, connObj )
         if not retVal[ 'OK' ]:
           #self.__rollbackTransaction( connObj )
-          self.log.error( "[COMPACT] Error while compacting data for record in %s: %s" % ( typeName, retVal[ 'Value' ] ) )
-      self.log.info( "[COMPACT] Finished compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-    #return self.__commitTransaction( connObj )
-    connObj.close()
+          return retVal
+        bucketsData = retVal[ 'Value' ]
+        self.log.info( "[COMPACT] Got %d records to compact" % len( bucketsData ) )
+        if len( bucketsData ) == 0:
+          continue
+        retVal = self.__deleteForCompactBuckets( typeName, timeLimit, bucketLength, connObj )
+        if not retVal[ 'OK' ]:
+          #self.__rollbackTransaction( connObj )
+          return retVal
+        self.log.info( "[COMPACT] Compacting %s records %s seconds size for %s" % ( len( bucketsData ), bucketLength, typeName ) )
+        #Add data
+        for record in bucketsData:
+          startTime = record[-2]
+          endTime = record[-1]
+          valuesList = record[:-2]
+          retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj )
+          if not retVal[ 'OK' ]:
+            #self.__rollbackTransaction( connObj )
+            self.log.error( "[COMPACT] Error while compacting data for record in %s: %s" % ( typeName, retVal[ 'Value' ] ) )
+        self.log.info( "[COMPACT] Finished compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
+      #return self.__commitTransaction( connObj )
+    finally:
+      connObj.release()
     return S_OK()
 
   def __slowCompactBucketsForType( self, typeName ):
@@ -1195,58 +1318,60 @@ class AccountingDB( DB ):
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
-    for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
-      self.log.info( "[COMPACT] Query %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-      secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
-      bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
-      timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
-      nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
-      self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s for %s" % ( Time.fromEpoch( timeLimit ), bucketLength, typeName ) )
-      querySize = 10000
-      previousRecordsSelected = querySize
-      totalCompacted = 0
-      while previousRecordsSelected == querySize:
-        #Retrieve the data
-        self.log.info( "[COMPACT] Retrieving buckets to compact newer that %s with size %s" % ( Time.fromEpoch( timeLimit ),
-                                                                                                       bucketLength ) )
-        roundStartTime = time.time()
-        result = self.__selectIndividualForCompactBuckets( typeName, timeLimit, bucketLength,
-                                                           nextBucketLength, querySize, connObj )
-        if not result[ 'OK' ]:
-          #self.__rollbackTransaction( connObj )
-          return result
-        bucketsData = result[ 'Value' ]
-        previousRecordsSelected = len( bucketsData )
-        selectEndTime = time.time()
-        self.log.info( "[COMPACT] Got %d buckets (%d done) (took %.2f secs)" % ( previousRecordsSelected,
-                                                                                 totalCompacted,
-                                                                                 selectEndTime - roundStartTime ) )
-        if len( bucketsData ) == 0:
-          break
-
-        result = self.__deleteIndividualForCompactBuckets( typeName, bucketsData, connObj )
-        if not result[ 'OK' ]:
-          #self.__rollbackTransaction( connObj )
-          return result
-        bucketsData = result[ 'Value' ]
-        deleteEndTime = time.time()
-        self.log.info( "[COMPACT] Deleted %s out-of-bounds buckets (took %.2f secs)" % ( len( bucketsData ),
-                                                                                         deleteEndTime - selectEndTime ) )
-        #Add data
-        for record in bucketsData:
-          startTime = record[-2]
-          endTime = record[-2] + record[-1]
-          valuesList = record[:-2]
-          retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj )
-          if not retVal[ 'OK' ]:
-            self.log.error( "[COMPACT] Error while compacting data for buckets in %s: %s" % ( typeName, retVal[ 'Value' ] ) )
-        totalCompacted += len( bucketsData )
-        insertElapsedTime = time.time() - deleteEndTime
-        self.log.info( "[COMPACT] Records compacted (took %.2f secs, %.2f secs/bucket)" % ( insertElapsedTime,
-                                                                                            insertElapsedTime / len( bucketsData ) ) )
-      self.log.info( "[COMPACT] Finised compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
-    #return self.__commitTransaction( connObj )
-    connObj.close()
+    try:
+      for bPos in range( len( self.dbBucketsLength[ typeName ] ) - 1 ):
+        self.log.info( "[COMPACT] Query %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
+        secondsLimit = self.dbBucketsLength[ typeName ][ bPos ][0]
+        bucketLength = self.dbBucketsLength[ typeName ][ bPos ][1]
+        timeLimit = ( nowEpoch - nowEpoch % bucketLength ) - secondsLimit
+        nextBucketLength = self.dbBucketsLength[ typeName ][ bPos + 1 ][1]
+        self.log.info( "[COMPACT] Compacting data newer that %s with bucket size %s for %s" % ( Time.fromEpoch( timeLimit ), bucketLength, typeName ) )
+        querySize = 10000
+        previousRecordsSelected = querySize
+        totalCompacted = 0
+        while previousRecordsSelected == querySize:
+          #Retrieve the data
+          self.log.info( "[COMPACT] Retrieving buckets to compact newer that %s with size %s" % ( Time.fromEpoch( timeLimit ),
+                                                                                                         bucketLength ) )
+          roundStartTime = time.time()
+          result = self.__selectIndividualForCompactBuckets( typeName, timeLimit, bucketLength,
+                                                             nextBucketLength, querySize, connObj )
+          if not result[ 'OK' ]:
+            #self.__rollbackTransaction( connObj )
+            return result
+          bucketsData = result[ 'Value' ]
+          previousRecordsSelected = len( bucketsData )
+          selectEndTime = time.time()
+          self.log.info( "[COMPACT] Got %d buckets (%d done) (took %.2f secs)" % ( previousRecordsSelected,
+                                                                                   totalCompacted,
+                                                                                   selectEndTime - roundStartTime ) )
+          if len( bucketsData ) == 0:
+            break
+
+          result = self.__deleteIndividualForCompactBuckets( typeName, bucketsData, connObj )
+          if not result[ 'OK' ]:
+            #self.__rollbackTransaction( connObj )
+            return result
+          bucketsData = result[ 'Value' ]
+          deleteEndTime = time.time()
+          self.log.info( "[COMPACT] Deleted %s out-of-bounds buckets (took %.2f secs)" % ( len( bucketsData ),
+                                                                                           deleteEndTime - selectEndTime ) )
+          #Add data
+          for record in bucketsData:
+            startTime = record[-2]
+            endTime = record[-2] + record[-1]
+            valuesList = record[:-2]
+            retVal = self.__splitInBuckets( typeName, startTime, endTime, valuesList, connObj )
+            if not retVal[ 'OK' ]:
+              self.log.error( "[COMPACT] Error while compacting data for buckets in %s: %s" % ( typeName, retVal[ 'Value' ] ) )
+          totalCompacted += len( bucketsData )
+          insertElapsedTime = time.time() - deleteEndTime
+          self.log.info( "[COMPACT] Records compacted (took %.2f secs, %.2f secs/bucket)" % ( insertElapsedTime,
+                                                                                              insertElapsedTime / len( bucketsData ) ) )
+        self.log.info( "[COMPACT] Finised compaction %d of %d" % ( bPos, len( self.dbBucketsLength[ typeName ] ) - 1 ) )
+      #return self.__commitTransaction( connObj )
+    finally:
+      connObj.release()
     return S_OK()
 
   def __selectIndividualForCompactBuckets( self, typeName, timeLimit, bucketLength, nextBucketLength, querySize, connObj = False ):
@@ -1322,115 +1447,117 @@ class AccountingDB( DB ):
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
-    rawTableName = _getTableName( "type", typeName )
-    #retVal = self.__startTransaction( connObj )
-    #if not retVal[ 'OK' ]:
-    #  return retVal
-    self.log.info( "[REBUCKET] Deleting buckets for %s" % typeName )
-    retVal = self._update( "DELETE FROM `%s`" % _getTableName( "bucket", typeName ),
-                           conn = connObj )
-    if not retVal[ 'OK' ]:
-      return retVal
-    #Generate the common part of the query
-    #SELECT fields
-    startTimeTableField = "`%s`.startTime" % rawTableName
-    endTimeTableField = "`%s`.endTime" % rawTableName
-    #Select strings and sum select strings
-    sqlSUMSelectList = []
-    sqlSelectList = []
-    for field in self.dbCatalog[ typeName ][ 'keys' ]:
-      sqlSUMSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
-      sqlSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
-    for field in self.dbCatalog[ typeName ][ 'values' ]:
-      sqlSUMSelectList.append( "SUM( `%s`.`%s` )" % ( rawTableName, field ) )
-      sqlSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
-    sumSelectString = ", ".join( sqlSUMSelectList )
-    selectString = ", ".join( sqlSelectList )
-    #Grouping fields
-    sqlGroupList = []
-    for field in self.dbCatalog[ typeName ][ 'keys' ]:
-      sqlGroupList.append( "`%s`.`%s`" % ( rawTableName, field ) )
-    groupingString = ", ".join( sqlGroupList )
-    #List to contain all queries
-    sqlQueries = []
-    dateInclusiveConditions = []
-    countedField = "`%s`.`%s`" % ( rawTableName, self.dbCatalog[ typeName ][ 'keys' ][0] )
-    lastTime = Time.toEpoch()
-    #Iterate for all ranges
-    for iRange in range( len( self.dbBucketsLength[ typeName ] ) ):
-      bucketTimeSpan = self.dbBucketsLength[ typeName ][iRange][0]
-      bucketLength = self.dbBucketsLength[ typeName ][iRange][1]
-      startRangeTime = lastTime - bucketTimeSpan
-      endRangeTime = lastTime
-      lastTime -= bucketTimeSpan
-      bucketizedStart = _bucketizeDataField( startTimeTableField, bucketLength )
-      bucketizedEnd = _bucketizeDataField( endTimeTableField, bucketLength )
-
-      timeSelectString = "MIN(%s), MAX(%s)" % ( startTimeTableField,
-                                                endTimeTableField )
-      #Is the last bucket?
-      if iRange == len( self.dbBucketsLength[ typeName ] ) - 1:
-        whereString = "%s <= %d" % ( endTimeTableField,
-                                     endRangeTime )
-      else:
-        whereString = "%s > %d AND %s <= %d" % ( startTimeTableField,
-                                                  startRangeTime,
-                                                  endTimeTableField,
-                                                  endRangeTime )
-      sameBucketCondition = "(%s) = (%s)" % ( bucketizedStart, bucketizedEnd )
-      #Records that fit in a bucket
-      sqlQuery = "SELECT %s, %s, COUNT(%s) FROM `%s` WHERE %s AND %s GROUP BY %s, %s" % ( timeSelectString,
-                                                                               sumSelectString,
-                                                                               countedField,
-                                                                               rawTableName,
-                                                                               whereString,
-                                                                               sameBucketCondition,
-                                                                               groupingString,
-                                                                               bucketizedStart )
-      sqlQueries.append( sqlQuery )
-      #Records that fit in more than one bucket
-      sqlQuery = "SELECT %s, %s, %s, 1 FROM `%s` WHERE %s AND NOT %s" % ( startTimeTableField,
-                                                                          endTimeTableField,
-                                                                          selectString,
-                                                                          rawTableName,
-                                                                          whereString,
-                                                                          sameBucketCondition
-                                                                        )
-      sqlQueries.append( sqlQuery )
-      dateInclusiveConditions.append( "( %s )" % whereString )
-    #Query for records that are in between two ranges
-    sqlQuery = "SELECT %s, %s, %s, 1 FROM `%s` WHERE NOT %s" % ( startTimeTableField,
-                                                       endTimeTableField,
-                                                       selectString,
-                                                       rawTableName,
-                                                       " AND NOT ".join( dateInclusiveConditions ) )
-    sqlQueries.append( sqlQuery )
-    self.log.info( "[REBUCKET] Retrieving data for rebuilding buckets for type %s..." % ( typeName ) )
-    queryNum = 0
-    for sqlQuery in sqlQueries:
-      self.log.info( "[REBUCKET] Executing query #%s..." % queryNum )
-      queryNum += 1
-      retVal = self._query( sqlQuery, conn = connObj )
+    try:
+      rawTableName = _getTableName( "type", typeName )
+      #retVal = self.__startTransaction( connObj )
+      #if not retVal[ 'OK' ]:
+      #  return retVal
+      self.log.info( "[REBUCKET] Deleting buckets for %s" % typeName )
+      retVal = self._update( "DELETE FROM `%s`" % _getTableName( "bucket", typeName ),
+                             conn = connObj )
       if not retVal[ 'OK' ]:
-        self.log.error( "[REBUCKET] Can't retrieve data for rebucketing", retVal[ 'Message' ] )
-        #self.__rollbackTransaction( connObj )
         return retVal
-      rawData = retVal[ 'Value' ]
-      self.log.info( "[REBUCKET] Retrieved %s records" % len( rawData ) )
-      rebucketedRecords = 0
-      for entry in rawData:
-        startT = entry[0]
-        endT = entry[1]
-        values = entry[2:]
-        retVal = self.__splitInBuckets( typeName, startT, endT, values, connObj = connObj )
+      #Generate the common part of the query
+      #SELECT fields
+      startTimeTableField = "`%s`.startTime" % rawTableName
+      endTimeTableField = "`%s`.endTime" % rawTableName
+      #Select strings and sum select strings
+      sqlSUMSelectList = []
+      sqlSelectList = []
+      for field in self.dbCatalog[ typeName ][ 'keys' ]:
+        sqlSUMSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
+        sqlSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
+      for field in self.dbCatalog[ typeName ][ 'values' ]:
+        sqlSUMSelectList.append( "SUM( `%s`.`%s` )" % ( rawTableName, field ) )
+        sqlSelectList.append( "`%s`.`%s`" % ( rawTableName, field ) )
+      sumSelectString = ", ".join( sqlSUMSelectList )
+      selectString = ", ".join( sqlSelectList )
+      #Grouping fields
+      sqlGroupList = []
+      for field in self.dbCatalog[ typeName ][ 'keys' ]:
+        sqlGroupList.append( "`%s`.`%s`" % ( rawTableName, field ) )
+      groupingString = ", ".join( sqlGroupList )
+      #List to contain all queries
+      sqlQueries = []
+      dateInclusiveConditions = []
+      countedField = "`%s`.`%s`" % ( rawTableName, self.dbCatalog[ typeName ][ 'keys' ][0] )
+      lastTime = Time.toEpoch()
+      #Iterate for all ranges
+      for iRange in range( len( self.dbBucketsLength[ typeName ] ) ):
+        bucketTimeSpan = self.dbBucketsLength[ typeName ][iRange][0]
+        bucketLength = self.dbBucketsLength[ typeName ][iRange][1]
+        startRangeTime = lastTime - bucketTimeSpan
+        endRangeTime = lastTime
+        lastTime -= bucketTimeSpan
+        bucketizedStart = _bucketizeDataField( startTimeTableField, bucketLength )
+        bucketizedEnd = _bucketizeDataField( endTimeTableField, bucketLength )
+
+        timeSelectString = "MIN(%s), MAX(%s)" % ( startTimeTableField,
+                                                  endTimeTableField )
+        #Is the last bucket?
+        if iRange == len( self.dbBucketsLength[ typeName ] ) - 1:
+          whereString = "%s <= %d" % ( endTimeTableField,
+                                       endRangeTime )
+        else:
+          whereString = "%s > %d AND %s <= %d" % ( startTimeTableField,
+                                                    startRangeTime,
+                                                    endTimeTableField,
+                                                    endRangeTime )
+        sameBucketCondition = "(%s) = (%s)" % ( bucketizedStart, bucketizedEnd )
+        #Records that fit in a bucket
+        sqlQuery = "SELECT %s, %s, COUNT(%s) FROM `%s` WHERE %s AND %s GROUP BY %s, %s" % ( timeSelectString,
+                                                                                 sumSelectString,
+                                                                                 countedField,
+                                                                                 rawTableName,
+                                                                                 whereString,
+                                                                                 sameBucketCondition,
+                                                                                 groupingString,
+                                                                                 bucketizedStart )
+        sqlQueries.append( sqlQuery )
+        #Records that fit in more than one bucket
+        sqlQuery = "SELECT %s, %s, %s, 1 FROM `%s` WHERE %s AND NOT %s" % ( startTimeTableField,
+                                                                            endTimeTableField,
+                                                                            selectString,
+                                                                            rawTableName,
+                                                                            whereString,
+                                                                            sameBucketCondition
+                                                                          )
+        sqlQueries.append( sqlQuery )
+        dateInclusiveConditions.append( "( %s )" % whereString )
+      #Query for records that are in between two ranges
+      sqlQuery = "SELECT %s, %s, %s, 1 FROM `%s` WHERE NOT %s" % ( startTimeTableField,
+                                                         endTimeTableField,
+                                                         selectString,
+                                                         rawTableName,
+                                                         " AND NOT ".join( dateInclusiveConditions ) )
+      sqlQueries.append( sqlQuery )
+      self.log.info( "[REBUCKET] Retrieving data for rebuilding buckets for type %s..." % ( typeName ) )
+      queryNum = 0
+      for sqlQuery in sqlQueries:
+        self.log.info( "[REBUCKET] Executing query #%s..." % queryNum )
+        queryNum += 1
+        retVal = self._query( sqlQuery, conn = connObj )
         if not retVal[ 'OK' ]:
+          self.log.error( "[REBUCKET] Can't retrieve data for rebucketing", retVal[ 'Message' ] )
           #self.__rollbackTransaction( connObj )
           return retVal
-        rebucketedRecords += 1
-        if rebucketedRecords % 1000 == 0:
-          self.log.info( "[REBUCKET] Rebucketed %s records..." % rebucketedRecords )
-    #return self.__commitTransaction( connObj )
-    connObj.close()
+        rawData = retVal[ 'Value' ]
+        self.log.info( "[REBUCKET] Retrieved %s records" % len( rawData ) )
+        rebucketedRecords = 0
+        for entry in rawData:
+          startT = entry[0]
+          endT = entry[1]
+          values = entry[2:]
+          retVal = self.__splitInBuckets( typeName, startT, endT, values, connObj = connObj )
+          if not retVal[ 'OK' ]:
+            #self.__rollbackTransaction( connObj )
+            return retVal
+          rebucketedRecords += 1
+          if rebucketedRecords % 1000 == 0:
+            self.log.info( "[REBUCKET] Rebucketed %s records..." % rebucketedRecords )
+      #return self.__commitTransaction( connObj )
+    finally:
+      connObj.release()
     return S_OK()
 
 
@@ -0,0 +1,98 @@
+# $HeadURL$
+""" Closed form splitting of accounting records in buckets
+
+    The length of the buckets depends on how old they are. For a given moment
+    "now" the bucket schedule is piecewise constant in time, so instead of
+    evaluating the length bucket by bucket the splitter jumps between the
+    points where the length changes and generates whole runs of buckets of
+    the same length at once (with NumPy if it is available).
+"""
+__RCSID__ = "$Id$"
+
+import bisect
+
+try:
+  import numpy
+except ImportError:
+  numpy = False
+
+#Runs with less buckets than this are generated in plain python
+NUMPY_MIN_BUCKETS = 32
+
+class BucketSchedule:
+
+  def __init__( self, bucketsLength, nowEpoch, maxBucketTime = 604800, useNumPy = True ):
+    """
+    Prepare the schedule
+      - bucketsLength is the list of ( timeRange, bucketLength ) of the type
+      - nowEpoch is the moment used to decide how old a bucket is
+    """
+    self.__maxBucketTime = maxBucketTime
+    #A moment gets the length of the first level whose threshold it reaches
+    self.__levels = [ ( nowEpoch - nowEpoch % bucketLength - timeRange, bucketLength ) for timeRange, bucketLength in bucketsLength ]
+    #The length can only change at the thresholds
+    self.__breakPoints = sorted( set( [ level[0] for level in self.__levels ] ) )
+    self.__useNumPy = useNumPy and numpy
+
+  def getBucketLength( self, when ):
+    """
+    Get the length of the bucket for a moment in time
+    """
+    for threshold, bucketLength in self.__levels:
+      if when >= threshold:
+        return bucketLength
+    return self.__maxBucketTime
+
+  def __getNextBreakPoint( self, when ):
+    pos = bisect.bisect_right( self.__breakPoints, when )
+    if pos < len( self.__breakPoints ):
+      return self.__breakPoints[ pos ]
+    return False
+
+  def calculateBuckets( self, startTime, endTime ):
+    """
+    Calculate the buckets between two times and the proportional part for each bucket
+      Returns a list of ( bucketStart, proportion, bucketLength )
+    """
+    bucketLength = self.getBucketLength( startTime )
+    currentBucketStart = startTime - startTime % bucketLength
+    if startTime == endTime:
+      return [ ( currentBucketStart, 1, bucketLength ) ]
+    #Runs of ( first bucket start, number of buckets, bucket length )
+    runs = [ ( currentBucketStart, 1, bucketLength ) ]
+    currentBucketStart += bucketLength
+    while currentBucketStart < endTime:
+      bucketLength = self.getBucketLength( currentBucketStart )
+      runEnd = endTime
+      nextBreakPoint = self.__getNextBreakPoint( currentBucketStart )
+      if nextBreakPoint is not False and nextBreakPoint < runEnd:
+        runEnd = nextBreakPoint
+      numBuckets = ( runEnd - currentBucketStart + bucketLength - 1 ) // bucketLength
+      runs.append( ( currentBucketStart, numBuckets, bucketLength ) )
+      currentBucketStart += numBuckets * bucketLength
+    return self.__expandRuns( runs, startTime, endTime )
+
+  def calculateBucketsForRecords( self, timesList ):
+    """
+    Calculate the buckets for a list of ( startTime, endTime )
+      Returns a list with the buckets of each record
+    """
+    return [ self.calculateBuckets( startTime, endTime ) for startTime, endTime in timesList ]
+
+  def __expandRuns( self, runs, startTime, endTime ):
+    totalLength = endTime - startTime
+    buckets = []
+    for runStart, numBuckets, bucketLength in runs:
+      if self.__useNumPy and numBuckets >= NUMPY_MIN_BUCKETS:
+        starts = runStart + numpy.arange( numBuckets, dtype = numpy.int64 ) * bucketLength
+        ends = numpy.minimum( starts + bucketLength, endTime )
+        begins = numpy.maximum( starts, startTime )
+        proportions = ( ends - begins ).astype( numpy.float64 ) / totalLength
+        buckets.extend( zip( starts.tolist(), proportions.tolist(), [ bucketLength ] * numBuckets ) )
+        continue
+      for iBucket in range( numBuckets ):
+        bucketStart = runStart + iBucket * bucketLength
+        start = max( bucketStart, startTime )
+        end = min( bucketStart + bucketLength, endTime )
+        buckets.append( ( bucketStart, float( end - start ) / totalLength, bucketLength ) )
+    return buckets
@@ -40,7 +40,10 @@ class DBUtils:
     if not retVal[ 'OK' ]:
       return retVal
     connObj = retVal[ 'Value' ]
-    return self._acDB.retrieveBucketedData( typeName, startTime, endTime, selectFields, condDict, groupFields, orderFields, connObj = connObj )
+    try:
+      return self._acDB.retrieveBucketedData( typeName, startTime, endTime, selectFields, condDict, groupFields, orderFields, connObj = connObj )
+    finally:
+      connObj.release()
 
   def _getUniqueValues( self, typeName, startTime, endTime, condDict, fieldList ):
     stringList = [ "%s" for field in fieldList ]
@@ -274,7 +277,10 @@ class DBUtils:
       return retVal
     connObj = retVal[ 'Value' ]
     typeName = "%s_%s" % ( self._setup, typeName )
-    return self._acDB.getKeyValues( typeName, condDict, connObj )
+    try:
+      return self._acDB.getKeyValues( typeName, condDict, connObj )
+    finally:
+      connObj.release()
 
   def _calculateProportionalGauges( self, dataDict ):
     """
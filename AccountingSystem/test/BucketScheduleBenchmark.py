@@ -0,0 +1,65 @@
+########################################################################
+# $HeadURL $
+# File: BucketScheduleBenchmark.py
+########################################################################
+
+""" Micro-benchmark of the splitting of accounting records in buckets
+
+    Compares the bucket by bucket splitting originally done by AccountingDB
+    with the closed form BucketSchedule, with and without NumPy.
+
+    python BucketScheduleBenchmark.py [ numRecords ]
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+import random
+from DIRAC.AccountingSystem.private.BucketSchedule import BucketSchedule, numpy
+from DIRAC.AccountingSystem.test.BucketScheduleTestCase import legacyCalculateBuckets, BUCKETS_LENGTH, MAX_BUCKET_TIME
+
+def generateRecords( nowEpoch, numRecords, maxAge, maxLength ):
+  rand = random.Random( 1 )
+  records = []
+  for i in range( numRecords ):
+    startTime = nowEpoch - rand.randint( 0, maxAge )
+    records.append( ( startTime, startTime + rand.randint( 0, maxLength ) ) )
+  return records
+
+def timeIt( function, records ):
+  start = time.time()
+  numBuckets = 0
+  for startTime, endTime in records:
+    numBuckets += len( function( startTime, endTime ) )
+  return time.time() - start, numBuckets
+
+def main( numRecords ):
+  nowEpoch = int( time.time() )
+  scenarios = ( ( "recent short jobs", 2 * 86400, 4 * 3600 ),
+                ( "recent long jobs", 2 * 86400, 3 * 86400 ),
+                ( "old long jobs", 200 * 86400, 30 * 86400 ),
+                ( "spanning all levels", 400 * 86400, 400 * 86400 ) )
+  candidates = [ ( "legacy", lambda s, e: legacyCalculateBuckets( BUCKETS_LENGTH, s, e, nowEpoch ) ) ]
+  schedule = BucketSchedule( BUCKETS_LENGTH, nowEpoch, MAX_BUCKET_TIME, useNumPy = False )
+  candidates.append( ( "closed form", schedule.calculateBuckets ) )
+  if numpy:
+    schedule = BucketSchedule( BUCKETS_LENGTH, nowEpoch, MAX_BUCKET_TIME )
+    candidates.append( ( "closed form + numpy", schedule.calculateBuckets ) )
+  else:
+    print "NumPy is not available"
+  for scenario, maxAge, maxLength in scenarios:
+    records = generateRecords( nowEpoch, numRecords, maxAge, maxLength )
+    print "%s (%s records)" % ( scenario, numRecords )
+    reference = False
+    for name, function in candidates:
+      elapsed, numBuckets = timeIt( function, records )
+      if not reference:
+        reference = elapsed
+      print "  %-22s %8.3f s %10d buckets %6.2fx" % ( name, elapsed, numBuckets, reference / max( elapsed, 0.000001 ) )
+
+if __name__ == "__main__":
+  numRecords = 2000
+  if len( sys.argv ) > 1:
+    numRecords = int( sys.argv[1] )
+  main( numRecords )
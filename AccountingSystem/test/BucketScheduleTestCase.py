@@ -0,0 +1,100 @@
+########################################################################
+# $HeadURL $
+# File: BucketScheduleTestCase.py
+########################################################################
+
+""".. module:: BucketScheduleTestCase
+
+Test cases for DIRAC.AccountingSystem.private.BucketSchedule module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC.AccountingSystem.private.BucketSchedule import BucketSchedule
+import random
+import unittest
+
+BUCKETS_LENGTH = [ ( 86400, 900 ), ( 604800, 3600 ), ( 15552000, 86400 ), ( 31104000, 604800 ) ]
+MAX_BUCKET_TIME = 604800
+
+def legacyCalculateBuckets( bucketsLength, startTime, endTime, nowEpoch, maxBucketTime = MAX_BUCKET_TIME ):
+  """ bucket by bucket splitting as done originally by AccountingDB """
+  def bucketLengthForTime( when ):
+    for granuT in bucketsLength:
+      nowBucketed = nowEpoch - nowEpoch % granuT[1]
+      dif = max( 0, nowBucketed - when )
+      if dif <= granuT[0]:
+        return granuT[1]
+    return maxBucketTime
+  bucketTimeLength = bucketLengthForTime( startTime )
+  currentBucketStart = startTime - startTime % bucketTimeLength
+  if startTime == endTime:
+    return [ ( currentBucketStart, 1, bucketTimeLength ) ]
+  buckets = []
+  totalLength = endTime - startTime
+  while currentBucketStart < endTime:
+    start = max( currentBucketStart, startTime )
+    end = min( currentBucketStart + bucketTimeLength, endTime )
+    proportion = float( end - start ) / totalLength
+    buckets.append( ( currentBucketStart, proportion, bucketTimeLength ) )
+    currentBucketStart += bucketTimeLength
+    bucketTimeLength = bucketLengthForTime( currentBucketStart )
+  return buckets
+
+########################################################################
+class BucketScheduleTestCase( unittest.TestCase ):
+  """py:class BucketScheduleTestCase
+  Test case for DIRAC.AccountingSystem.private.BucketSchedule module.
+  """
+
+  def setUp( self ):
+    self.nowEpoch = 1300000000
+    self.random = random.Random( 1234 )
+
+  def __check( self, startTime, endTime, useNumPy = True ):
+    schedule = BucketSchedule( BUCKETS_LENGTH, self.nowEpoch, MAX_BUCKET_TIME, useNumPy = useNumPy )
+    self.assertEqual( schedule.calculateBuckets( startTime, endTime ),
+                      legacyCalculateBuckets( BUCKETS_LENGTH, startTime, endTime, self.nowEpoch ) )
+
+  def testBucketLength( self ):
+    """ bucket length for a moment """
+    schedule = BucketSchedule( BUCKETS_LENGTH, self.nowEpoch, MAX_BUCKET_TIME )
+    self.assertEqual( schedule.getBucketLength( self.nowEpoch ), 900 )
+    self.assertEqual( schedule.getBucketLength( self.nowEpoch - 2 * 86400 ), 3600 )
+    self.assertEqual( schedule.getBucketLength( self.nowEpoch - 30 * 86400 ), 86400 )
+    self.assertEqual( schedule.getBucketLength( self.nowEpoch - 300 * 86400 ), 604800 )
+    self.assertEqual( schedule.getBucketLength( self.nowEpoch - 1000 * 86400 ), MAX_BUCKET_TIME )
+
+  def testSimple( self ):
+    """ single moment and short records """
+    self.__check( self.nowEpoch - 100, self.nowEpoch - 100 )
+    self.__check( self.nowEpoch - 1000, self.nowEpoch - 100 )
+    self.__check( self.nowEpoch - 86400 * 3, self.nowEpoch - 86400 * 3 + 7200 )
+
+  def testAcrossLevels( self ):
+    """ records spanning several bucket lengths, with and without numpy """
+    self.__check( self.nowEpoch - 400 * 86400, self.nowEpoch )
+    self.__check( self.nowEpoch - 400 * 86400, self.nowEpoch, useNumPy = False )
+    self.__check( self.nowEpoch - 8 * 86400 + 17, self.nowEpoch + 3600 )
+
+  def testRandom( self ):
+    """ random records compared with the bucket by bucket splitting """
+    for i in range( 300 ):
+      startTime = self.nowEpoch - self.random.randint( 0, 500 * 86400 )
+      endTime = startTime + self.random.randint( 0, 20 * 86400 )
+      self.__check( startTime, endTime )
+
+  def testRecords( self ):
+    """ batch of records """
+    schedule = BucketSchedule( BUCKETS_LENGTH, self.nowEpoch, MAX_BUCKET_TIME )
+    timesList = [ ( self.nowEpoch - 5000, self.nowEpoch ), ( self.nowEpoch - 90000, self.nowEpoch - 10 ) ]
+    self.assertEqual( schedule.calculateBucketsForRecords( timesList ),
+                      [ legacyCalculateBuckets( BUCKETS_LENGTH, s, e, self.nowEpoch ) for s, e in timesList ] )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( BucketScheduleTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
@@ -0,0 +1,2 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
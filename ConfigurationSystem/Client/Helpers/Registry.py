@@ -1,18 +1,85 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import types
+import threading
 from DIRAC import S_OK, S_ERROR
+from DIRAC.Core.Utilities import List
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
+from DIRAC.ConfigurationSystem.private.Refresher import gRefresher
 from DIRAC.ConfigurationSystem.Client.Helpers.CSGlobals import getVO
 
 gBaseSecuritySection = "/Registry"
 
+class RegistryIndex:
+  """
+  Reverse lookups of the Registry ( DN -> user, user -> groups, group -> properties
+  and DN -> host ). They are built from the configuration snapshot on each
+  CSNewVersion event, or on first use if the configuration changed otherwise
+  """
+
+  def __init__( self ):
+    self.__buildLock = threading.Lock()
+    self.__current = ( None, {} )
+
+  def rebuild( self, eventName = False, params = False ):
+    self.__buildLock.acquire()
+    try:
+      self.__build()
+    finally:
+      self.__buildLock.release()
+    return S_OK()
+
+  def get( self, indexName ):
+    """
+    Get an index dict of the current configuration. It must not be modified
+    """
+    #As gConfig does, get the new configuration first if it's time to
+    gRefresher.refreshConfigurationIfNeeded()
+    snapshot, indexes = self.__current
+    if snapshot is not gConfigurationData.getOptionsSnapshot():
+      self.__buildLock.acquire()
+      try:
+        snapshot, indexes = self.__current
+        if snapshot is not gConfigurationData.getOptionsSnapshot():
+          snapshot, indexes = self.__build()
+      finally:
+        self.__buildLock.release()
+    return indexes[ indexName ]
+
+  def __build( self ):
+    snapshot = gConfigurationData.getOptionsSnapshot()
+    indexes = { 'UserForDN' : {}, 'GroupsForUser' : {}, 'PropertiesForGroup' : {}, 'HostForDN' : {} }
+    #Sections are walked in order, the first entry with a DN keeps it
+    for sectionName, indexName in ( ( "Users", 'UserForDN' ), ( "Hosts", 'HostForDN' ) ):
+      sectionPath = "%s/%s" % ( gBaseSecuritySection, sectionName )
+      for name in gConfigurationData.getSectionsFromCFG( sectionPath, ordered = True ) or []:
+        for dn in List.fromChar( snapshot.get( "%s/%s/DN" % ( sectionPath, name ), "" ), "," ):
+          if dn not in indexes[ indexName ]:
+            indexes[ indexName ][ dn ] = name
+    groupsPath = "%s/Groups" % gBaseSecuritySection
+    for group in gConfigurationData.getSectionsFromCFG( groupsPath ) or []:
+      for username in List.fromChar( snapshot.get( "%s/%s/Users" % ( groupsPath, group ), "" ), "," ):
+        indexes[ 'GroupsForUser' ].setdefault( username, [] ).append( group )
+      #Empty options are left out so that the default is returned, as gConfig.getValue does
+      properties = snapshot.get( "%s/%s/Properties" % ( groupsPath, group ), "" )
+      if properties:
+        indexes[ 'PropertiesForGroup' ][ group ] = List.fromChar( properties, "," )
+    for groupsList in indexes[ 'GroupsForUser' ].values():
+      groupsList.sort()
+    self.__current = ( snapshot, indexes )
+    return self.__current
+
+gRegistryIndex = RegistryIndex()
+gConfig.addListenerToNewVersionEvent( gRegistryIndex.rebuild )
+
 def getUsernameForDN( dn, usersList = False ):
   if not usersList:
-    retVal = gConfig.getSections( "%s/Users" % gBaseSecuritySection )
-    if not retVal[ 'OK' ]:
-      return retVal
-    usersList = retVal[ 'Value' ]
+    username = gRegistryIndex.get( 'UserForDN' ).get( dn )
+    if username:
+      return S_OK( username )
+    return S_ERROR( "No username found for dn %s" % dn )
   for username in usersList:
     if dn in gConfig.getValue( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ), [] ):
       return S_OK( username )
@@ -25,18 +92,10 @@ def getDNForUsername( username ):
   return S_ERROR( "No DN found for user %s" % username )
 
 def getGroupsForUser( username ):
-  retVal = gConfig.getSections( "%s/Groups" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  groupsList = retVal[ 'Value' ]
-  userGroups = []
-  for group in groupsList:
-    if username in gConfig.getValue( "%s/Groups/%s/Users" % ( gBaseSecuritySection, group ), [] ):
-      userGroups.append( group )
+  userGroups = gRegistryIndex.get( 'GroupsForUser' ).get( username )
   if not userGroups:
     return S_ERROR( "No groups found for user %s" % username )
-  userGroups.sort()
-  return S_OK( userGroups )
+  return S_OK( list( userGroups ) )
 
 def getGroupsForDN( dn ):
   retVal = getUsernameForDN( dn )
@@ -45,13 +104,9 @@ def getGroupsForDN( dn ):
   return getGroupsForUser( retVal[ 'Value' ] )
 
 def getHostnameForDN( dn ):
-  retVal = gConfig.getSections( "%s/Hosts" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  hostList = retVal[ 'Value' ]
-  for hostname in hostList:
-    if dn in gConfig.getValue( "%s/Hosts/%s/DN" % ( gBaseSecuritySection, hostname ), [] ):
-      return S_OK( hostname )
+  hostname = gRegistryIndex.get( 'HostForDN' ).get( dn )
+  if hostname:
+    return S_OK( hostname )
   return S_ERROR( "No hostname found for dn %s" % dn )
 
 def getDefaultUserGroup():
@@ -72,6 +127,11 @@ def getUsersInGroup( groupName, defaultValue = None ):
 def getPropertiesForGroup( groupName, defaultValue = None ):
   if defaultValue == None:
     defaultValue = []
+  if type( defaultValue ) == types.ListType:
+    properties = gRegistryIndex.get( 'PropertiesForGroup' ).get( groupName )
+    if properties is None:
+      return defaultValue
+    return list( properties )
   option = "%s/Groups/%s/Properties" % ( gBaseSecuritySection, groupName )
   return gConfig.getValue( option, defaultValue )
 
@@ -31,6 +31,17 @@ class ConfigurationHandler( RequestHandler ):
       retDict[ 'data' ] = gServiceInterface.getCompressedConfigurationData()
     return S_OK( retDict )
 
+  types_getDeltaSince = [ types.StringType ]
+  def export_getDeltaSince( self, sClientVersion ):
+    sVersion = gServiceInterface.getVersion()
+    retDict = { 'newestVersion' : sVersion, 'deltas' : [] }
+    if sClientVersion < sVersion:
+      retVal = gServiceInterface.getDeltaSince( sClientVersion )
+      if not retVal[ 'OK' ]:
+        return retVal
+      retDict[ 'deltas' ] = retVal[ 'Value' ]
+    return S_OK( retDict )
+
   types_publishSlaveServer = [ types.StringType ]
   def export_publishSlaveServer( self, sURL ):
     gServiceInterface.publishSlaveServer( sURL )
@@ -14,6 +14,8 @@ from DIRAC.FrameworkSystem.Client.Logger import gLogger
 
 class ConfigurationClient:
 
+  __memoizableTypes = ( types.IntType, types.LongType, types.FloatType, types.StringType )
+
   def __init__( self, fileToLoadList = None ):
     self.diracConfigFilePath = os.path.join( DIRAC.rootPath, "etc", "dirac.cfg" )
     if fileToLoadList and type( fileToLoadList ) == types.ListType:
@@ -117,21 +119,36 @@ class ConfigurationClient:
     if not type( defaultValue ) == types.TypeType:
       defaultType = type( defaultValue )
 
+    #Conversions are memoized until the next configuration version
+    typedValuesMemo = gConfigurationData.getTypedValuesMemo()
+    memoKey = ( optionValue, defaultType )
+    if memoKey in typedValuesMemo:
+      typedValue = typedValuesMemo[ memoKey ]
+      if defaultType == types.ListType:
+        typedValue = list( typedValue )
+      return S_OK( typedValue )
+
     if defaultType == types.ListType:
       try:
-        return S_OK( List.fromChar( optionValue, ',' ) )
+        typedValue = List.fromChar( optionValue, ',' )
       except Exception:
         return S_ERROR( "Can't convert value (%s) to comma separated list" % str( optionValue ) )
+      typedValuesMemo[ memoKey ] = list( typedValue )
+      return S_OK( typedValue )
     elif defaultType == types.BooleanType:
       try:
-        return S_OK( optionValue.lower() in ( "y", "yes", "true", "1" ) )
+        typedValue = optionValue.lower() in ( "y", "yes", "true", "1" )
       except Exception:
         return S_ERROR( "Can't convert value (%s) to comma separated list" % str( optionValue ) )
     else:
       try:
-        return S_OK( defaultType( optionValue ) )
+        typedValue = defaultType( optionValue )
       except:
         return S_ERROR( "Type mismatch between default (%s) and configured value (%s) " % ( str( defaultValue ), optionValue ) )
+      if defaultType not in self.__memoizableTypes:
+        return S_OK( typedValue )
+    typedValuesMemo[ memoKey ] = typedValue
+    return S_OK( typedValue )
 
 
   def getSections( self, sectionPath, listOrdered = False ):
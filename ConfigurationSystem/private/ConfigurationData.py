@@ -20,6 +20,10 @@ class ConfigurationData:
     self.threadingLock = threading.Lock()
     self.runningThreadsNumber = 0
     self.compressedConfigurationData = ""
+    self.compressedDataLock = threading.Lock()
+    self.maxDeltaVersions = 20
+    self.__versionDeltas = []
+    self.__lastVersionCFG = False
     self.configurationPath = "/DIRAC/Configuration"
     self.backupsDir = os.path.join( DIRAC.rootPath, "etc", "csbackup" )
     self._isService = False
@@ -27,6 +31,8 @@ class ConfigurationData:
     self.remoteCFG = CFG()
     self.mergedCFG = CFG()
     self.remoteServerList = []
+    self.__optionsSnapshot = {}
+    self.__typedValuesMemo = {}
     if loadDefaultCFG:
       defaultCFGFile = os.path.join( DIRAC.rootPath, "etc", "dirac.cfg" )
       gLogger.debug( "dirac.cfg should be at", "%s" % defaultCFGFile )
@@ -41,6 +47,7 @@ class ConfigurationData:
   def sync( self ):
     gLogger.debug( "Updating configuration internals" )
     self.mergedCFG = self.remoteCFG.mergeWith( self.localCFG )
+    self.__updateOptionsSnapshot()
     self.remoteServerList = []
     localServers = self.extractOptionFromCFG( "%s/Servers" % self.configurationPath,
                                         self.localCFG,
@@ -53,7 +60,93 @@ class ConfigurationData:
     if remoteServers:
       self.remoteServerList.extend( List.fromChar( remoteServers, "," ) )
     self.remoteServerList = List.uniqueElements( self.remoteServerList )
-    self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
+    #Compressed lazily when a client asks for it
+    self.compressedDataLock.acquire()
+    self.compressedConfigurationData = ""
+    self.compressedDataLock.release()
+    if self._isService:
+      self.__recordVersionDelta()
+
+  def __recordVersionDelta( self ):
+    """
+    Keep the modifications from the previous version to the current one
+    so that clients can get only what changed
+    """
+    version = self.getVersion()
+    if self.__lastVersionCFG:
+      lastVersion = self.getVersion( self.__lastVersionCFG )
+      if lastVersion == version:
+        return
+      modList = self.__lastVersionCFG.getModifications( self.remoteCFG )
+      self.__versionDeltas.append( ( lastVersion, version, modList ) )
+      self.__versionDeltas = self.__versionDeltas[ -self.maxDeltaVersions: ]
+    self.__lastVersionCFG = self.remoteCFG.clone()
+
+  def getDeltaSince( self, version ):
+    """
+    Get the lists of modifications to apply to version to get the current one
+    """
+    if version == self.getVersion():
+      return S_OK( [] )
+    versionDeltas = self.__versionDeltas
+    for iPos in range( len( versionDeltas ) ):
+      if versionDeltas[ iPos ][0] == version:
+        return S_OK( [ delta[2] for delta in versionDeltas[ iPos: ] ] )
+    return S_ERROR( "No modifications kept since version %s" % version )
+
+  def applyRemoteModifications( self, deltaList, newVersion ):
+    """
+    Apply in place the modification lists from getDeltaSince to the remote CFG
+    """
+    self.lock()
+    try:
+      result = S_OK()
+      try:
+        for modList in deltaList:
+          result = self.remoteCFG.applyModifications( modList )
+          if not result[ 'OK' ]:
+            break
+      except Exception, e:
+        result = S_ERROR( "Cannot apply modifications: %s" % str( e ) )
+    finally:
+      self.unlock()
+    if result[ 'OK' ] and self.getVersion() != newVersion:
+      result = S_ERROR( "Version after applying modifications is %s instead of %s" % ( self.getVersion(), newVersion ) )
+    if not result[ 'OK' ]:
+      #The contents can't be trusted, the next refresh has to get all the data
+      self.setVersion( "0" )
+      return result
+    self.sync()
+    return S_OK()
+
+  def __updateOptionsSnapshot( self ):
+    """
+    Flatten the merged configuration into a path -> value dict. Readers look up
+    options there without locks. It is never modified, a new one replaces it
+    """
+    optionsSnapshot = {}
+    pendingSections = [ ( "", self.mergedCFG ) ]
+    while pendingSections:
+      sectionPath, cfg = pendingSections.pop()
+      for option in cfg.listOptions( False ):
+        optionsSnapshot[ "%s/%s" % ( sectionPath, option ) ] = cfg[ option ]
+      for section in cfg.listSections( False ):
+        pendingSections.append( ( "%s/%s" % ( sectionPath, section ), cfg[ section ] ) )
+    self.__optionsSnapshot = optionsSnapshot
+    self.__typedValuesMemo = {}
+
+  def getOptionsSnapshot( self ):
+    """
+    Get the path -> value dict of the current version. It must not be modified
+    """
+    return self.__optionsSnapshot
+
+  def getTypedValuesMemo( self ):
+    """
+    Get a dict to memoize the conversions of option values to other types.
+    It is discarded with each new version of the configuration
+    """
+    return self.__typedValuesMemo
 
   def loadFile( self, fileName ):
     try:
@@ -142,7 +235,12 @@ class ConfigurationData:
 
   def extractOptionFromCFG( self, path, cfg = False, disableDangerZones = False ):
     if not cfg:
-      cfg = self.mergedCFG
+      optionsSnapshot = self.__optionsSnapshot
+      if path in optionsSnapshot:
+        return optionsSnapshot[ path ]
+      #Maybe the path is not normalized
+      levelList = [ level.strip() for level in path.split( "/" ) if level.strip() != "" ]
+      return optionsSnapshot.get( "/%s" % "/".join( levelList ) )
     if not disableDangerZones:
       self.dangerZoneStart()
     try:
@@ -282,7 +380,13 @@ class ConfigurationData:
     self.sync()
 
   def getCompressedData( self ):
-    return self.compressedConfigurationData
+    self.compressedDataLock.acquire()
+    try:
+      if not self.compressedConfigurationData:
+        self.compressedConfigurationData = zlib.compress( str( self.remoteCFG ), 9 )
+      return self.compressedConfigurationData
+    finally:
+      self.compressedDataLock.release()
 
   def isMaster( self ):
     value = self.extractOptionFromCFG( "%s/Master" % self.configurationPath,
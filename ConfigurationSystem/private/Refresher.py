@@ -14,6 +14,20 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 def _updateFromRemoteLocation( serviceClient ):
   gLogger.debug( "", "Trying to refresh from %s" % serviceClient.serviceURL )
   localVersion = gConfigurationData.getVersion()
+  #Try to get only the modifications since the local version
+  retVal = serviceClient.getDeltaSince( localVersion )
+  if retVal[ 'OK' ]:
+    dataDict = retVal[ 'Value' ]
+    if localVersion >= dataDict[ 'newestVersion' ]:
+      return S_OK()
+    gLogger.debug( "New version available", "Applying modifications up to version %s..." % dataDict[ 'newestVersion' ] )
+    retVal = gConfigurationData.applyRemoteModifications( dataDict[ 'deltas' ], dataDict[ 'newestVersion' ] )
+    if retVal[ 'OK' ]:
+      gLogger.debug( "Updated to version %s" % gConfigurationData.getVersion() )
+      gEventDispatcher.triggerEvent( "CSNewVersion", dataDict[ 'newestVersion' ], threaded = True )
+      return S_OK()
+    gLogger.warn( "Cannot apply configuration modifications", retVal[ 'Message' ] )
+    localVersion = gConfigurationData.getVersion()
   retVal = serviceClient.getCompressedDataIfNewer( localVersion )
   if retVal[ 'OK' ]:
     dataDict = retVal[ 'Value' ]
@@ -65,6 +79,9 @@ class Refresher( threading.Thread ):
   def refreshConfigurationIfNeeded( self ):
     if not self.__refreshEnabled or self.__automaticUpdate or not gConfigurationData.getServers():
       return
+    #Checked again with the lock held, this avoids the lock in almost every call
+    if not self.__lastRefreshExpired():
+      return
     self.__triggeredRefreshLock.acquire()
     try:
       if not self.__lastRefreshExpired():
@@ -159,6 +159,9 @@ class ServiceInterface( threading.Thread ):
   def getCompressedConfigurationData( self ):
     return gConfigurationData.getCompressedData()
 
+  def getDeltaSince( self, version ):
+    return gConfigurationData.getDeltaSince( version )
+
   def getVersion( self ):
     return gConfigurationData.getVersion()
 
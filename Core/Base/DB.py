@@ -66,8 +66,15 @@ class DB( MySQL ):
     if result['OK']:
       self.maxQueueSize = int( result['Value'] )
 
+    # Connection pool tuning
+    maxIdleTime = gConfig.getValue( self.cs_path + '/ConnectionMaxIdleTime', 600 )
+    maxLifeTime = gConfig.getValue( self.cs_path + '/ConnectionMaxLifeTime', 3600 )
+    pingIdleTime = gConfig.getValue( self.cs_path + '/ConnectionPingIdleTime', 30 )
+
     MySQL.__init__( self, self.dbHost, self.dbUser, self.dbPass,
-                   self.dbName, maxQueueSize = maxQueueSize )
+                   self.dbName, maxQueueSize = self.maxQueueSize,
+                   maxIdleTime = maxIdleTime, maxLifeTime = maxLifeTime,
+                   pingIdleTime = pingIdleTime )
 
     if not self._connected:
       err = 'Can not connect to DB, exiting...'
@@ -4,10 +4,12 @@ __RCSID__ = "$Id$"
 import types
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
+from DIRAC.ConfigurationSystem.Client.ConfigurationData import gConfigurationData
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 from DIRAC.Core.Security import CS
 from DIRAC.Core.Security import Properties
 from DIRAC.Core.Utilities import List
+from DIRAC.Core.Utilities.LRUCache import LRUCache
 
 class AuthManager:
 
@@ -20,18 +22,26 @@ class AuthManager:
   KW_USERNAME = 'username'
 
 
-  def __init__( self, authSection ):
+  def __init__( self, authSection, cacheSize = 1000 ):
     """
     Constructor
 
     @type authSection: string
     @param authSection: Section containing the authorization rules
+    @type cacheSize: int
+    @param cacheSize: Maximum number of decisions cached. 0 disables the cache
     """
     self.authSection = authSection
+    if cacheSize:
+      self.__decisionCache = LRUCache( cacheSize )
+    else:
+      self.__decisionCache = False
+    self.__cacheSnapshot = False
 
   def authQuery( self, methodQuery, credDict, defaultProperties = False ):
     """
-    Check if the query is authorized for a credentials dictionary
+    Check if the query is authorized for a credentials dictionary. Decisions are
+    cached until the configuration changes
 
     @type  methodQuery: string
     @param methodQuery: Method to test
@@ -40,6 +50,69 @@ class AuthManager:
                         and selected group.
     @return: Boolean result of test
     """
+    #As the Registry indexes do, a new snapshot of the options means a new configuration
+    snapshot = gConfigurationData.getOptionsSnapshot()
+    cacheKey = self.__getCacheKey( snapshot, methodQuery, credDict, defaultProperties )
+    if not cacheKey:
+      return self.__authQuery( methodQuery, credDict, defaultProperties )
+    cachedDecision = self.__decisionCache.get( cacheKey )
+    if cachedDecision is not None:
+      authorized, updatedCreds, deletedCreds = cachedDecision
+      for key in updatedCreds:
+        value = updatedCreds[ key ]
+        if type( value ) == types.ListType:
+          value = list( value )
+        credDict[ key ] = value
+      for key in deletedCreds:
+        credDict.pop( key, None )
+      return authorized
+    initialCreds = dict( credDict )
+    authorized = self.__authQuery( methodQuery, credDict, defaultProperties )
+    #Keep what the query resolved (username, group, properties...) to restore it on hits
+    updatedCreds = {}
+    for key in credDict:
+      if key not in initialCreds or initialCreds[ key ] != credDict[ key ]:
+        value = credDict[ key ]
+        if type( value ) == types.ListType:
+          value = list( value )
+        updatedCreds[ key ] = value
+    deletedCreds = [ key for key in initialCreds if key not in credDict ]
+    self.__decisionCache.add( cacheKey, ( authorized, updatedCreds, deletedCreds ) )
+    return authorized
+
+  def __getCacheKey( self, snapshot, methodQuery, credDict, defaultProperties ):
+    if self.__decisionCache is False:
+      return False
+    #Decisions of old configurations can't be hit any more, purging them just frees the space
+    if snapshot is not self.__cacheSnapshot:
+      self.__decisionCache.purgeAll()
+      self.__cacheSnapshot = snapshot
+    if type( defaultProperties ) == types.ListType:
+      defaultProperties = tuple( defaultProperties )
+    #The snapshot is part of the key so that a query that started with the previous
+    #configuration doesn't store its decision for the new one. Its id can't be reused
+    #while it's kept as the current one or by a running query
+    cacheKey = ( id( snapshot ), methodQuery, defaultProperties )
+    for key in ( self.KW_DN, self.KW_GROUP, self.KW_EXTRA_CREDENTIALS ):
+      value = credDict.get( key, None )
+      if type( value ) == types.ListType:
+        value = tuple( value )
+      cacheKey += ( key in credDict, value )
+    try:
+      hash( cacheKey )
+    except TypeError:
+      return False
+    return cacheKey
+
+  def getCacheStats( self ):
+    """
+    Get the size and the hits and misses of the decision cache
+    """
+    if self.__decisionCache is False:
+      return { 'Size' : 0, 'MaxSize' : 0, 'Hits' : 0, 'Misses' : 0 }
+    return self.__decisionCache.getStats()
+
+  def __authQuery( self, methodQuery, credDict, defaultProperties = False ):
     userString = ""
     if self.KW_DN in credDict:
       userString += "DN=%s" % credDict[ self.KW_DN ]
@@ -63,7 +136,7 @@ class AuthManager:
     if self.forwardedCredentials( credDict ):
       self.__authLogger.verbose( "Query comes from a gateway" )
       self.unpackForwardedCredentials( credDict )
-      return self.authQuery( methodQuery, credDict )
+      return self.__authQuery( methodQuery, credDict )
     #Get the properties
     #Check for invalid forwarding
     if self.KW_EXTRA_CREDENTIALS in credDict:
@@ -2,6 +2,7 @@
 __RCSID__ = "$Id$"
 
 from DIRAC.Core.DISET.private.InnerRPCClient import InnerRPCClient
+from DIRAC.Core.Utilities.ReturnValues import S_OK
 
 class _MagicMethod:
 
@@ -25,6 +26,7 @@ class RPCClient:
     Constructor
     """
     self.__innerRPCClient = InnerRPCClient( *args, **kwargs )
+    self.__queuedCalls = []
 
   def __doRPC( self, sFunctionName, args ):
     """
@@ -33,6 +35,26 @@ class RPCClient:
     retVal = self.__innerRPCClient.executeRPC( sFunctionName, args )
     return retVal
 
+  def queueCall( self, sFunctionName, *args ):
+    """
+    Queue a call to be executed in the next flushCalls
+    """
+    self.__queuedCalls.append( ( sFunctionName, args ) )
+
+  def getNumQueuedCalls( self ):
+    return len( self.__queuedCalls )
+
+  def flushCalls( self ):
+    """
+    Execute all the queued calls in one round trip
+      Returns S_OK( [ result of each call ] ) in the same order they were queued
+    """
+    callsList = self.__queuedCalls
+    self.__queuedCalls = []
+    if not callsList:
+      return S_OK( [] )
+    return self.__innerRPCClient.executeMultiRPC( callsList )
+
   def __getattr__( self, attrName ):
     """
     Function for emulating the existance of functions
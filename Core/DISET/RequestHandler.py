@@ -9,7 +9,7 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR, isReturnStructure
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.Core.DISET.private.MessageBroker import getGlobalMessageBroker
-from DIRAC.Core.Utilities import Time
+from DIRAC.Core.Utilities import Time, List
 import DIRAC
 
 class RequestHandler:
@@ -81,6 +81,8 @@ class RequestHandler:
     actionType = actionTuple[0]
     if actionType == "RPC":
       retVal = self.__doRPC( actionTuple[1] )
+    elif actionType == "MultiRPC":
+      retVal = self.__doMultiRPC( List.fromChar( actionTuple[1], "," ) )
     elif actionType == "FileTransfer":
       retVal = self.__doFileTransfer( actionTuple[1] )
     elif actionType == "Connection":
@@ -91,8 +93,14 @@ class RequestHandler:
       message = "Method %s for action %s does not have a return value!" % ( actionTuple[1], actionTuple[0] )
       gLogger.error( message )
       retVal = S_ERROR( message )
-    self.__logRemoteQueryResponse( retVal, time.time() - startTime )
-    return self.__trPool.send( self.__trid, retVal )
+    elapsedTime = time.time() - startTime
+    #RPC calls are reported method by method
+    if actionType not in ( "RPC", "MultiRPC" ):
+      self.__reportCall( "%s/%s" % actionTuple, False, elapsedTime )
+    self.__logRemoteQueryResponse( retVal, elapsedTime )
+    retVal = self.__trPool.send( self.__trid, retVal )
+    self.__reportCodecTimes()
+    return retVal
 
 #####
 #
@@ -191,7 +199,39 @@ class RequestHandler:
       return S_ERROR( "Error while receiving function arguments: %s" % retVal[ 'Message' ] )
     args = retVal[ 'Value' ]
     self.__logRemoteQuery( "RPC/%s" % method, args )
-    return self.__RPCCallFunction( method, args )
+    startTime = time.time()
+    result = self.__RPCCallFunction( method, args )
+    self.__reportCall( "RPC/%s" % method, args, time.time() - startTime )
+    return result
+
+  def __doMultiRPC( self, methodsList ):
+    """
+    Execute a batch of RPC calls in order
+
+    @type methodsList: list
+    @param methodsList: Methods authorized in the proposal
+    @return: S_OK( list with the S_OK/S_ERROR of each call )/S_ERROR
+    """
+    retVal = self.__trPool.receive( self.__trid )
+    if not retVal[ 'OK' ]:
+      gLogger.error( "Error receiving arguments", "%s %s" % ( self.srv_getFormattedRemoteCredentials(),
+                                                             retVal[ 'Message' ] ) )
+      return S_ERROR( "Error while receiving function arguments: %s" % retVal[ 'Message' ] )
+    results = []
+    for method, args in retVal[ 'Value' ]:
+      if method not in methodsList:
+        results.append( S_ERROR( "Method %s was not in the proposal" % method ) )
+        continue
+      self.__logRemoteQuery( "MultiRPC/%s" % method, args )
+      startTime = time.time()
+      result = self.__RPCCallFunction( method, args )
+      self.__reportCall( "RPC/%s" % method, args, time.time() - startTime )
+      if not result:
+        message = "Method %s for action MultiRPC does not have a return value!" % method
+        gLogger.error( message )
+        result = S_ERROR( message )
+      results.append( result )
+    return S_OK( results )
 
   def __RPCCallFunction( self, method, args ):
     realMethod = "export_%s" % method
@@ -339,7 +379,9 @@ class RequestHandler:
     if not isReturnStructure( uReturnValue ):
       gLogger.error( "Message %s does not return a S_OK/S_ERROR" % msgName )
       uReturnValue = S_ERROR( "Message %s does not return a S_OK/S_ERROR" % msgName )
-    self.__logRemoteQueryResponse( uReturnValue, time.time() - startTime )
+    elapsedTime = time.time() - startTime
+    self.__reportCall( "Message/%s" % msgName, False, elapsedTime )
+    self.__logRemoteQueryResponse( uReturnValue, elapsedTime )
     return uReturnValue
 
 ####
@@ -375,6 +417,44 @@ class RequestHandler:
                                                       method,
                                                       argsString ) )
 
+  def __reportCall( self, method, args, elapsedTime ):
+    """
+    Add the call to the latency histograms of the service and log it if it was slow
+
+    @type method: string
+    @param method: Action type and method called
+    @type args: tuple
+    @param args: Arguments of the method called, False if unknown
+    @type elapsedTime: float
+    @param elapsedTime: Seconds the call took
+    """
+    callStats = self.serviceInfoDict.get( 'callStats', False )
+    if callStats:
+      callStats.add( method, elapsedTime )
+    slowCallThreshold = self.serviceInfoDict.get( 'slowCallThreshold', 0 )
+    if not slowCallThreshold or elapsedTime < slowCallThreshold:
+      return
+    #Only the types and sizes of the arguments, they can be big or confidential
+    argsSummary = []
+    for arg in args or []:
+      try:
+        argsSummary.append( "%s[%s]" % ( type( arg ).__name__, len( arg ) ) )
+      except TypeError:
+        argsSummary.append( type( arg ).__name__ )
+    transport = self.__trPool.get( self.__trid )
+    if transport:
+      callerDN = transport.getConnectingCredentials().get( 'DN', 'unknown' )
+    else:
+      callerDN = 'unknown'
+    gLogger.warn( "Slow call", "%s/%s(%s) took %.2f secs for %s" % ( self.__svcName, method, ", ".join( argsSummary ),
+                                                                     elapsedTime, callerDN ) )
+
+  def __reportCodecTimes( self ):
+    callStats = self.serviceInfoDict.get( 'callStats', False )
+    transport = self.__trPool.get( self.__trid )
+    if callStats and transport:
+      callStats.addCodecTimes( transport.getCodecTimes() )
+
   def __logRemoteQueryResponse( self, retVal, elapsedTime ):
     """
     Log the result of a query
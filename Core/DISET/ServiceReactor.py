@@ -1,19 +1,22 @@
 
+import os
+import sys
+import errno
 import types
 import select
+import signal
 import time
 import socket
-
-try:
-  import multiprocessing
-except:
-  multiprocessing = False
+import threading
 
 from DIRAC import gLogger, S_OK, S_ERROR
 from DIRAC.Core.DISET.private.Service import Service
 from DIRAC.Core.DISET.private.GatewayService import GatewayService
-from DIRAC.Core.Utilities import Network, Time
+from DIRAC.Core.Utilities import Network, Time, DEncode
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
 from DIRAC.ConfigurationSystem.Client.Helpers import Registry
 
 class ServiceReactor:
@@ -27,6 +30,14 @@ class ServiceReactor:
     self.__alive = True
     self.__listeningConnections = {}
     self.__stats = ReactorStats()
+    #Connections kept open between calls, socket -> ( service name, trid, idle since )
+    self.__persistentConnections = {}
+    self.__persistentLock = threading.Lock()
+    self.__lastPersistentPurge = time.time()
+    #Written to when a connection is kept to wake up the select
+    self.__wakeUpPipe = os.pipe()
+    #Clone processes, read end of the monitoring pipe -> [ service name, clone id, pid, start time, buffer ]
+    self.__clones = {}
     for serviceName in services:
       while serviceName[0] == "/":
         serviceName = serviceName[1:]
@@ -34,8 +45,13 @@ class ServiceReactor:
         self.__services[ serviceName ] = GatewayService()
       else:
         self.__services[ serviceName ] = Service( serviceName )
+      self.__services[ serviceName ].setPersistentConnectionCallback( self.__keepConnection )
 
   def initialize( self ):
+    if self.__usePreFork():
+      #Handlers are initialized after the fork so they don't share connections or threads
+      gLogger.info( "Services will be initialized in the clone processes" )
+      return S_OK()
     for serviceName in self.__services:
       gLogger.verbose( "Initializing %s" % serviceName )
       result = self.__services[ serviceName ].initialize()
@@ -86,23 +102,150 @@ class ServiceReactor:
       return result
     for svcName in self.__listeningConnections:
       gLogger.always( "Listening at %s" % self.__services[ svcName ].getConfig().getURL() )
-    #Multiple clones not yet working. Disabled by default
-    if False and multiprocessing:
-      for svcName in self.__listeningConnections:
-        clones = self.__services[ svcName ].getConfig().getCloneProcesses()
-        for i in range( 1, clones ):
-          p = multiprocessing.Process( target = self.__startCloneProcess, args = ( svcName, i ) )
-          p.start()
-          gLogger.always( "Started clone process %s for %s" % ( i, svcName ) )
-    while self.__alive:
-      self.__acceptIncomingConnection()
+    if self.__usePreFork():
+      return self.__superviseClones()
+    self.__serveConnections()
 
-  #This function runs in a different process
-  def __startCloneProcess( self, svcName, i ):
-    self.__services[ svcName ].setCloneProcessId( i )
-    self.__alive = i
-    while self.__alive:
-      self.__acceptIncomingConnection( svcName )
+  def __serveConnections( self, svcName = False ):
+    if self.__useEpoll():
+      gLogger.info( "Using epoll reactor" )
+      self.__epollLoop( svcName )
+    else:
+      while self.__alive:
+        self.__acceptIncomingConnection( svcName )
+
+  #Clone processes. The reactor forks the clones of each service after creating the
+  #listening sockets and supervises them. Every clone accepts connections by itself
+
+  def __getNumClones( self, svcName ):
+    return max( 1, self.__services[ svcName ].getConfig().getCloneProcesses() )
+
+  def __usePreFork( self ):
+    for svcName in self.__services:
+      if self.__getNumClones( svcName ) > 1:
+        return True
+    return False
+
+  def __superviseClones( self ):
+    #Clones compete for the connections. The ones that lose must not block in accept
+    for svcName in self.__listeningConnections:
+      try:
+        self.__listeningConnections[ svcName ][ 'transport' ].getSocket().setblocking( 0 )
+      except Exception, e:
+        gLogger.warn( "Cannot make listening socket non blocking", "%s: %s" % ( svcName, str( e ) ) )
+    monitors = {}
+    for svcName in self.__listeningConnections:
+      monitors[ svcName ] = MonitoringClient()
+      monitors[ svcName ].setComponentType( MonitoringClient.COMPONENT_SERVICE )
+      monitors[ svcName ].setComponentName( svcName )
+      monitors[ svcName ].initialize()
+      for cloneId in range( 1, self.__getNumClones( svcName ) + 1 ):
+        self.__spawnClone( svcName, cloneId )
+    signal.signal( signal.SIGTERM, self.__stopClones )
+    #( respawn time, service name, clone id )
+    respawns = []
+    try:
+      while self.__alive:
+        timeout = None
+        if respawns:
+          timeout = max( 0, min( respawns )[0] - time.time() )
+        try:
+          inList = select.select( self.__clones.keys(), [], [], timeout )[0]
+        except select.error, e:
+          if e.args[0] == errno.EINTR:
+            continue
+          raise
+        for fd in inList:
+          data = os.read( fd, 65536 )
+          if data:
+            self.__processCloneData( fd, data, monitors )
+            continue
+          #The clone closed its end of the pipe. It's dead
+          svcName, cloneId, pid, startTime, buf = self.__clones.pop( fd )
+          os.close( fd )
+          exitStatus = os.waitpid( pid, 0 )[1]
+          if os.WIFEXITED( exitStatus ) and os.WEXITSTATUS( exitStatus ) == 2:
+            return S_ERROR( "Clone %s of %s could not be initialized" % ( cloneId, svcName ) )
+          gLogger.error( "Clone process died", "%s of %s (pid %s, status %s)" % ( cloneId, svcName, pid, exitStatus ) )
+          #Don't respawn in a tight loop clones that die right after starting
+          respawnTime = time.time()
+          if respawnTime - startTime < 10:
+            respawnTime = startTime + 10
+          respawns.append( ( respawnTime, svcName, cloneId ) )
+        now = time.time()
+        for respawn in [ respawn for respawn in respawns if respawn[0] <= now ]:
+          respawns.remove( respawn )
+          self.__spawnClone( respawn[1], respawn[2] )
+    finally:
+      self.__stopClones()
+    return S_OK()
+
+  def __spawnClone( self, svcName, cloneId ):
+    readFd, writeFd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      os.close( readFd )
+      self.__runClone( svcName, cloneId, writeFd )
+    os.close( writeFd )
+    self.__clones[ readFd ] = [ svcName, cloneId, pid, time.time(), "" ]
+    gLogger.always( "Started clone process %s for %s (pid %s)" % ( cloneId, svcName, pid ) )
+
+  def __runClone( self, svcName, cloneId, monitoringFd ):
+    """
+    Body of the clone process. It never returns
+    """
+    exitCode = 0
+    try:
+      try:
+        signal.signal( signal.SIGTERM, signal.SIG_DFL )
+        for fd in self.__clones:
+          os.close( fd )
+        self.__clones = {}
+        for fd in self.__wakeUpPipe:
+          os.close( fd )
+        self.__wakeUpPipe = os.pipe()
+        gThreadScheduler.afterFork()
+        self.__services[ svcName ].setCloneProcessId( cloneId, CloneMarksForwarder( monitoringFd ) )
+        result = self.__services[ svcName ].initialize()
+        if not result[ 'OK' ]:
+          gLogger.fatal( "Cannot initialize clone %s of %s" % ( cloneId, svcName ), result[ 'Message' ] )
+          exitCode = 2
+          return
+        self.__serveConnections( svcName )
+      except Exception:
+        gLogger.exception( "Clone %s of %s died" % ( cloneId, svcName ) )
+        exitCode = 1
+    finally:
+      os._exit( exitCode )
+
+  def __processCloneData( self, fd, data, monitors ):
+    clone = self.__clones[ fd ]
+    clone[4] += data
+    while True:
+      iSeparatorPosition = clone[4].find( ":" )
+      if iSeparatorPosition == -1:
+        return
+      size = int( clone[4][ :iSeparatorPosition ] )
+      if len( clone[4] ) < iSeparatorPosition + 1 + size:
+        return
+      message = clone[4][ iSeparatorPosition + 1 : iSeparatorPosition + 1 + size ]
+      clone[4] = clone[4][ iSeparatorPosition + 1 + size: ]
+      try:
+        activitiesDefinitions, activitiesMarks = DEncode.decode( message )[0]
+        monitors[ clone[0] ].addForwardedMarks( activitiesDefinitions, activitiesMarks )
+      except Exception, e:
+        gLogger.error( "Invalid monitoring data from clone", "%s of %s: %s" % ( clone[1], clone[0], str( e ) ) )
+
+  def __stopClones( self, signum = False, frame = False ):
+    for svcName, cloneId, pid, startTime, buf in self.__clones.values():
+      try:
+        os.kill( pid, signal.SIGTERM )
+      except OSError:
+        pass
+    if signum:
+      gLogger.always( "Stopping clone processes" )
+      self.__clones = {}
+      sys.exit( 0 )
 
   def __getListeningSocketsList( self, svcName = False ):
     if svcName:
@@ -113,43 +256,308 @@ class ServiceReactor:
         sockets.append( self.__listeningConnections[ svcName ][ 'socket' ] )
     return sockets
 
+  #Connections kept open between calls
+
+  def __keepConnection( self, svcName, trid ):
+    transport = getGlobalTransportPool().get( trid )
+    if not transport:
+      return False
+    maxConnections = self.__services[ svcName ].getConfig().getMaxPersistentConnections()
+    self.__persistentLock.acquire()
+    try:
+      numConnections = len( [ True for connection in self.__persistentConnections.values() if connection[0] == svcName ] )
+      if numConnections >= maxConnections:
+        return False
+      self.__persistentConnections[ transport.getSocket() ] = ( svcName, trid, time.time() )
+    finally:
+      self.__persistentLock.release()
+    os.write( self.__wakeUpPipe[1], "w" )
+    return True
+
+  def __getPersistentSocketsList( self, svcName = False ):
+    self.__persistentLock.acquire()
+    try:
+      return [ sock for sock in self.__persistentConnections if not svcName or self.__persistentConnections[ sock ][0] == svcName ]
+    finally:
+      self.__persistentLock.release()
+
+  def __popPersistentConnection( self, sock ):
+    self.__persistentLock.acquire()
+    try:
+      return self.__persistentConnections.pop( sock, False )
+    finally:
+      self.__persistentLock.release()
+
+  def __getNextPersistentExpiry( self ):
+    self.__persistentLock.acquire()
+    try:
+      nextExpiry = False
+      idleTimes = {}
+      for svcName, trid, idleSince in self.__persistentConnections.values():
+        if svcName not in idleTimes:
+          idleTimes[ svcName ] = self.__services[ svcName ].getConfig().getPersistentConnectionIdleTime()
+        expiry = idleSince + idleTimes[ svcName ]
+        if not nextExpiry or expiry < nextExpiry:
+          nextExpiry = expiry
+      return nextExpiry
+    finally:
+      self.__persistentLock.release()
+
+  def __purgePersistentConnections( self ):
+    now = time.time()
+    if now - self.__lastPersistentPurge < 10:
+      return
+    self.__lastPersistentPurge = now
+    self.__persistentLock.acquire()
+    try:
+      toClose = []
+      for sock in list( self.__persistentConnections ):
+        svcName, trid, idleSince = self.__persistentConnections[ sock ]
+        if now - idleSince > self.__services[ svcName ].getConfig().getPersistentConnectionIdleTime():
+          toClose.append( trid )
+          del( self.__persistentConnections[ sock ] )
+    finally:
+      self.__persistentLock.release()
+    for trid in toClose:
+      getGlobalTransportPool().close( trid )
+
   def __acceptIncomingConnection( self, svcName = False ):
     sockets = self.__getListeningSocketsList( svcName )
     while self.__alive:
+      self.__purgePersistentConnections()
+      persistentSockets = self.__getPersistentSocketsList( svcName )
+      clientTransport = False
       try:
-        inList, outList, exList = select.select( sockets, [], [], 10 )
+        inList, outList, exList = select.select( sockets + persistentSockets + [ self.__wakeUpPipe[0] ], [], [], 10 )
         if len( inList ) == 0:
           return
         for inSocket in inList:
-          for svcName in self.__listeningConnections:
-            if inSocket == self.__listeningConnections[ svcName ][ 'socket' ]:
-              retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
+          if inSocket == self.__wakeUpPipe[0]:
+            os.read( self.__wakeUpPipe[0], 1024 )
+            continue
+          if inSocket in persistentSockets:
+            connection = self.__popPersistentConnection( inSocket )
+            if connection:
+              self.__services[ connection[0] ].handlePersistentConnection( connection[1] )
+            continue
+          for listeningSvcName in self.__listeningConnections:
+            if inSocket == self.__listeningConnections[ listeningSvcName ][ 'socket' ]:
+              retVal = self.__listeningConnections[ listeningSvcName ][ 'transport' ].acceptConnection()
               if not retVal[ 'OK' ]:
                 gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
                 return
               clientTransport = retVal[ 'Value' ]
+              acceptedSvcName = listeningSvcName
       except socket.error:
         return
-      #Is it banned?
-      clientIP = clientTransport.getRemoteAddress()[0]
-      if clientIP in Registry.getBannedIPs():
-        gLogger.warn( "Client connected from banned ip %s" % clientIP )
-        clientTransport.close()
+      if not clientTransport:
+        continue
+      if self.__isBanned( clientTransport ):
         continue
       #Handle connection
       self.__stats.connectionStablished()
-      self.__services[ svcName ].handleConnection( clientTransport )
-      #Renew context?
-      now = time.time()
-      renewed = False
-      for svcName in self.__listeningConnections:
-         tr = self.__listeningConnections[ svcName ][ 'transport' ]
-         if now - tr.latestServerRenewTime() > self.__services[ svcName ].getConfig().getContextLifeTime():
-           result = tr.renewServerContext()
-           if result[ 'OK' ]:
-             renewed = True
-      if renewed:
-        sockets = self.__getListeningSocketsList()
+      self.__services[ acceptedSvcName ].handleConnection( clientTransport )
+      if self.__renewServerContexts( svcName ):
+        sockets = self.__getListeningSocketsList( svcName )
+
+  def __isBanned( self, clientTransport ):
+    clientIP = clientTransport.getRemoteAddress()[0]
+    if clientIP in Registry.getBannedIPs():
+      gLogger.warn( "Client connected from banned ip %s" % clientIP )
+      clientTransport.close()
+      return True
+    return False
+
+  def __renewServerContexts( self, svcName = False ):
+    now = time.time()
+    renewed = False
+    for listeningSvcName in self.__listeningConnections:
+       if svcName and listeningSvcName != svcName:
+         continue
+       tr = self.__listeningConnections[ listeningSvcName ][ 'transport' ]
+       if now - tr.latestServerRenewTime() > self.__services[ listeningSvcName ].getConfig().getContextLifeTime():
+         result = tr.renewServerContext()
+         if result[ 'OK' ]:
+           renewed = True
+    return renewed
+
+  #epoll reactor. Connections stay in the event loop during the handshake and until the
+  #whole proposal has been received. Only then a worker thread takes care of them
+
+  def __useEpoll( self ):
+    for svcName in self.__services:
+      if self.__services[ svcName ].getConfig().getReactorMode() != "epoll":
+        return False
+    if not hasattr( select, "epoll" ):
+      gLogger.warn( "epoll is not available in this platform. Using select" )
+      return False
+    return True
+
+  def __epollLoop( self, svcName = False ):
+    poller = select.epoll()
+    #fd -> listening service name
+    listeningFds = {}
+    #fd -> [ service name, transport, handshake done, deadline ]
+    newConnections = {}
+    #fd -> socket of a connection kept between calls
+    persistentFds = {}
+    self.__registerListeningSockets( poller, listeningFds, svcName )
+    poller.register( self.__wakeUpPipe[0], select.EPOLLIN )
+    while self.__alive:
+      self.__purgePersistentConnections()
+      self.__syncPersistentConnections( poller, persistentFds, svcName )
+      try:
+        events = poller.poll( self.__getEpollTimeout( newConnections ) )
+      except IOError, e:
+        if e.errno == errno.EINTR:
+          continue
+        raise
+      for fd, event in events:
+        if fd == self.__wakeUpPipe[0]:
+          os.read( fd, 1024 )
+        elif fd in listeningFds:
+          self.__epollAccept( poller, listeningFds[ fd ], newConnections )
+          if self.__renewServerContexts( svcName ):
+            self.__registerListeningSockets( poller, listeningFds, svcName )
+        elif fd in newConnections:
+          self.__epollProcessNewConnection( poller, fd, newConnections )
+        elif fd in persistentFds:
+          self.__epollProcessPersistentConnection( poller, fd, persistentFds )
+      self.__expireNewConnections( poller, newConnections )
+
+  def __registerListeningSockets( self, poller, listeningFds, svcName = False ):
+    for fd in listeningFds:
+      try:
+        poller.unregister( fd )
+      except Exception:
+        pass
+    listeningFds.clear()
+    for listeningSvcName in self.__listeningConnections:
+      if svcName and listeningSvcName != svcName:
+        continue
+      fd = self.__listeningConnections[ listeningSvcName ][ 'transport' ].getSocket().fileno()
+      listeningFds[ fd ] = listeningSvcName
+      poller.register( fd, select.EPOLLIN )
+
+  def __getEpollTimeout( self, newConnections ):
+    """
+    Seconds until something has to be expired, -1 if nothing has
+    """
+    deadlines = [ connection[3] for connection in newConnections.values() ]
+    nextExpiry = self.__getNextPersistentExpiry()
+    if nextExpiry:
+      #Persistent connections are purged at most every 10 seconds
+      deadlines.append( max( nextExpiry, self.__lastPersistentPurge + 10 ) )
+    if not deadlines:
+      return -1
+    return max( 0, min( deadlines ) - time.time() )
+
+  def __epollAccept( self, poller, svcName, newConnections ):
+    try:
+      retVal = self.__listeningConnections[ svcName ][ 'transport' ].acceptConnection()
+    except Exception:
+      #Another clone got it
+      return
+    if not retVal[ 'OK' ]:
+      gLogger.warn( "Error while accepting a connection: ", retVal[ 'Message' ] )
+      return
+    clientTransport = retVal[ 'Value' ]
+    if self.__isBanned( clientTransport ):
+      return
+    self.__stats.connectionStablished()
+    fd = clientTransport.getSocket().fileno()
+    deadline = time.time() + self.__services[ svcName ].getConfig().getProposalTimeout()
+    newConnections[ fd ] = [ svcName, clientTransport, False, deadline ]
+    poller.register( fd, select.EPOLLIN )
+    #The client may have already sent something
+    self.__epollProcessNewConnection( poller, fd, newConnections )
+
+  def __epollProcessNewConnection( self, poller, fd, newConnections ):
+    svcName, clientTransport, handshakeDone, deadline = newConnections[ fd ]
+    if not handshakeDone:
+      retVal = clientTransport.handshakeStep()
+      if not retVal[ 'OK' ]:
+        self.__dropNewConnection( poller, fd, newConnections )
+        return
+      if not retVal[ 'Value' ]:
+        return
+      newConnections[ fd ][2] = True
+    retVal = clientTransport.receiveAvailableData( 1024 )
+    if not retVal[ 'OK' ]:
+      gLogger.verbose( "Error while receiving the proposal", retVal[ 'Message' ] )
+      self.__dropNewConnection( poller, fd, newConnections )
+      return
+    if not retVal[ 'Value' ]:
+      return
+    #The proposal is here. A worker does the rest
+    poller.unregister( fd )
+    del( newConnections[ fd ] )
+    self.__services[ svcName ].handleConnection( clientTransport, handshakeDone = True )
+
+  def __dropNewConnection( self, poller, fd, newConnections ):
+    try:
+      poller.unregister( fd )
+    except Exception:
+      pass
+    clientTransport = newConnections.pop( fd )[1]
+    clientTransport.close()
+
+  def __expireNewConnections( self, poller, newConnections ):
+    now = time.time()
+    for fd in [ fd for fd in newConnections if newConnections[ fd ][3] < now ]:
+      gLogger.warn( "Closing connection that didn't send a proposal in time",
+                    str( newConnections[ fd ][1].getRemoteAddress() ) )
+      self.__dropNewConnection( poller, fd, newConnections )
+
+  def __syncPersistentConnections( self, poller, persistentFds, svcName = False ):
+    """
+    Watch the connections kept by the workers and forget the purged ones
+    """
+    currentFds = {}
+    for sock in self.__getPersistentSocketsList( svcName ):
+      try:
+        fd = sock.fileno()
+      except Exception:
+        continue
+      currentFds[ fd ] = sock
+      if persistentFds.get( fd ) is not sock:
+        try:
+          poller.unregister( fd )
+        except Exception:
+          pass
+        poller.register( fd, select.EPOLLIN )
+    for fd in persistentFds:
+      if fd not in currentFds:
+        try:
+          poller.unregister( fd )
+        except Exception:
+          pass
+    persistentFds.clear()
+    persistentFds.update( currentFds )
+
+  def __epollProcessPersistentConnection( self, poller, fd, persistentFds ):
+    sock = persistentFds[ fd ]
+    self.__persistentLock.acquire()
+    try:
+      connection = self.__persistentConnections.get( sock, False )
+    finally:
+      self.__persistentLock.release()
+    if not connection:
+      return
+    svcName, trid, idleSince = connection
+    transport = getGlobalTransportPool().get( trid )
+    if transport:
+      retVal = transport.receiveAvailableData( 1024 )
+      if retVal[ 'OK' ] and not retVal[ 'Value' ]:
+        #Wait for the rest of the message
+        return
+    self.__popPersistentConnection( sock )
+    poller.unregister( fd )
+    del( persistentFds[ fd ] )
+    if not transport or not retVal[ 'OK' ]:
+      getGlobalTransportPool().close( trid )
+      return
+    self.__services[ svcName ].handlePersistentConnection( trid )
 
 
   def __closeListeningConnections( self ):
@@ -170,6 +578,21 @@ class ReactorStats:
     self.__connections += 1
 
 
+class CloneMarksForwarder:
+  """
+  Sends the monitoring marks of a clone to the process supervising it
+  """
 
+  def __init__( self, fd ):
+    self.__fd = fd
+    self.__lock = threading.Lock()
 
-
+  def __call__( self, activitiesDefinitions, activitiesMarks ):
+    data = DEncode.encode( ( activitiesDefinitions, activitiesMarks ) )
+    data = "%s:%s" % ( len( data ), data )
+    self.__lock.acquire()
+    try:
+      while data:
+        data = data[ os.write( self.__fd, data ): ]
+    finally:
+      self.__lock.release()
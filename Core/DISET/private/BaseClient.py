@@ -1,9 +1,15 @@
 # $HeadURL$
 __RCSID__ = "$Id$"
 
+import os
 import sys
+import time
 import types
 import thread
+try:
+  from hashlib import md5
+except:
+  from md5 import md5
 import DIRAC
 from DIRAC.Core.DISET.private.Protocols import gProtocolDict
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
@@ -11,8 +17,9 @@ from DIRAC.Core.Utilities import List, Network
 from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.PathFinder import *
-from DIRAC.Core.Security import CS
+from DIRAC.Core.Security import CS, Locations
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+from DIRAC.Core.DISET.private.ClientTransportPool import getGlobalClientTransportPool
 
 class BaseClient:
 
@@ -31,6 +38,8 @@ class BaseClient:
   KW_PROXY_CHAIN = "proxyChain"
   KW_SKIP_CA_CHECK = "skipCACheck"
   KW_KEEP_ALIVE_LAPSE = "keepAliveLapse"
+  KW_PERSISTENT_CONNECTION = "persistentConnection"
+  KW_COMPRESSION = "compression"
 
   def __init__( self, serviceName, **kwargs ):
     if type( serviceName ) != types.StringType:
@@ -40,11 +49,17 @@ class BaseClient:
     self.__initStatus = S_OK()
     self.__idDict = {}
     self.__trid = False
+    self.__connectionPersistent = False
+    self.__connectionReused = False
+    self.__connectionKept = False
+    self.__connectionTime = 0
+    self.__connectionKey = False
     self.__enableThreadCheck = False
     for initFunc in ( self.__discoverSetup, self.__discoverVO, self.__discoverTimeout,
                       self.__discoverURL, self.__discoverCredentialsToUse,
                       self.__discoverExtraCredentials, self.__checkTransportSanity,
-                      self.__setKeepAliveLapse ):
+                      self.__setKeepAliveLapse, self.__discoverPersistentConnection,
+                      self.__discoverCompression ):
       result = initFunc()
       if not result[ 'OK' ] and self.__initStatus[ 'OK' ]:
         self.__initStatus = result
@@ -194,12 +209,79 @@ and this is thread %s
       #raise Exception( msgTxt )
 
 
-  def _connect( self ):
+  def __discoverPersistentConnection( self ):
+    #Keep connections open between calls? Opt-in
+    if self.KW_PERSISTENT_CONNECTION in self.kwargs:
+      self.__persistentConnection = self.kwargs[ self.KW_PERSISTENT_CONNECTION ]
+    else:
+      self.__persistentConnection = gConfig.getValue( "/DIRAC/Connections/Persistent", False )
+    return S_OK()
+
+  def __discoverCompression( self ):
+    #Offer compression to the service. It decides whether to use it
+    if self.KW_COMPRESSION in self.kwargs:
+      self.__compression = self.kwargs[ self.KW_COMPRESSION ]
+    else:
+      self.__compression = gConfig.getValue( "/DIRAC/Connections/Compression", True )
+    return S_OK()
+
+  def __getCredentialsKey( self ):
+    """
+    Identify the local credentials the transport will authenticate with,
+    resolved the same way the SSL socket does
+    """
+    if self.useCertificates:
+      #The host identity is the same for the whole process
+      return ( "certificates", )
+    if self.KW_PROXY_CHAIN in self.kwargs:
+      proxyString = self.kwargs[ self.KW_PROXY_CHAIN ].dumpAllToString()[ 'Value' ]
+      return ( "proxyString", md5( proxyString ).hexdigest() )
+    if self.KW_PROXY_STRING in self.kwargs:
+      return ( "proxyString", md5( self.kwargs[ self.KW_PROXY_STRING ] ).hexdigest() )
+    if self.KW_PROXY_LOCATION in self.kwargs:
+      proxyLocation = self.kwargs[ self.KW_PROXY_LOCATION ]
+    else:
+      #The default proxy can change at run time, ie when X509_USER_PROXY is set to a shifter proxy
+      proxyLocation = Locations.getProxyLocation()
+    #A proxy file can also be replaced by the one of another user
+    return ( "proxyLocation", proxyLocation ) + self.__getFileStamp( proxyLocation )
+
+  def __getFileStamp( self, filePath ):
+    try:
+      fileStat = os.stat( filePath )
+    except Exception:
+      return ()
+    return ( fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime )
+
+  def __getConnectionKey( self ):
+    #Connections can only be shared by clients with the same credentials
+    return ( self.serviceURL, self.__getCredentialsKey(), self.kwargs.get( self.KW_SKIP_CA_CHECK, False ),
+             str( self.__extraCredentials ), self.timeout )
+
+  def _connect( self, persistent = False ):
+    """
+    Connect to the service. Persistent connections are taken from the pool
+    of idle connections if possible and are kept after the call if the
+    service agrees
+    """
     self.__trid = False
+    self.__connectionPersistent = persistent and self.__persistentConnection
+    self.__connectionReused = False
+    self.__connectionKept = False
     if not self.__initStatus[ 'OK' ]:
       return self.__initStatus
     if self.__enableThreadCheck:
       self.__checkThreadID()
+    self.__connectionKey = False
+    if self.__connectionPersistent:
+      #Keep the key of the credentials the connection is authenticated with, they may change before it's put back
+      self.__connectionKey = self.__getConnectionKey()
+      pooledConnection = getGlobalClientTransportPool().get( self.__connectionKey )
+      if pooledConnection:
+        gLogger.debug( "Reusing connection to: %s" % self.serviceURL )
+        self.__trid, transport, self.__connectionTime = pooledConnection
+        self.__connectionReused = True
+        return S_OK( transport )
     gLogger.debug( "Connecting to: %s" % self.serviceURL )
     try:
       transport = gProtocolDict[ self.__URLTuple[0] ][ 'transport' ]( self.__URLTuple[1:3], **self.kwargs )
@@ -209,14 +291,30 @@ and this is thread %s
     except Exception, e:
       return S_ERROR( "Can't connect to %s: %s" % ( self.serviceURL, e ) )
     self.__trid = getGlobalTransportPool().add( transport )
+    self.__connectionTime = time.time()
     return S_OK( transport )
 
   def _getTrid( self ):
     return self.__trid
 
-  def _disconnect( self ):
-    if self.__trid:
-      getGlobalTransportPool().close( self.__trid )
+  def _isReusedConnection( self ):
+    return self.__connectionReused
+
+  def _disconnect( self, keepConnection = False ):
+    """
+    Close the connection. If keepConnection is true and the service agreed to
+    keep it, it goes back to the pool of idle connections instead
+    """
+    trid = self.__trid
+    self.__trid = False
+    if not trid:
+      return
+    if keepConnection and self.__connectionKept and self.__connectionKey:
+      transport = getGlobalTransportPool().get( trid )
+      if transport:
+        getGlobalClientTransportPool().put( self.__connectionKey, trid, transport, self.__connectionTime )
+        return
+    getGlobalTransportPool().close( trid )
 
   def _proposeAction( self, transport, action ):
     if not self.__initStatus[ 'OK' ]:
@@ -224,10 +322,25 @@ and this is thread %s
     stConnectionInfo = ( ( self.__URLTuple[3], self.setup, self.vo ),
                          action,
                          self.__extraCredentials )
+    capabilities = {}
+    if self.__connectionPersistent:
+      capabilities[ 'keepConnection' ] = True
+    if self.__compression:
+      capabilities[ 'compression' ] = [ 'zlib' ]
+    if capabilities:
+      stConnectionInfo += ( capabilities, )
     retVal = transport.sendData( S_OK( stConnectionInfo ) )
     if not retVal[ 'OK' ]:
       return retVal
     serverReturn = transport.receiveData()
+    if self.__connectionPersistent and serverReturn[ 'OK' ]:
+      self.__connectionKept = serverReturn.get( 'keepConnection', False )
+    #Compress what is sent to the service as it will do with the replies
+    compression = serverReturn.get( 'compression', False )
+    if serverReturn[ 'OK' ] and compression:
+      transport.setCompression( compression.get( 'zlib', 0 ), compression.get( 'threshold', 16384 ) )
+    else:
+      transport.setCompression( 0 )
     #TODO: Check if delegation is required
     if serverReturn[ 'OK' ] and 'Value' in serverReturn and type( serverReturn[ 'Value' ] ) == types.DictType:
       gLogger.debug( "There is a server requirement" )
@@ -0,0 +1,51 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import threading
+from DIRAC.Core.Utilities.LatencyHistogram import LatencyHistogram
+
+class CallStats:
+  """
+  Latency histograms of a service, one per method called plus the time
+  spent waiting in the queue and encoding and decoding messages. They are
+  reset every time they are reported
+  """
+
+  def __init__( self ):
+    self.__lock = threading.Lock()
+    self.__histograms = {}
+
+  def add( self, name, elapsed ):
+    """
+    Add a duration in seconds to the histogram of name
+    """
+    self.__lock.acquire()
+    try:
+      if name not in self.__histograms:
+        self.__histograms[ name ] = LatencyHistogram()
+      self.__histograms[ name ].add( elapsed )
+    finally:
+      self.__lock.release()
+
+  def addQueueWait( self, elapsed ):
+    self.add( "QueueWait", elapsed )
+
+  def addCodecTimes( self, codecTimes ):
+    encodeTime, decodeTime = codecTimes
+    if encodeTime:
+      self.add( "Encode", encodeTime )
+    if decodeTime:
+      self.add( "Decode", decodeTime )
+
+  def getAndReset( self ):
+    """
+    Get the histograms collected since the last call
+      Returns a dict name -> LatencyHistogram
+    """
+    self.__lock.acquire()
+    try:
+      histograms = self.__histograms
+      self.__histograms = {}
+    finally:
+      self.__lock.release()
+    return histograms
@@ -0,0 +1,151 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import time
+import select
+import threading
+from DIRAC.FrameworkSystem.Client.Logger import gLogger
+from DIRAC.ConfigurationSystem.Client.Config import gConfig
+from DIRAC.Core.Utilities.ThreadScheduler import gThreadScheduler
+from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
+
+class ClientTransportPool:
+  """
+  Authenticated client transports kept open between RPC calls. Transports are
+  grouped by ( URL, credentials, group ) and only reused for the same key
+  """
+
+  def __init__( self, maxIdleTime = 60, maxLifeTime = 600, maxIdlePerKey = 4 ):
+    self.__maxIdleTime = maxIdleTime
+    self.__maxLifeTime = maxLifeTime
+    self.__maxIdlePerKey = maxIdlePerKey
+    self.__lock = threading.Lock()
+    #key -> [ [ trid, transport, creation time, last use time ], ... ] the most recently used at the end
+    self.__idle = {}
+    self.__hits = 0
+    self.__misses = 0
+    self.__evictions = 0
+    result = gThreadScheduler.addPeriodicTask( maxIdleTime, self.purgeIdle )
+    if not result[ 'OK' ]:
+      gLogger.error( "Cannot add task to thread scheduler", result[ 'Message' ] )
+
+  def get( self, key ):
+    """
+    Get an idle transport for a key
+      Returns ( trid, transport, creationTime ) or False if there is none usable
+    """
+    now = time.time()
+    while True:
+      self.__lock.acquire()
+      try:
+        idleList = self.__idle.get( key )
+        if not idleList:
+          self.__misses += 1
+          return False
+        entry = idleList.pop()
+        if not idleList:
+          del( self.__idle[ key ] )
+      finally:
+        self.__lock.release()
+      if self.__isUsable( entry, now ):
+        self.__hits += 1
+        return tuple( entry[:3] )
+      self.__close( entry )
+
+  def put( self, key, trid, transport, creationTime ):
+    """
+    Keep a transport after a successful call
+    """
+    now = time.time()
+    entry = [ trid, transport, creationTime, now ]
+    if now - creationTime > self.__maxLifeTime:
+      self.__close( entry )
+      return
+    self.__lock.acquire()
+    try:
+      if key not in self.__idle:
+        self.__idle[ key ] = []
+      idleList = self.__idle[ key ]
+      idleList.append( entry )
+      if len( idleList ) > self.__maxIdlePerKey:
+        entry = idleList.pop( 0 )
+      else:
+        entry = False
+    finally:
+      self.__lock.release()
+    if entry:
+      self.__close( entry )
+
+  def purgeIdle( self ):
+    """
+    Close the transports that have been idle or alive for too long
+    """
+    now = time.time()
+    toClose = []
+    self.__lock.acquire()
+    try:
+      for key in list( self.__idle ):
+        idleList = self.__idle[ key ]
+        usable = [ entry for entry in idleList if self.__isFresh( entry, now ) ]
+        if len( usable ) < len( idleList ):
+          toClose.extend( [ entry for entry in idleList if entry not in usable ] )
+        if usable:
+          self.__idle[ key ] = usable
+        else:
+          del( self.__idle[ key ] )
+    finally:
+      self.__lock.release()
+    for entry in toClose:
+      self.__close( entry )
+
+  def closeAll( self ):
+    """
+    Close all the idle transports
+    """
+    self.__lock.acquire()
+    try:
+      idle = self.__idle
+      self.__idle = {}
+    finally:
+      self.__lock.release()
+    for key in idle:
+      for entry in idle[ key ]:
+        self.__close( entry )
+
+  def getStats( self ):
+    self.__lock.acquire()
+    try:
+      numIdle = sum( [ len( idleList ) for idleList in self.__idle.values() ] )
+    finally:
+      self.__lock.release()
+    return { 'Idle' : numIdle, 'Hits' : self.__hits, 'Misses' : self.__misses, 'Evictions' : self.__evictions }
+
+  def __isFresh( self, entry, now ):
+    return now - entry[3] < self.__maxIdleTime and now - entry[2] < self.__maxLifeTime
+
+  def __isUsable( self, entry, now ):
+    if not self.__isFresh( entry, now ):
+      return False
+    #Nothing is expected from an idle connection. If there's something to read the server closed it
+    try:
+      inList, dummy, dummy = select.select( [ entry[1].getSocket() ], [], [], 0 )
+    except Exception, e:
+      return False
+    return not inList
+
+  def __close( self, entry ):
+    self.__evictions += 1
+    try:
+      getGlobalTransportPool().close( entry[0] )
+    except Exception, e:
+      gLogger.warn( "Error while closing idle connection", str( e ) )
+
+gClientTransportPool = False
+
+def getGlobalClientTransportPool():
+  global gClientTransportPool
+  if not gClientTransportPool:
+    gClientTransportPool = ClientTransportPool( gConfig.getValue( "/DIRAC/Connections/MaxIdleTime", 60 ),
+                                                gConfig.getValue( "/DIRAC/Connections/MaxLifeTime", 600 ),
+                                                gConfig.getValue( "/DIRAC/Connections/MaxIdlePerService", 4 ) )
+  return gClientTransportPool
@@ -37,11 +37,15 @@ class GatewayService( Service ):
     if not self._url:
       return S_ERROR( "Could not build service URL for %s" % GatewayService.GATEWAY_NAME )
     gLogger.verbose( "Service URL is %s" % self._url )
+    #Keep the configuration modifications to relay them
+    gConfigurationData.setAsService()
     #Discover Handler
     self._initMonitoring()
     self._threadPool = ThreadPool( 1,
                                     max( 0, self._cfg.getMaxThreads() ),
                                     self._cfg.getMaxWaitingPetitions() )
+    self._threadPool.setTargetQueueLatency( self._cfg.getTargetQueueLatency() )
+    self._maxQueueTime = self._cfg.getMaxQueueTime()
     self._threadPool.daemonize()
     self._msgBroker = MessageBroker( "%sMSB" % GatewayService.GATEWAY_NAME, threadPool = self._threadPool )
     self._msgBroker.useMessageObjects( False )
@@ -50,12 +54,13 @@ class GatewayService( Service ):
     return S_OK()
 
   #Threaded process function
-  def _processInThread( self, clientTransport ):
+  def _processInThread( self, clientTransport, trid = False, handshakeDone = False ):
     #Handshake
-    try:
-      clientTransport.handshake()
-    except:
-      return
+    if not handshakeDone:
+      try:
+        clientTransport.handshake()
+      except:
+        return
     #Add to the transport pool
     trid = self._transportPool.add( clientTransport )
     if not trid:
@@ -79,6 +84,10 @@ class GatewayService( Service ):
       self._transportPool.close( trid )
     return result
 
+  def _canKeepConnection( self, proposalTuple ):
+    #Forwarded connections are not kept
+    return False
+
   def _receiveAndCheckProposal( self, trid ):
     clientTransport = self._transportPool.get( trid )
     #Get the peer credentials
@@ -188,6 +197,9 @@ class GatewayService( Service ):
     elif actionType == "RPC":
       gLogger.info( "Forwarding %s/%s action to %s for %s" % ( actionType, actionMethod, targetService, idString ) )
       retVal = self.__forwardRPCCall( targetService, clientInitArgs, actionMethod, retVal[ 'Value' ] )
+    elif actionType == "MultiRPC":
+      gLogger.info( "Forwarding %s/%s action to %s for %s" % ( actionType, actionMethod, targetService, idString ) )
+      retVal = self.__forwardMultiRPCCall( targetService, clientInitArgs, retVal[ 'Value' ] )
     elif actionType == "Connection" and actionMethod == "new":
       gLogger.info( "Initiating a messaging connection to %s for %s" % ( targetService, idString ) )
       retVal = self._msgForwarder.addClient( trid, targetService, clientInitArgs, retVal[ 'Value' ] )
@@ -210,11 +222,33 @@ class GatewayService( Service ):
         if clientVersion < serviceVersion:
           retDict[ 'data' ] = gConfigurationData.getCompressedData()
         return S_OK( retDict )
+      if method == "getDeltaSince":
+        #Relay the modifications kept by the gateway
+        serviceVersion = gConfigurationData.getVersion()
+        retDict = { 'newestVersion' : serviceVersion, 'deltas' : [] }
+        clientVersion = params[0]
+        if clientVersion < serviceVersion:
+          retVal = gConfigurationData.getDeltaSince( clientVersion )
+          if not retVal[ 'OK' ]:
+            return retVal
+          retDict[ 'deltas' ] = retVal[ 'Value' ]
+        return S_OK( retDict )
     #Default
     rpcClient = RPCClient( targetService, **clientInitArgs )
     methodObj = getattr( rpcClient, method )
     return methodObj( *params )
 
+  def __forwardMultiRPCCall( self, targetService, clientInitArgs, callsList ):
+    rpcClient = RPCClient( targetService, **clientInitArgs )
+    for method, params in callsList:
+      rpcClient.queueCall( method, *params )
+    retVal = rpcClient.flushCalls()
+    if retVal[ 'OK' ]:
+      for result in retVal[ 'Value' ]:
+        if 'rpcStub' in result:
+          result.pop( 'rpcStub' )
+    return retVal
+
   def __forwardFileTransferCall( self, targetService, clientInitArgs, method,
                                  params, clientTransport ):
     transferRelay = TransferRelay( targetService, **clientInitArgs )
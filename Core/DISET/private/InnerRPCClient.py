@@ -9,32 +9,67 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 class InnerRPCClient( BaseClient ):
 
   def executeRPC( self, functionName, args ):
+    stub = ( self._getBaseStub(), functionName, args )
+    return self.__executeAction( ( "RPC", functionName ), args, stub )
+
+  def executeMultiRPC( self, callsList ):
+    """
+    Execute several calls in one round trip
+      - callsList is a list of ( functionName, args )
+      Returns S_OK( [ result of each call ] )
+    """
+    functionNames = []
+    for functionName, args in callsList:
+      if functionName not in functionNames:
+        functionNames.append( functionName )
+    retVal = self.__executeAction( ( "MultiRPC", ",".join( functionNames ) ), list( callsList ) )
+    if not retVal[ 'OK' ]:
+      #Services that don't know about batches get the calls one by one
+      if retVal[ 'Message' ].find( "is not a known action type" ) > -1:
+        return S_OK( [ self.executeRPC( functionName, args ) for functionName, args in callsList ] )
+      return retVal
+    results = retVal[ 'Value' ]
+    if type( results ) != types.ListType:
+      return S_ERROR( "Received a %s instead of the results of a batch of %s calls" % ( type( results ).__name__,
+                                                                                      len( callsList ) ) )
+    if len( results ) != len( callsList ):
+      return S_ERROR( "Received %s results for a batch of %s calls" % ( len( results ), len( callsList ) ) )
+    baseStub = self._getBaseStub()
+    for iCall in range( len( callsList ) ):
+      if type( results[ iCall ] ) == types.DictType:
+        results[ iCall ][ 'rpcStub' ] = ( baseStub, callsList[ iCall ][0], callsList[ iCall ][1] )
+    return retVal
+
+  def __executeAction( self, action, args, stub = False ):
+    receivedData = False
     try:
-      return self.__serverRPC( functionName, args )
-    except:
-      raise
+      receivedData = self.__serverRPC( action, args, stub )
+      return receivedData
     finally:
-      self._disconnect()
+      #Only connections that completed a successful call are kept
+      self._disconnect( keepConnection = type( receivedData ) == types.DictType and receivedData.get( 'OK', False ) )
 
-  def __serverRPC( self, functionName, args ):
-    stub = ( self._getBaseStub(), functionName, args )
-    retVal = self._connect()
-    try:
+  def __serverRPC( self, action, args, stub ):
+    while True:
+      retVal = self._connect( persistent = True )
       if not retVal[ 'OK' ]:
-        retVal[ 'rpcStub' ] = stub
+        if stub:
+          retVal[ 'rpcStub' ] = stub
         return retVal
       transport = retVal[ 'Value' ]
-      retVal = self._proposeAction( transport, ( "RPC", functionName ) )
-      if not retVal[ 'OK' ]:
-        retVal[ 'rpcStub' ] = stub
-        return retVal
-      retVal = transport.sendData( S_OK( args ) )
-      if not retVal[ 'OK' ]:
-        return retVal
-      receivedData = transport.receiveData()
-      if type( receivedData ) == types.DictType:
-        receivedData[ 'rpcStub' ] = stub
-      return receivedData
-    finally:
+      retVal = self._proposeAction( transport, action )
+      if retVal[ 'OK' ] or not self._isReusedConnection():
+        break
+      #The service may have closed the idle connection. Nothing has been executed yet so try again
       self._disconnect()
-
+    if not retVal[ 'OK' ]:
+      if stub:
+        retVal[ 'rpcStub' ] = stub
+      return retVal
+    retVal = transport.sendData( S_OK( args ) )
+    if not retVal[ 'OK' ]:
+      return retVal
+    receivedData = transport.receiveData()
+    if stub and type( receivedData ) == types.DictType:
+      receivedData[ 'rpcStub' ] = stub
+    return receivedData
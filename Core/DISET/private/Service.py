@@ -1,11 +1,13 @@
 
 import os
 import time
+import types
 import DIRAC
 import threading
 from DIRAC import gConfig, gMonitor, gLogger, S_OK, S_ERROR
 from DIRAC.Core.Utilities import List, Time, MemStat
 from DIRAC.Core.DISET.private.LockManager import LockManager
+from DIRAC.Core.DISET.private.CallStats import CallStats
 from DIRAC.FrameworkSystem.Client.MonitoringClient import MonitoringClient
 from DIRAC.Core.DISET.private.ServiceConfiguration import ServiceConfiguration
 from DIRAC.Core.DISET.private.TransportPool import getGlobalTransportPool
@@ -16,6 +18,7 @@ from DIRAC.Core.Utilities.ThreadPool import ThreadPool
 from DIRAC.Core.Utilities.ReturnValues import isReturnStructure
 from DIRAC.Core.Security import CS
 from DIRAC.Core.DISET.AuthManager import AuthManager
+from DIRAC.Core.DISET.private.Transports.SSL.PeerCredentialsCache import gPeerCredentialsCache
 from DIRAC.FrameworkSystem.Client.SecurityLogClient import SecurityLogClient
 
 class Service:
@@ -23,7 +26,8 @@ class Service:
   SVC_VALID_ACTIONS = { 'RPC' : 'export',
                         'FileTransfer': 'transfer',
                         'Message' : 'msg',
-                        'Connection' : 'Message' }
+                        'Connection' : 'Message',
+                        'MultiRPC' : 'RPC' }
   SVC_SECLOG_CLIENT = SecurityLogClient()
 
   def __init__( self, serviceName ):
@@ -34,13 +38,30 @@ class Service:
     self._monitor = MonitoringClient()
     self.__monitorLastStatsUpdate = time.time()
     self._stats = { 'queries' : 0, 'connections' : 0 }
-    self._authMgr = AuthManager( "%s/Authorization" % self._cfg.getServicePath() )
+    self._authMgr = AuthManager( "%s/Authorization" % self._cfg.getServicePath(),
+                                 self._cfg.getAuthorizationCacheSize() )
+    self.__cacheLastStats = {}
+    self._callStats = CallStats()
     self._transportPool = getGlobalTransportPool()
     self.__cloneId = 0
+    self.__marksForwarder = False
+    self.__persistentConnectionCallback = False
 
-  def setCloneProcessId( self, cloneId ):
+  def setCloneProcessId( self, cloneId, marksForwarder = False ):
+    """
+    Set the id of the clone process running the service. Clones report to
+    the monitoring through the marks forwarder so the marks get aggregated
+    """
     self.__cloneId = cloneId
-    self._monitor.setComponentName( "%s-Clone:%s" % ( self._name, cloneId ) )
+    self.__marksForwarder = marksForwarder
+
+  def setPersistentConnectionCallback( self, callback ):
+    """
+    Set the function that takes care of the connections kept open between
+    calls. It receives the service name and the transport id and returns
+    False if the connection can't be kept
+    """
+    self.__persistentConnectionCallback = callback
 
   def _isMetaAction( self, action ):
     referedAction = Service.SVC_VALID_ACTIONS[ action ]
@@ -75,6 +96,9 @@ class Service:
     self._threadPool = ThreadPool( 1,
                                     max( 0, self._cfg.getMaxThreads() ),
                                     self._cfg.getMaxWaitingPetitions() )
+    self._threadPool.setQueueWaitCallback( self._callStats.addQueueWait )
+    self._threadPool.setTargetQueueLatency( self._cfg.getTargetQueueLatency() )
+    self._maxQueueTime = self._cfg.getMaxQueueTime()
     self._threadPool.daemonize()
     self._msgBroker = MessageBroker( "%sMSB" % self._name, threadPool = self._threadPool )
     #Create static dict
@@ -82,7 +106,9 @@ class Service:
                                'URL' : self._cfg.getURL(),
                                'systemSectionPath' : self._cfg.getSystemPath(),
                                'serviceSectionPath' : self._cfg.getServicePath(),
-                               'messageSender' : MessageSender( self._msgBroker )
+                               'messageSender' : MessageSender( self._msgBroker ),
+                               'callStats' : self._callStats,
+                               'slowCallThreshold' : self._cfg.getSlowCallThreshold()
                              }
     #Call static initialization function
     try:
@@ -98,6 +124,7 @@ class Service:
       return S_ERROR( errMsg )
 
     gThreadScheduler.addPeriodicTask( 30, self.__reportThreadPoolContents )
+    gThreadScheduler.addPeriodicTask( 60, self.__reportCallStats )
 
     return S_OK()
 
@@ -215,6 +242,8 @@ class Service:
     self._monitor.setComponentType( MonitoringClient.COMPONENT_SERVICE )
     self._monitor.setComponentName( self._name )
     self._monitor.initialize()
+    if self.__marksForwarder:
+      self._monitor.setMarksForwarder( self.__marksForwarder )
     self._monitor.registerActivity( "Connections", "Connections received", "Framework", "connections", MonitoringClient.OP_RATE )
     self._monitor.registerActivity( "Queries", "Queries served", "Framework", "queries", MonitoringClient.OP_RATE )
     self._monitor.registerActivity( 'CPU', "CPU Usage", 'Framework', "CPU,%", MonitoringClient.OP_MEAN, 600 )
@@ -222,6 +251,11 @@ class Service:
     self._monitor.registerActivity( 'PendingQueries', "Pending queries", 'Framework', 'queries', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'ActiveQueries', "Active queries", 'Framework', 'threads', MonitoringClient.OP_MEAN )
     self._monitor.registerActivity( 'RunningThreads', "Running threads", 'Framework', 'threads', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'QueueAge', "Age of the oldest pending query", 'Framework', 'seconds', MonitoringClient.OP_MEAN )
+    self._monitor.registerActivity( 'RejectedQueries', "Queries rejected with the queue full", 'Framework', 'queries', MonitoringClient.OP_SUM )
+    self._monitor.registerActivity( 'ShedQueries', "Queries dropped after waiting too long", 'Framework', 'queries', MonitoringClient.OP_SUM )
+    self._monitor.registerActivity( 'AuthCacheHitRatio', "Authorization cache hit ratio", 'Framework', 'hits,%', MonitoringClient.OP_MEAN, 600 )
+    self._monitor.registerActivity( 'PeerCredCacheHitRatio', "Peer credentials cache hit ratio", 'Framework', 'hits,%', MonitoringClient.OP_MEAN, 600 )
 
     self._monitor.setComponentExtraParam( 'DIRACVersion', DIRAC.version )
     self._monitor.setComponentExtraParam( 'platform', DIRAC.platform )
@@ -240,9 +274,35 @@ class Service:
     return S_OK()
 
   def __reportThreadPoolContents( self ):
-    self._monitor.addMark( 'PendingQueries', self._threadPool.pendingJobs() )
-    self._monitor.addMark( 'ActiveQueries', self._threadPool.numWorkingThreads() )
+    queueStats = self._threadPool.getQueueStats()
+    self._monitor.addMark( 'PendingQueries', queueStats[ 'Pending' ] )
+    self._monitor.addMark( 'ActiveQueries', queueStats[ 'Working' ] )
     self._monitor.addMark( 'RunningThreads', threading.activeCount() )
+    self._monitor.addMark( 'QueueAge', queueStats[ 'QueueAge' ] )
+    for activity, key in ( ( 'RejectedQueries', 'Rejected' ), ( 'ShedQueries', 'Shed' ) ):
+      self._monitor.addMark( activity, queueStats[ key ] - self.__cacheLastStats.get( activity, 0 ) )
+      self.__cacheLastStats[ activity ] = queueStats[ key ]
+    self.__reportCacheStats( 'AuthCacheHitRatio', self._authMgr.getCacheStats() )
+    self.__reportCacheStats( 'PeerCredCacheHitRatio', gPeerCredentialsCache.getStats() )
+
+  def __reportCallStats( self ):
+    #Percentiles can't be aggregated by the monitoring, they are calculated here
+    histograms = self._callStats.getAndReset()
+    for name in histograms:
+      histogram = histograms[ name ]
+      for percentile in ( 50, 95, 99 ):
+        activity = "%s p%s" % ( name, percentile )
+        self._monitor.registerActivity( activity, "%s %sth percentile latency" % ( name, percentile ),
+                                        'Latency', 'ms', MonitoringClient.OP_MEAN )
+        self._monitor.addMark( activity, histogram.getPercentile( percentile ) * 1000 )
+
+  def __reportCacheStats( self, activity, cacheStats ):
+    lastHits, lastMisses = self.__cacheLastStats.get( activity, ( 0, 0 ) )
+    hits = cacheStats[ 'Hits' ] - lastHits
+    misses = cacheStats[ 'Misses' ] - lastMisses
+    self.__cacheLastStats[ activity ] = ( cacheStats[ 'Hits' ], cacheStats[ 'Misses' ] )
+    if hits + misses > 0:
+      self._monitor.addMark( activity, hits * 100.0 / ( hits + misses ) )
 
 
   def getConfig( self ):
@@ -250,29 +310,90 @@ class Service:
 
   #End of initialization functions
 
-  def handleConnection( self, clientTransport ):
+  def handleConnection( self, clientTransport, handshakeDone = False ):
+    """
+    Process a new connection in a worker thread. The reactor may have already
+    done the handshake and buffered the proposal
+    """
     self._stats[ 'connections' ] += 1
     gMonitor.setComponentExtraParam( 'queries', self._stats[ 'connections' ] )
-    self._threadPool.generateJobAndQueueIt( self._processInThread,
-                                             args = ( clientTransport, ) )
+    #Never block the reactor, if the queue is full the client is told to come back later
+    result = self._threadPool.generateJobAndQueueIt( self._processInThread,
+                                                      args = ( clientTransport, False, handshakeDone ),
+                                                      blocking = False,
+                                                      maxQueueTime = self._maxQueueTime,
+                                                      oShedCallback = self._shedConnection )
+    if not result[ 'OK' ]:
+      gLogger.verbose( "Rejecting connection, %s is busy" % self._name, result[ 'Message' ] )
+      if handshakeDone:
+        self.__sendBusy( clientTransport )
+      clientTransport.close()
+
+  def handlePersistentConnection( self, trid ):
+    """
+    A connection kept open after a previous call has data to read
+    """
+    result = self._threadPool.generateJobAndQueueIt( self._processInThread,
+                                                      args = ( False, trid ),
+                                                      blocking = False,
+                                                      maxQueueTime = self._maxQueueTime,
+                                                      oShedCallback = self._shedConnection )
+    if not result[ 'OK' ]:
+      gLogger.verbose( "Closing kept connection, %s is busy" % self._name, result[ 'Message' ] )
+      self._transportPool.close( trid )
+
+  def _shedConnection( self, clientTransport, trid = False, handshakeDone = False ):
+    """
+    Called from a worker thread instead of _processInThread when the connection
+    has waited in the queue for longer than MaxQueueTime
+    """
+    if trid:
+      #Kept connections are just closed, the client will open a new one
+      self._transportPool.close( trid )
+      return
+    if not handshakeDone:
+      try:
+        clientTransport.handshake()
+      except:
+        clientTransport.close()
+        return
+    self.__sendBusy( clientTransport )
+    clientTransport.close()
+
+  def __sendBusy( self, clientTransport ):
+    try:
+      clientTransport.sendData( S_ERROR( "%s is busy. Try again later" % self._name ) )
+    except:
+      pass
 
   #Threaded process function
-  def _processInThread( self, clientTransport ):
+  def _processInThread( self, clientTransport, trid = False, handshakeDone = False ):
     self._lockManager.lockGlobal()
     try:
       monReport = self.__startReportToMonitoring()
     except Exception, e:
       monReport = False
     try:
-      #Handshake
-      try:
-        clientTransport.handshake()
-      except:
-        return
-      #Add to the transport pool
-      trid = self._transportPool.add( clientTransport )
       if not trid:
-        return
+        #Handshake
+        if not handshakeDone:
+          try:
+            clientTransport.handshake()
+          except:
+            return
+        #Add to the transport pool
+        trid = self._transportPool.add( clientTransport )
+        if not trid:
+          return
+      else:
+        #Kept connection. The client may have closed it or sent a keep alive
+        result = self._transportPool.receive( trid, 1024, blockAfterKeepAlive = False, idleReceive = True )
+        if not result[ 'OK' ]:
+          self._transportPool.close( trid )
+          return
+        if 'keepAlive' in result:
+          self.__keepConnection( trid )
+          return
       #Receive and check proposal
       result = self._receiveAndCheckProposal( trid )
       if not result[ 'OK' ]:
@@ -290,6 +411,8 @@ class Service:
       #Close the connection if required
       if result[ 'closeTransport' ]:
         self._transportPool.close( trid )
+      elif result.get( 'keepConnection', False ):
+        self.__keepConnection( trid )
       return result
     finally:
       self._lockManager.unlockGlobal()
@@ -297,6 +420,34 @@ class Service:
         self.__endReportToMonitoring( *monReport )
 
 
+  def __keepConnection( self, trid ):
+    if not self.__persistentConnectionCallback or not self.__persistentConnectionCallback( self._name, trid ):
+      self._transportPool.close( trid )
+
+  def _canKeepConnection( self, proposalTuple ):
+    """
+    Only RPC connections are kept, and only if the client asks for it
+    """
+    if not self.__persistentConnectionCallback or len( proposalTuple ) < 4:
+      return False
+    if type( proposalTuple[3] ) != types.DictType or not proposalTuple[3].get( 'keepConnection', False ):
+      return False
+    return proposalTuple[1][0] in ( 'RPC', 'MultiRPC' )
+
+  def _getCompression( self, proposalTuple ):
+    """
+    Compress the big messages if the service has a compression level and the
+    client supports it
+    """
+    if len( proposalTuple ) < 4 or type( proposalTuple[3] ) != types.DictType:
+      return False
+    if 'zlib' not in proposalTuple[3].get( 'compression', [] ):
+      return False
+    level = self._cfg.getCompressionLevel()
+    if not level:
+      return False
+    return { 'zlib' : level, 'threshold' : self._cfg.getCompressionThreshold() }
+
   def _createIdentityString( self, credDict, clientTransport = False ):
     if 'username' in credDict:
       if 'group' in credDict:
@@ -345,6 +496,13 @@ class Service:
     return S_OK( proposalTuple )
 
   def _authorizeProposal( self, actionTuple, trid, credDict ):
+    if actionTuple[0] == 'MultiRPC':
+      #Each method in the batch has to be authorized
+      for method in List.fromChar( actionTuple[1], "," ):
+        result = self._authorizeProposal( ( 'RPC', method ), trid, credDict )
+        if not result[ 'OK' ]:
+          return result
+      return S_OK()
     #Find CS path for the Auth rules
     referedAction = self._isMetaAction( actionTuple[0] )
     if referedAction:
@@ -421,9 +579,22 @@ class Service:
 
   def _processProposal( self, trid, proposalTuple, handlerObj ):
     #Notify the client we're ready to execute the action
-    retVal = self._transportPool.send( trid, S_OK() )
+    keepConnection = self._canKeepConnection( proposalTuple )
+    compression = self._getCompression( proposalTuple )
+    readyMsg = S_OK()
+    if keepConnection:
+      readyMsg[ 'keepConnection' ] = True
+    if compression:
+      readyMsg[ 'compression' ] = compression
+    retVal = self._transportPool.send( trid, readyMsg )
     if not retVal[ 'OK' ]:
       return retVal
+    clientTransport = self._transportPool.get( trid )
+    if clientTransport:
+      if compression:
+        clientTransport.setCompression( compression[ 'zlib' ], compression[ 'threshold' ] )
+      else:
+        clientTransport.setCompression( 0 )
 
     messageConnection = False
     if proposalTuple[1] == ( 'Connection', 'new' ):
@@ -447,7 +618,8 @@ class Service:
       self._msgBroker.listenToTransport( trid )
       result = self._mbConnect( trid, handlerObj )
 
-    result[ 'closeTransport' ] = not messageConnection
+    result[ 'keepConnection' ] = keepConnection and result[ 'OK' ]
+    result[ 'closeTransport' ] = not messageConnection and not result[ 'keepConnection' ]
     return result
 
   def _mbConnect( self, trid, handlerObj = False ):
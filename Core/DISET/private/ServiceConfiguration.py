@@ -56,6 +56,18 @@ class ServiceConfiguration:
     except:
       return 500
 
+  def getMaxQueueTime( self ):
+    try:
+      return float( self.getOption( "MaxQueueTime" ) )
+    except:
+      return 0
+
+  def getTargetQueueLatency( self ):
+    try:
+      return float( self.getOption( "TargetQueueLatency" ) )
+    except:
+      return 0.5
+
   def getMaxMessagingConnections( self ):
     try:
       return int( self.getOption( "MaxMessagingConnections" ) )
@@ -68,6 +80,54 @@ class ServiceConfiguration:
     except:
       return 15
 
+  def getMaxPersistentConnections( self ):
+    try:
+      return int( self.getOption( "MaxPersistentConnections" ) )
+    except:
+      return 100
+
+  def getPersistentConnectionIdleTime( self ):
+    try:
+      return int( self.getOption( "PersistentConnectionIdleTime" ) )
+    except:
+      return 300
+
+  def getReactorMode( self ):
+    optionValue = self.getOption( "ReactorMode" )
+    if optionValue:
+      return optionValue.lower()
+    return "select"
+
+  def getProposalTimeout( self ):
+    try:
+      return int( self.getOption( "ProposalTimeout" ) )
+    except:
+      return 60
+
+  def getAuthorizationCacheSize( self ):
+    try:
+      return int( self.getOption( "AuthorizationCacheSize" ) )
+    except:
+      return 1000
+
+  def getCompressionLevel( self ):
+    try:
+      return max( 0, min( 9, int( self.getOption( "CompressionLevel" ) ) ) )
+    except:
+      return 0
+
+  def getCompressionThreshold( self ):
+    try:
+      return int( self.getOption( "CompressionThreshold" ) )
+    except:
+      return 16384
+
+  def getSlowCallThreshold( self ):
+    try:
+      return float( self.getOption( "SlowCallThreshold" ) )
+    except:
+      return 10
+
   def getCloneProcesses( self ):
     try:
       return int( self.getOption( "CloneProcesses" ) )
@@ -1,45 +1,51 @@
 # $HeadURL$
-__RCSID__ = "$Id$"
+__RCSID__ = "$Id$"
 
-import time
+import time
+import zlib
 import select
 try:
   from hashlib import md5
 except:
   from md5 import md5
 
-from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
-from DIRAC.Core.Utilities import DEncode
-from DIRAC.FrameworkSystem.Client.Logger import gLogger
-
-class BaseTransport:
-
-  bAllowReuseAddress = True
-  iListenQueueSize = 5
+from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
+from DIRAC.Core.Utilities import DEncode
+from DIRAC.FrameworkSystem.Client.Logger import gLogger
+
+class BaseTransport:
+
+  bAllowReuseAddress = True
+  iListenQueueSize = 5
   iReadTimeout = 600
-  keepAliveMagic = "dka"
-
-  def __init__( self, stServerAddress, bServerMode = False, **kwargs ):
-    self.bServerMode = bServerMode
-    self.extraArgsDict = kwargs
-    self.byteStream = ""
-    self.packetSize = 1048576 #1MiB
-    self.stServerAddress = stServerAddress
-    self.peerCredentials = {}
-    self.remoteAddress = False
+  keepAliveMagic = "dka"
+  compressedMagic = "z"
+
+  def __init__( self, stServerAddress, bServerMode = False, **kwargs ):
+    self.bServerMode = bServerMode
+    self.extraArgsDict = kwargs
+    self.byteStream = ""
+    self.packetSize = 1048576 #1MiB
+    self.stServerAddress = stServerAddress
+    self.peerCredentials = {}
+    self.remoteAddress = False
     self.appData = ""
     self.startedKeepAlives = set()
     self.keepAliveId = md5( str( stServerAddress ) + str( bServerMode ) ).hexdigest()
     self.receivedMessages = []
     self.sentKeepAlives = 0
     self.waitingForKeepAlivePong = False
+    self.__compressionLevel = 0
+    self.__compressionThreshold = 0
+    self.__encodeTime = 0.0
+    self.__decodeTime = 0.0
     self.__keepAliveLapse = 0
     if 'keepAliveLapse' in kwargs:
       try:
         self.__keepAliveLapse = max( 150, int( kwargs[ 'keepAliveLapse' ] ) )
       except:
         pass
-    self.__lastActionTimestamp = time.time()
+    self.__lastActionTimestamp = time.time()
     self.__lastServerRenewTimestamp = self.__lastActionTimestamp
 
   def __updateLastActionTimestamp( self ):
@@ -50,14 +56,42 @@ class BaseTransport:
 
   def getKeepAliveLapse( self ):
     return self.__keepAliveLapse
-
-  def handshake( self ):
-    pass
-
-  def setAppData( self, appData ):
-    self.appData = appData
-
-  def getAppData( self ):
+
+  def setCompression( self, level, threshold = 16384 ):
+    """
+    Compress the messages bigger than threshold bytes with zlib. Only to be
+    enabled once the peer has agreed to it. Level 0 disables it
+    """
+    self.__compressionLevel = max( 0, min( 9, level ) )
+    self.__compressionThreshold = threshold
+
+  def getCompression( self ):
+    return self.__compressionLevel
+
+  def getCodecTimes( self ):
+    """
+    Get the seconds spent encoding and decoding messages since the last call
+    """
+    codecTimes = ( self.__encodeTime, self.__decodeTime )
+    self.__encodeTime = 0.0
+    self.__decodeTime = 0.0
+    return codecTimes
+
+  def handshake( self ):
+    pass
+
+  def handshakeStep( self ):
+    """
+    Advance the handshake without blocking
+      Returns S_OK( True ) once the handshake is done
+    """
+    self.handshake()
+    return S_OK( True )
+
+  def setAppData( self, appData ):
+    self.appData = appData
+
+  def getAppData( self ):
     return self.appData
 
   def renewServerContext( self ):
@@ -65,107 +99,204 @@ class BaseTransport:
     return S_OK()
 
   def latestServerRenewTime( self ):
-    return self.__lastServerRenewTimestamp
-
-  def getConnectingCredentials( self ):
-    return self.peerCredentials
-
-  def setExtraCredentials( self, group ):
-    self.peerCredentials[ 'extraCredentials' ] = group
-
-  def serverMode( self ):
-    return self.bServerMode
-
-  def getTransportName( self ):
-    return self.sTransportName
-
-  def getRemoteAddress( self ):
-    return self.remoteAddress
-
-  def getLocalAddress( self ):
-    return self.oSocket.getsockname()
-
-  def getSocket( self ):
-    return self.oSocket
-
-  def _write( self, sBuffer ):
-    self.oSocket.send( sBuffer )
-
-  def _readReady( self ):
-    if not self.iReadTimeout:
-      return True
-    inList, dummy, dummy = select.select( [ self.oSocket ], [], [], self.iReadTimeout )
-    if self.oSocket in inList:
-      return True
-    return False
-
-  def _read( self, bufSize = 4096, skipReadyCheck = False ):
-    try:
-      if skipReadyCheck or self._readReady():
-        data = self.oSocket.recv( bufSize )
-        if not data:
-          return S_ERROR( "Connection closed by peer" )
-        else:
-          return S_OK( data )
-      else:
-        return S_ERROR( "Connection seems stalled. Closing..." )
-    except Exception, e:
-      return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
-
-  def _write( self, buffer ):
-    return S_OK( self.oSocket.send( buffer ) )
-
+    return self.__lastServerRenewTimestamp
+
+  def getConnectingCredentials( self ):
+    return self.peerCredentials
+
+  def setExtraCredentials( self, group ):
+    self.peerCredentials[ 'extraCredentials' ] = group
+
+  def serverMode( self ):
+    return self.bServerMode
+
+  def getTransportName( self ):
+    return self.sTransportName
+
+  def getRemoteAddress( self ):
+    return self.remoteAddress
+
+  def getLocalAddress( self ):
+    return self.oSocket.getsockname()
+
+  def getSocket( self ):
+    return self.oSocket
+
+  def _write( self, sBuffer ):
+    self.oSocket.send( sBuffer )
+
+  def _readReady( self ):
+    if not self.iReadTimeout:
+      return True
+    inList, dummy, dummy = select.select( [ self.oSocket ], [], [], self.iReadTimeout )
+    if self.oSocket in inList:
+      return True
+    return False
+
+  def _read( self, bufSize = 4096, skipReadyCheck = False ):
+    try:
+      if skipReadyCheck or self._readReady():
+        data = self.oSocket.recv( bufSize )
+        if not data:
+          return S_ERROR( "Connection closed by peer" )
+        else:
+          return S_OK( data )
+      else:
+        return S_ERROR( "Connection seems stalled. Closing..." )
+    except Exception, e:
+      return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+
+  def _write( self, buffer ):
+    return S_OK( self.oSocket.send( buffer ) )
+
+  def _readAvailable( self, bufSize = 4096 ):
+    """
+    Read without blocking. Returns S_OK( "" ) if there's nothing to read yet
+    """
+    try:
+      inList, dummy, dummy = select.select( [ self.oSocket ], [], [], 0 )
+    except Exception, e:
+      return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+    if not inList:
+      return S_OK( "" )
+    retVal = self._read( bufSize, skipReadyCheck = True )
+    if retVal[ 'OK' ] and not retVal[ 'Value' ]:
+      return S_ERROR( "Peer closed connection" )
+    return retVal
+
+  def receiveAvailableData( self, maxBufferSize = 0 ):
+    """
+    Buffer the data the peer has already sent, without blocking
+      Returns S_OK( True ) once a whole message is buffered, so that receiveData
+      can get it without waiting for the peer
+    """
+    self.__updateLastActionTimestamp()
+    if self.receivedMessages or self.__isMessageBuffered():
+      return S_OK( True )
+    retVal = self._readAvailable( 16384 )
+    if not retVal[ 'OK' ]:
+      return retVal
+    self.byteStream += retVal[ 'Value' ]
+    if self.__isMessageBuffered():
+      return S_OK( True )
+    if maxBufferSize and len( self.byteStream ) > maxBufferSize:
+      return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+    return S_OK( False )
+
+  def __isMessageBuffered( self ):
+    offset = 0
+    #A keep alive is followed by its data
+    if self.byteStream.find( BaseTransport.keepAliveMagic, 0, len( BaseTransport.keepAliveMagic ) ) == 0:
+      offset = len( BaseTransport.keepAliveMagic )
+    if self.byteStream[ offset : offset + 1 ] == BaseTransport.compressedMagic:
+      offset += 1
+    iSeparatorPosition = self.byteStream.find( ":", offset, offset + 10 )
+    if iSeparatorPosition == -1:
+      #Not a valid header. receiveData will complain about it
+      return len( self.byteStream ) >= offset + 10
+    try:
+      size = int( self.byteStream[ offset : iSeparatorPosition ] )
+    except ValueError:
+      return True
+    return len( self.byteStream ) > iSeparatorPosition + size
+
   def sendData( self, uData, prefix = False ):
-    self.__updateLastActionTimestamp()
-    sCodedData = DEncode.encode( uData )
-    if prefix:
-      dataToSend = "%s%s:%s" % ( prefix, len( sCodedData ), sCodedData )
-    else:
-      dataToSend = "%s:%s" % ( len( sCodedData ), sCodedData )
-    for index in range( 0, len( dataToSend ), self.packetSize ):
-      bytesToSend = len( dataToSend[ index : index + self.packetSize ] )
-      packSentBytes = 0
-      while packSentBytes < bytesToSend:
-        try:
-          result = self._write( dataToSend[ index + packSentBytes : index + bytesToSend ] )
-          if not result[ 'OK' ]:
-            return result
-          sentBytes = result[ 'Value' ]
-        except Exception, e:
-          return S_ERROR( "Exception while sending data: %s" % e )
-        if sentBytes == 0:
-          return S_ERROR( "Connection closed by peer" )
-        packSentBytes += sentBytes
-    return S_OK()
-
-
+    self.__updateLastActionTimestamp()
+    #Encoded once in chunks, they are kept until the size for the header is known
+    codedChunks = []
+    codedSize = 0
+    compressor = False
+    encodeStart = time.time()
+    for chunk in DEncode.encodeInChunks( uData, self.packetSize ):
+      #Only the last chunk can be smaller than the packet size
+      if not codedChunks and self.__compressionLevel and len( chunk ) > self.__compressionThreshold:
+        compressor = zlib.compressobj( self.__compressionLevel )
+        compressedData = []
+      if compressor:
+        compressedData.append( compressor.compress( chunk ) )
+      codedChunks.append( chunk )
+      codedSize += len( chunk )
+    if compressor:
+      compressedData.append( compressor.flush() )
+      compressedData = "".join( compressedData )
+    self.__encodeTime += time.time() - encodeStart
+    if not prefix:
+      prefix = ""
+    #Data that doesn't compress is sent as is
+    if compressor and len( compressedData ) < codedSize:
+      codedChunks = False
+      header = "%s%s%s:" % ( prefix, BaseTransport.compressedMagic, len( compressedData ) )
+      return self.__sendMessage( header, [ compressedData ] )
+    compressedData = False
+    header = "%s%s:" % ( prefix, codedSize )
+    return self.__sendMessage( header, codedChunks )
+
+  def __sendMessage( self, header, chunks ):
+    #The header goes in the first write and a small last chunk in the previous one.
+    #A small write after a big one waits for its ACK (Nagle + delayed ACK)
+    chunks[0] = header + chunks[0]
+    if len( chunks ) > 1 and len( chunks[-1] ) < self.packetSize / 16:
+      lastChunk = chunks.pop()
+      chunks[-1] += lastChunk
+    for chunk in chunks:
+      result = self.__sendBuffer( chunk )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK()
+
+  def __sendBuffer( self, dataToSend ):
+    #Packets are sent from read only views of the data instead of slices
+    dataLength = len( dataToSend )
+    sentBytes = 0
+    while sentBytes < dataLength:
+      bytesToSend = min( self.packetSize, dataLength - sentBytes )
+      #Don't leave a small packet for the end
+      if dataLength - sentBytes - bytesToSend < self.packetSize / 16:
+        bytesToSend = dataLength - sentBytes
+      if bytesToSend == dataLength:
+        packet = dataToSend
+      else:
+        packet = buffer( dataToSend, sentBytes, bytesToSend )
+      try:
+        result = self._write( packet )
+        if not result[ 'OK' ]:
+          return result
+        packSentBytes = result[ 'Value' ]
+      except Exception, e:
+        return S_ERROR( "Exception while sending data: %s" % e )
+      if packSentBytes == 0:
+        return S_ERROR( "Connection closed by peer" )
+      sentBytes += packSentBytes
+    return S_OK()
+
+
   def receiveData( self, maxBufferSize = 0, blockAfterKeepAlive = True, idleReceive = False ):
     self.__updateLastActionTimestamp()
     if self.receivedMessages:
       return self.receivedMessages.pop( 0 )
     #Buffer size can't be less than 0
-    maxBufferSize = max( maxBufferSize, 0 )
+    maxBufferSize = max( maxBufferSize, 0 )
     try:
-      #Look either for message length of keep alive magic string
-      iSeparatorPosition = self.byteStream.find( ":", 0, 10 )
+      #Look either for message length of keep alive magic string
+      iSeparatorPosition = self.byteStream.find( ":", 0, 11 )
       keepAliveMagicLen = len( BaseTransport.keepAliveMagic )
       isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
-      #While not found the message length or the ka, keep receiving
-      while iSeparatorPosition == -1 and not isKeepAlive:
+      #While not found the message length or the ka, keep receiving
+      while iSeparatorPosition == -1 and not isKeepAlive:
         retVal = self._read( 1024 )
-        #If error return
-        if not retVal[ 'OK' ]:
+        #If error return
+        if not retVal[ 'OK' ]:
           return retVal
-        #If closed return error
-        if not retVal[ 'Value' ]:
+        #If closed return error
+        if not retVal[ 'Value' ]:
           return S_ERROR( "Peer closed connection" )
-        #New data!
+        #New data!
         self.byteStream += retVal[ 'Value' ]
-        #Look again for either message length of ka magic string
-        iSeparatorPosition = self.byteStream.find( ":", 0, 10 )
+        #Look again for either message length of ka magic string
+        iSeparatorPosition = self.byteStream.find( ":", 0, 11 )
         isKeepAlive = self.byteStream.find( BaseTransport.keepAliveMagic, 0, keepAliveMagicLen ) == 0
-        #Over the limit?
-        if maxBufferSize and len( self.byteStream ) > maxBufferSize and iSeparatorPosition == -1 :
+        #Over the limit?
+        if maxBufferSize and len( self.byteStream ) > maxBufferSize and iSeparatorPosition == -1 :
           return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
       #Keep alive magic!
       if isKeepAlive:
@@ -174,36 +305,110 @@ class BaseTransport:
         self.byteStream = self.byteStream[ keepAliveMagicLen: ]
         return self.__processKeepAlive( maxBufferSize, blockAfterKeepAlive )
       #From here it must be a real message!
-      #Process the size and remove the msg length from the bytestream
-      size = int( self.byteStream[ :iSeparatorPosition ] )
+      #Process the size and remove the msg length from the bytestream
+      isCompressed = self.byteStream[ :1 ] == BaseTransport.compressedMagic
+      if isCompressed:
+        size = int( self.byteStream[ 1:iSeparatorPosition ] )
+      else:
+        size = int( self.byteStream[ :iSeparatorPosition ] )
       self.byteStream = self.byteStream[ iSeparatorPosition + 1: ]
-      #Receive while there's still data to be received 
-      while len( self.byteStream ) < size:
-        retVal = self._read( size - len( self.byteStream ), skipReadyCheck = True )
-        if not retVal[ 'OK' ]:
-          return retVal
-        if not retVal[ 'Value' ]:
-          return S_ERROR( "Peer closed connection" )
-        self.byteStream += retVal[ 'Value' ]
-        if maxBufferSize and len( self.byteStream ) > maxBufferSize:
-          return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
-      #Data is here! take it out from the bytestream, dencode and return
-      data = self.byteStream[ :size ]
-      self.byteStream = self.byteStream[ size: ]
+      #Big and compressed messages are decoded while they arrive
+      if size > self.packetSize or isCompressed:
+        retVal = self.__receiveInChunks( size, maxBufferSize, isCompressed )
+        if not retVal[ 'OK' ]:
+          return retVal
+        data = retVal[ 'Value' ]
+        if idleReceive:
+          self.receivedMessages.append( data )
+          return S_OK()
+        return data
+      if len( self.byteStream ) < size:
+        retVal = self.__receiveMessage( size, maxBufferSize )
+        if not retVal[ 'OK' ]:
+          return retVal
+        data = retVal[ 'Value' ]
+      else:
+        #Data is here! take it out from the bytestream
+        data = self.byteStream[ :size ]
+        self.byteStream = self.byteStream[ size: ]
       try:
+        decodeStart = time.time()
         data = DEncode.decode( data )[0]
+        self.__decodeTime += time.time() - decodeStart
       except Exception, e:
         return S_ERROR( "Could not decode received data: %s" % str( e ) )
       if idleReceive:
         self.receivedMessages.append( data )
         return S_OK()
       return data
-    except Exception, e:
-      gLogger.exception( "Network error while receiving data" )
+    except Exception, e:
+      gLogger.exception( "Network error while receiving data" )
       return S_ERROR( "Network error while receiving data: %s" % str( e ) )
 
+  def __receiveMessage( self, size, maxBufferSize ):
+    """
+    Receive the rest of a message of known size. The pieces are joined once
+    instead of growing the bytestream with every read
+    """
+    if maxBufferSize and size > maxBufferSize:
+      return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+    pieces = [ self.byteStream ]
+    received = len( self.byteStream )
+    self.byteStream = ""
+    while received < size:
+      retVal = self._read( size - received, skipReadyCheck = True )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if not retVal[ 'Value' ]:
+        return S_ERROR( "Peer closed connection" )
+      pieces.append( retVal[ 'Value' ] )
+      received += len( retVal[ 'Value' ] )
+    return S_OK( "".join( pieces ) )
+
+  def __receiveInChunks( self, size, maxBufferSize, isCompressed = False ):
+    decoder = DEncode.StreamDecoder()
+    if isCompressed:
+      decompressor = zlib.decompressobj()
+    decodedSize = 0
+    received = min( size, len( self.byteStream ) )
+    data = self.byteStream[ :received ]
+    self.byteStream = self.byteStream[ received: ]
+    while True:
+      try:
+        if isCompressed:
+          #The limit applies to the decompressed data too
+          if maxBufferSize:
+            data = decompressor.decompress( data, maxBufferSize + 1 - decodedSize )
+          else:
+            data = decompressor.decompress( data )
+          if received == size:
+            data += decompressor.flush()
+          decodedSize += len( data )
+          if maxBufferSize and decodedSize > maxBufferSize:
+            return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+        decodeStart = time.time()
+        decoder.feed( data )
+        self.__decodeTime += time.time() - decodeStart
+      except Exception, e:
+        return S_ERROR( "Could not decode received data: %s" % str( e ) )
+      if received >= size:
+        break
+      retVal = self._read( min( size - received, self.packetSize ), skipReadyCheck = True )
+      if not retVal[ 'OK' ]:
+        return retVal
+      if not retVal[ 'Value' ]:
+        return S_ERROR( "Peer closed connection" )
+      data = retVal[ 'Value' ]
+      received += len( data )
+      if maxBufferSize and received > maxBufferSize:
+        return S_ERROR( "Read limit exceeded (%s chars)" % maxBufferSize )
+    try:
+      return S_OK( decoder.getObject() )
+    except Exception, e:
+      return S_ERROR( "Could not decode received data: %s" % str( e ) )
+
   def __processKeepAlive( self, maxBufferSize, blockAfterKeepAlive = True ):
-    gLogger.debug( "Received Keep Alive" )
+    gLogger.debug( "Received Keep Alive" )
     #Next message down the stream will be the ka data
     result = self.receiveData( maxBufferSize, blockAfterKeepAlive = False )
     if not result[ 'OK' ]:
@@ -231,7 +436,7 @@ class BaseTransport:
       return result
     #Let's listen for the next message downstream
     return self.receiveData( maxBufferSize, blockAfterKeepAlive )
-
+
   def sendKeepAlive( self, responseId = None, now = False ):
     #If not responseId or not keepAliveLapse or not enough time has passed don't send keep alive
     if not responseId:
@@ -84,19 +84,22 @@ class PlainTransport( BaseTransport ):
       except Exception, e:
         return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
 
-  def _write( self, buffer ):
+  def _write( self, sBuffer ):
     sentBytes = 0
     timeout = False
     if 'timeout' in self.extraArgsDict:
       timeout = self.extraArgsDict[ 'timeout' ]
     if timeout:
       start = time.time()
-    while sentBytes < len( buffer ):
+    while sentBytes < len( sBuffer ):
       try:
         if timeout:
           if time.time() - start > timeout:
             return S_ERROR( "Socket write timeout exceeded" )
-        sent = self.oSocket.send( buffer[ sentBytes: ] )
+        if sentBytes:
+          sent = self.oSocket.send( buffer( sBuffer, sentBytes ) )
+        else:
+          sent = self.oSocket.send( sBuffer )
         if sent == 0:
           return S_ERROR( "Connection closed by peer" )
         if sent > 0:
@@ -0,0 +1,59 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import time
+import threading
+from DIRAC.Core.Utilities.LRUCache import LRUCache
+
+class PeerCredentialsCache:
+  """
+  Credentials derived from the peer chains, kept until the first certificate
+  in the chain expires. Entries are keyed by a digest of the whole chain
+  """
+
+  def __init__( self, maxSize = 2000 ):
+    self.__cache = LRUCache( maxSize )
+    self.__lock = threading.Lock()
+    self.__hits = 0
+    self.__misses = 0
+
+  def get( self, chainDigest ):
+    """
+    Get the credentials for a chain digest
+      Returns a copy of the credentials dict or False if not cached or expired
+    """
+    entry = self.__cache.get( chainDigest )
+    if entry is not None and entry[0] > time.time():
+      self.__count( True )
+      return dict( entry[1] )
+    if entry is not None:
+      self.__cache.delete( chainDigest )
+    self.__count( False )
+    return False
+
+  def add( self, chainDigest, credDict, expirationTime ):
+    """
+    Keep the credentials for a chain until expirationTime ( epoch )
+    """
+    if expirationTime <= time.time():
+      return
+    self.__cache.add( chainDigest, ( expirationTime, dict( credDict ) ) )
+
+  def purgeAll( self ):
+    self.__cache.purgeAll()
+
+  def getStats( self ):
+    return { 'Size' : len( self.__cache ), 'MaxSize' : self.__cache.getMaxSize(),
+             'Hits' : self.__hits, 'Misses' : self.__misses }
+
+  def __count( self, hit ):
+    self.__lock.acquire()
+    try:
+      if hit:
+        self.__hits += 1
+      else:
+        self.__misses += 1
+    finally:
+      self.__lock.release()
+
+gPeerCredentialsCache = PeerCredentialsCache()
@@ -5,11 +5,16 @@ import time
 import copy
 import os.path
 import threading
+try:
+  from hashlib import sha1
+except ImportError:
+  from sha import new as sha1
 import GSI
 from DIRAC.Core.Utilities.ReturnValues import S_ERROR, S_OK
 from DIRAC.Core.Utilities.Network import checkHostsMatch
 from DIRAC.Core.Security import Locations
 from DIRAC.Core.Security.X509Chain import X509Chain
+from DIRAC.Core.DISET.private.Transports.SSL.PeerCredentialsCache import gPeerCredentialsCache
 from DIRAC.FrameworkSystem.Client.Logger import gLogger
 
 class SocketInfo:
@@ -54,6 +59,26 @@ class SocketInfo:
     #Servers don't receive the whole chain, the last cert comes alone
     if not self.infoDict[ 'clientMode' ]:
       certList.insert( 0, self.sslSocket.get_peer_certificate() )
+      #The same chains reconnect many times, reuse what was derived from them
+      chainDigest = self.__getChainDigest( certList )
+      credDict = gPeerCredentialsCache.get( chainDigest )
+      if not credDict:
+        credDict = self.__derivePeerCredentials( certList )
+        remainingSecs = credDict[ 'x509Chain' ].getRemainingSecs()
+        if remainingSecs[ 'OK' ]:
+          gPeerCredentialsCache.add( chainDigest, credDict, time.time() + remainingSecs[ 'Value' ] )
+    else:
+      credDict = self.__derivePeerCredentials( certList )
+    self.infoDict[ 'peerCredentials' ] = credDict
+    return credDict
+
+  def __getChainDigest( self, certList ):
+    chainHash = sha1()
+    for cert in certList:
+      chainHash.update( GSI.crypto.dump_certificate( GSI.crypto.FILETYPE_PEM, cert ) )
+    return chainHash.hexdigest()
+
+  def __derivePeerCredentials( self, certList ):
     peerChain = X509Chain( certList = certList )
     isProxyChain = peerChain.isProxy()['Value']
     isLimitedProxyChain = peerChain.isLimitedProxy()['Value']
@@ -69,7 +94,6 @@ class SocketInfo:
     diracGroup = peerChain.getDIRACGroup()
     if diracGroup[ 'OK' ] and diracGroup[ 'Value' ]:
       credDict[ 'group' ] = diracGroup[ 'Value' ]
-    self.infoDict[ 'peerCredentials' ] = credDict
     return credDict
 
   def setSSLSocket( self, sslSocket ):
@@ -298,9 +322,31 @@ class SocketInfo:
     return self.__sslHandshake()
 
   def doServerHandshake( self ):
-    self.sslSocket.set_accept_state()
+    self.startServerHandshake()
     return self.__sslHandshake()
 
+  def startServerHandshake( self ):
+    self.sslSocket.set_accept_state()
+
+  def doHandshakeStep( self ):
+    """
+    Advance the handshake with the data already received, without blocking
+      Returns S_OK( False ) while more data from the peer is needed and
+      S_OK( credentialsDict ) once the handshake is done
+    """
+    try:
+      self.sslSocket.do_handshake()
+    except ( GSI.SSL.WantReadError, GSI.SSL.WantWriteError ):
+      return S_OK( False )
+    except GSI.SSL.Error, v:
+      #gLogger.warn( "Error while handshaking", "\n".join( [ stError[2] for stError in v.args[0] ] ) )
+      gLogger.warn( "Error while handshaking", v )
+      return S_ERROR( "Error while handshaking" )
+    except Exception, v:
+      gLogger.warn( "Error while handshaking", v )
+      return S_ERROR( "Error while handshaking" )
+    return self.__handshakeDone()
+
   #@gSynchro
   def __sslHandshake( self ):
     start = time.time()
@@ -309,20 +355,12 @@ class SocketInfo:
       if timeout:
         if time.time() - start > timeout:
           return S_ERROR( "Handshake timeout exceeded" )
-      try:
-        self.sslSocket.do_handshake()
-        break
-      except GSI.SSL.WantReadError:
-        time.sleep( 0.1 )
-      except GSI.SSL.WantWriteError:
-        time.sleep( 0.1 )
-      except GSI.SSL.Error, v:
-        #gLogger.warn( "Error while handshaking", "\n".join( [ stError[2] for stError in v.args[0] ] ) )
-        gLogger.warn( "Error while handshaking", v )
-        return S_ERROR( "Error while handshaking" )
-      except Exception, v:
-        gLogger.warn( "Error while handshaking", v )
-        return S_ERROR( "Error while handshaking" )
+      retVal = self.doHandshakeStep()
+      if not retVal[ 'OK' ] or retVal[ 'Value' ]:
+        return retVal
+      time.sleep( 0.1 )
+
+  def __handshakeDone( self ):
     credentialsDict = self.gatherPeerCredentials()
     if self.infoDict[ 'clientMode' ]:
       hostnameCN = credentialsDict[ 'CN' ]
@@ -23,6 +23,7 @@ class SSLTransport( BaseTransport ):
   def __init__( self, *args, **kwargs ):
     self.__writesDone = 0
     self.__locked = False
+    self.__handshakeStarted = False
     BaseTransport.__init__( self, *args, **kwargs )
 
   def __lock( self, timeout = 1000 ):
@@ -87,7 +88,19 @@ class SSLTransport( BaseTransport ):
     retVal = self.oSocketInfo.doServerHandshake()
     if not retVal[ 'OK' ]:
       return retVal
-    creds = retVal[ 'Value' ]
+    self.__setPeerCredentials( retVal[ 'Value' ] )
+
+  def handshakeStep( self ):
+    if not self.__handshakeStarted:
+      self.oSocketInfo.startServerHandshake()
+      self.__handshakeStarted = True
+    retVal = self.oSocketInfo.doHandshakeStep()
+    if not retVal[ 'OK' ] or not retVal[ 'Value' ]:
+      return retVal
+    self.__setPeerCredentials( retVal[ 'Value' ] )
+    return S_OK( True )
+
+  def __setPeerCredentials( self, creds ):
     if not self.oSocket.session_reused():
       gLogger.debug( "New session connecting from client at %s" % str( self.getRemoteAddress() ) )
     for key in creds.keys():
@@ -135,10 +148,29 @@ class SSLTransport( BaseTransport ):
     finally:
       self.__unlock()
 
+  def _readAvailable( self, bufSize = 4096 ):
+    self.__lock()
+    try:
+      data = ""
+      while True:
+        try:
+          data += self.oSocket.recv( bufSize )
+        except ( GSI.SSL.WantReadError, GSI.SSL.WantWriteError ):
+          return S_OK( data )
+        except GSI.SSL.ZeroReturnError:
+          return S_ERROR( "Peer closed connection" )
+        except Exception, e:
+          return S_ERROR( "Exception while reading from peer: %s" % str( e ) )
+        #Decrypted data doesn't wake up the poller
+        if not self.oSocket.pending():
+          return S_OK( data )
+    finally:
+      self.__unlock()
+
   def isLocked( self ):
     return self.__locked
 
-  def _write( self, buffer ):
+  def _write( self, sBuffer ):
     self.__lock()
     try:
       #Renegotiation
@@ -159,12 +191,15 @@ class SSLTransport( BaseTransport ):
       timeout = self.oSocketInfo.infoDict[ 'timeout' ]
       if timeout:
         start = time.time()
-      while sentBytes < len( buffer ):
+      while sentBytes < len( sBuffer ):
         try:
           if timeout:
             if time.time() - start > timeout:
               return S_ERROR( "Socket write timeout exceeded" )
-          sent = self.oSocket.write( buffer[ sentBytes: ] )
+          if sentBytes:
+            sent = self.oSocket.write( buffer( sBuffer, sentBytes ) )
+          else:
+            sent = self.oSocket.write( sBuffer )
           if sent == 0:
             return S_ERROR( "Connection closed by peer" )
           if sent > 0:
@@ -0,0 +1,84 @@
+########################################################################
+# $HeadURL $
+# File: TransportBenchmark.py
+########################################################################
+
+""" Throughput benchmark of the DISET transports
+
+    Sends messages from 1 KiB to 100 MiB from a client to a server transport
+    in the same process and measures the throughput of the framing. The dips
+    protocol needs the host certificate and the CAs of the installation.
+
+    python TransportBenchmark.py [ protocol [ protocol ... ] ]
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+import threading
+from DIRAC.Core.DISET.private.Protocols import gProtocolDict
+
+MESSAGE_SIZES = ( 1024, 65536, 1048576, 10485760, 104857600 )
+
+def serve( serverTransport ):
+  """ receive messages and reply with their length until the client closes """
+  result = serverTransport.acceptConnection()
+  if not result[ 'OK' ]:
+    print "Cannot accept connection: %s" % result[ 'Message' ]
+    return
+  clientTransport = result[ 'Value' ]
+  clientTransport.handshake()
+  while True:
+    result = clientTransport.receiveData()
+    if not result[ 'OK' ]:
+      break
+    clientTransport.sendData( { 'OK' : True, 'Value' : len( result[ 'Value' ] ) } )
+  clientTransport.close()
+
+def benchmark( protocol, port ):
+  transportClass = gProtocolDict[ protocol ][ 'transport' ]
+  serverTransport = transportClass( ( "", port ), bServerMode = True )
+  result = serverTransport.initAsServer()
+  if not result[ 'OK' ]:
+    print "Cannot listen with %s: %s" % ( protocol, result[ 'Message' ] )
+    return
+  serverThread = threading.Thread( target = serve, args = ( serverTransport, ) )
+  serverThread.setDaemon( 1 )
+  serverThread.start()
+  client = transportClass( ( "localhost", port ), timeout = 600 )
+  result = client.initAsClient()
+  if not result[ 'OK' ]:
+    print "Cannot connect with %s: %s" % ( protocol, result[ 'Message' ] )
+    return
+  print "%s" % protocol
+  for size in MESSAGE_SIZES:
+    payload = "x" * size
+    repetitions = max( 1, min( 1000, 10485760 / size ) )
+    start = time.time()
+    for i in range( repetitions ):
+      result = client.sendData( { 'OK' : True, 'Value' : payload } )
+      if result[ 'OK' ]:
+        result = client.receiveData()
+      if not result[ 'OK' ]:
+        print "  Error with %s bytes: %s" % ( size, result[ 'Message' ] )
+        return
+    elapsed = max( time.time() - start, 0.000001 )
+    print "  %10d bytes x %4d  %8.1f MiB/s  %8.3f ms/msg" % ( size, repetitions,
+                                                              size * repetitions / elapsed / 1048576,
+                                                              elapsed * 1000 / repetitions )
+  client.close()
+  serverThread.join( 10 )
+  serverTransport.close()
+
+def main( protocols ):
+  port = 9191
+  for protocol in protocols:
+    benchmark( protocol, port )
+    port += 1
+
+if __name__ == "__main__":
+  protocols = sys.argv[1:]
+  if not protocols:
+    protocols = [ 'dip', 'dips' ]
+  main( protocols )
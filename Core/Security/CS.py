@@ -4,56 +4,24 @@ __RCSID__ = "$Id$"
 from DIRAC import S_OK, S_ERROR
 from DIRAC.ConfigurationSystem.Client.Config import gConfig
 from DIRAC.ConfigurationSystem.Client.Helpers                import getVO
+#The reverse lookups use the precomputed indexes of the Registry helper
+from DIRAC.ConfigurationSystem.Client.Helpers.Registry       import getUsernameForDN, getGroupsForUser, \
+                                                                    getHostnameForDN, getPropertiesForGroup
 
 gBaseSecuritySection = "/Registry"
 
-def getUsernameForDN( dn, usersList = False ):
-  if not usersList:
-    retVal = gConfig.getSections( "%s/Users" % gBaseSecuritySection )
-    if not retVal[ 'OK' ]:
-      return retVal
-    usersList = retVal[ 'Value' ]
-  for username in usersList:
-    if dn in gConfig.getValue( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ), [] ):
-      return S_OK( username )
-  return S_ERROR( "No username found for dn %s" % dn )
-
 def getDNForUsername( username ):
   dnList = gConfig.getValue( "%s/Users/%s/DN" % ( gBaseSecuritySection, username ), [] )
   if dnList:
     return S_OK( dnList )
   return S_ERROR( "No DN found for user %s" % username )
 
-def getGroupsForUser( username ):
-  retVal = gConfig.getSections( "%s/Groups" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  groupsList = retVal[ 'Value' ]
-  userGroups = []
-  for group in groupsList:
-    if username in gConfig.getValue( "%s/Groups/%s/Users" % ( gBaseSecuritySection, group ), [] ):
-      userGroups.append( group )
-  if not userGroups:
-    return S_ERROR( "No groups found for user %s" % username )
-  userGroups.sort()
-  return S_OK( userGroups )
-
 def getGroupsForDN( dn ):
   retVal = getUsernameForDN( dn )
   if not retVal[ 'OK' ]:
     return retVal
   return getGroupsForUser( retVal[ 'Value' ] )
 
-def getHostnameForDN( dn ):
-  retVal = gConfig.getSections( "%s/Hosts" % gBaseSecuritySection )
-  if not retVal[ 'OK' ]:
-    return retVal
-  hostList = retVal[ 'Value' ]
-  for hostname in hostList:
-    if dn in gConfig.getValue( "%s/Hosts/%s/DN" % ( gBaseSecuritySection, hostname ), [] ):
-      return S_OK( hostname )
-  return S_ERROR( "No hostname found for dn %s" % dn )
-
 def getDefaultUserGroup():
   return gConfig.getValue( "/%s/DefaultGroup" % gBaseSecuritySection, "user" )
 
@@ -69,12 +37,6 @@ def getUsersInGroup( groupName, defaultValue = None ):
     return gConfig.getValue( option, [] )
   return gConfig.getValue( option, defaultValue )
 
-def getPropertiesForGroup( groupName, defaultValue = None ):
-  option = "%s/Groups/%s/Properties" % ( gBaseSecuritySection, groupName )
-  if defaultValue == None:
-    return gConfig.getValue( option, [] )
-  return gConfig.getValue( option, defaultValue )
-
 def getPropertiesForHost( hostName, defaultValue = None ):
   option = "%s/Hosts/%s/Properties" % ( gBaseSecuritySection, hostName )
   if defaultValue == None:
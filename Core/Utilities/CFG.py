@@ -4,6 +4,7 @@ __RCSID__ = "$Id$"
 import types
 import copy
 import os
+import re
 try:
   import zipfile
   gZipEnabled = True
@@ -67,6 +68,9 @@ except Exception:
 
 #START OF CFG MODULE
 
+#Characters with a meaning in a cfg line
+gCFGTokenRE = re.compile( "[{}=]|\\+=" )
+
 class CFG:
 
   def __init__( self ):
@@ -87,6 +91,23 @@ class CFG:
     self.__commentDict = {}
     self.__dataDict = {}
 
+  def __clone( self ):
+    """
+    Copy the tree without taking the lock at each level. Options and comments
+    are strings, so copying the containers is enough for them
+
+    @return: CFG copy
+    """
+    clonedCFG = CFG()
+    clonedCFG.__orderedList = list( self.__orderedList )
+    clonedCFG.__commentDict = dict( self.__commentDict )
+    dataDict = dict( self.__dataDict )
+    for key, value in self.__dataDict.iteritems():
+      if type( value ) != types.StringType:
+        dataDict[ key ] = value.__clone()
+    clonedCFG.__dataDict = dataDict
+    return clonedCFG
+
   @gCFGSynchro
   def createNewSection( self, sectionName, comment = "", contents = False ):
     """
@@ -162,7 +183,7 @@ class CFG:
     @type comment: string
     @param comment: Comment for the entry
     """
-    if not entryName in self.__orderedList:
+    if not entryName in self.__dataDict:
       self.__orderedList.append( entryName )
     self.__commentDict[ entryName ] = comment
 
@@ -174,7 +195,7 @@ class CFG:
     @param key: Name of the option/section to check
     @return: Boolean with the result
     """
-    return key in self.__orderedList
+    return key in self.__dataDict
 
   def sortAlphabetically( self, ascending = True ):
     """
@@ -221,7 +242,10 @@ class CFG:
     if newKey in self.__orderedList:
       return False
     if originalKey in self.__orderedList:
-      self.__dataDict[ newKey ] = copy.copy( self.__dataDict[ originalKey ] )
+      value = self.__dataDict[ originalKey ]
+      if type( value ) != types.StringType:
+        value = value.__clone()
+      self.__dataDict[ newKey ] = value
       self.__commentDict[ newKey ] = copy.copy( self.__commentDict[ originalKey ] )
       self.__orderedList.append( newKey )
       return True
@@ -522,7 +546,7 @@ class CFG:
     """
     Check if a key is defined
     """
-    return key in self.__orderedList
+    return key in self.__dataDict
 
   def __str__( self ):
     """
@@ -597,27 +621,34 @@ class CFG:
     @param tabLevelString: Tab string to apply to entries before representing them
     @return: String with the contents of the CFG
     """
+    cfgLines = []
+    self.__serialize( cfgLines, tabLevelString )
+    return "".join( cfgLines )
+
+  def __serialize( self, cfgLines, tabLevelString ):
+    """
+    Append the lines of the serialization to cfgLines
+    """
     indentation = "  "
-    cfgString = ""
     for entryName in self.__orderedList:
       if entryName in self.__commentDict:
         for commentLine in List.fromChar( self.__commentDict[ entryName ], "\n" ):
-          cfgString += "%s#%s\n" % ( tabLevelString, commentLine )
-      if entryName in self.listSections():
-        cfgString += "%s%s\n%s{\n" % ( tabLevelString, entryName, tabLevelString )
-        cfgString += self.__dataDict[ entryName ].serialize( "%s%s" % ( tabLevelString, indentation ) )
-        cfgString += "%s}\n" % tabLevelString
-      elif entryName in self.listOptions():
-        valueList = List.fromChar( self.__dataDict[ entryName ] )
+          cfgLines.append( "%s#%s\n" % ( tabLevelString, commentLine ) )
+      if entryName not in self.__dataDict:
+        raise Exception( "Oops. There is an entry in the order which is not a section nor an option" )
+      value = self.__dataDict[ entryName ]
+      if type( value ) != types.StringType:
+        cfgLines.append( "%s%s\n%s{\n" % ( tabLevelString, entryName, tabLevelString ) )
+        value.__serialize( cfgLines, "%s%s" % ( tabLevelString, indentation ) )
+        cfgLines.append( "%s}\n" % tabLevelString )
+      else:
+        valueList = List.fromChar( value )
         if len( valueList ) == 0:
-          cfgString += "%s%s = \n" % ( tabLevelString, entryName )
+          cfgLines.append( "%s%s = \n" % ( tabLevelString, entryName ) )
         else:
-          cfgString += "%s%s = %s\n" % ( tabLevelString, entryName, valueList[0] )
+          cfgLines.append( "%s%s = %s\n" % ( tabLevelString, entryName, valueList[0] ) )
           for value in valueList[1:]:
-            cfgString += "%s%s += %s\n" % ( tabLevelString, entryName, value )
-      else:
-        raise Exception( "Oops. There is an entry in the order which is not a section nor an option" )
-    return cfgString
+            cfgLines.append( "%s%s += %s\n" % ( tabLevelString, entryName, value ) )
 
   @gCFGSynchro
   def clone( self ):
@@ -626,14 +657,7 @@ class CFG:
 
     @return: CFG copy
     """
-    clonedCFG = CFG()
-    clonedCFG.__orderedList = copy.deepcopy( self.__orderedList )
-    clonedCFG.__commentDict = copy.deepcopy( self.__commentDict )
-    for option in self.listOptions():
-      clonedCFG.__dataDict[ option ] = self[ option ]
-    for section in self.listSections():
-      clonedCFG.__dataDict[ section ] = self[ section ].clone()
-    return clonedCFG
+    return self.__clone()
 
   @gCFGSynchro
   def mergeWith( self, cfgToMergeWith ):
@@ -654,21 +678,26 @@ class CFG:
       mergedCFG.setOption( option,
                            cfgToMergeWith[ option ],
                            cfgToMergeWith.getComment( option ) )
-    for section in self.listSections():
-      if section in cfgToMergeWith.listSections():
-        oSectionCFG = self[ section ].mergeWith( cfgToMergeWith[ section ] )
+    #Sections only in one of the CFGs are copied
+    ownSections = self.listSections()
+    otherSections = cfgToMergeWith.listSections()
+    otherSectionsSet = set( otherSections )
+    for section in ownSections:
+      if section in otherSectionsSet:
+        oSectionCFG = self.__dataDict[ section ].mergeWith( cfgToMergeWith.__dataDict[ section ] )
         mergedCFG.createNewSection( section,
                                     cfgToMergeWith.getComment( section ),
                                     oSectionCFG )
       else:
         mergedCFG.createNewSection( section,
                                     self.getComment( section ),
-                                    self[ section ].clone() )
-    for section in cfgToMergeWith.listSections():
-      if section not in self.listSections():
+                                    self.__dataDict[ section ].__clone() )
+    ownSectionsSet = set( ownSections )
+    for section in otherSections:
+      if section not in ownSectionsSet:
         mergedCFG.createNewSection( section,
                                     cfgToMergeWith.getComment( section ),
-                                    cfgToMergeWith[ section ] )
+                                    cfgToMergeWith.__dataDict[ section ].__clone() )
     return mergedCFG
 
   def getModifications( self, newerCfg, ignoreMask = None, parentPath = "" ):
@@ -857,32 +886,53 @@ class CFG:
       if commentPos > -1:
         currentComment += "%s\n" % line[ commentPos: ].replace( "#", "" )
         line = line[ :commentPos ]
-      for index in range( len( line ) ):
-        if line[ index ] == "{":
+      #Jump from token to token, the text in between is part of a section name
+      linePos = 0
+      while True:
+        tokenMatch = gCFGTokenRE.search( line, linePos )
+        if not tokenMatch:
+          currentlyParsedString += line[ linePos: ]
+          break
+        currentlyParsedString += line[ linePos : tokenMatch.start() ]
+        linePos = tokenMatch.end()
+        token = tokenMatch.group()
+        if token == "{":
           currentlyParsedString = currentlyParsedString.strip()
-          currentLevel.createNewSection( currentlyParsedString, currentComment )
+          #Plain names are added directly, anything else goes through createNewSection
+          if currentlyParsedString and currentlyParsedString.find( "/" ) == -1 and \
+             currentlyParsedString not in currentLevel.__dataDict:
+            currentLevel.__addEntry( currentlyParsedString, currentComment )
+            newLevel = CFG()
+            currentLevel.__dataDict[ currentlyParsedString ] = newLevel
+          else:
+            currentLevel.createNewSection( currentlyParsedString, currentComment )
+            newLevel = currentLevel[ currentlyParsedString ]
           levelList.append( currentLevel )
-          currentLevel = currentLevel[ currentlyParsedString ]
+          currentLevel = newLevel
           currentlyParsedString = ""
           currentComment = ""
-        elif line[ index ] == "}":
+        elif token == "}":
           currentLevel = levelList.pop()
-        elif line[ index ] == "=":
-          lFields = line.split( "=" )
-          currentLevel.setOption( lFields[0].strip(),
-           "=".join( lFields[1:] ).strip(),
-           currentComment )
+        elif token == "=":
+          #This is the first = of the line, the name is whatever is before it
+          optionName = line[ :tokenMatch.start() ].strip()
+          optionValue = line[ linePos: ].strip()
+          if optionName and optionName.find( "/" ) == -1:
+            dataDict = currentLevel.__dataDict
+            if optionName not in dataDict:
+              currentLevel.__orderedList.append( optionName )
+            currentLevel.__commentDict[ optionName ] = currentComment
+            dataDict[ optionName ] = str( optionValue )
+          else:
+            currentLevel.setOption( optionName, optionValue, currentComment )
           currentlyParsedString = ""
           currentComment = ""
           break
-        elif line[ index: index + 2 ] == "+=":
-          valueList = line.split( "+=" )
-          currentLevel.appendToOption( valueList[0].strip(), ", %s" % "+=".join( valueList[1:] ).strip() )
+        else:
+          currentLevel.appendToOption( line[ :tokenMatch.start() ].strip(), ", %s" % line[ linePos: ].strip() )
           currentlyParsedString = ""
           currentComment = ""
           break
-        else:
-          currentlyParsedString += line[ index ]
     return self
 
   def writeToFile( self, fileName ):
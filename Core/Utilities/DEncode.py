@@ -11,6 +11,14 @@ Encoding and decoding for dirac, Ids:
  l -> list
  t -> tuple
  d -> dictionary
+
+Big objects can be encoded in chunks with encodeInChunks and decoded while
+the chunks arrive with a StreamDecoder, so the whole encoded string never has
+to be kept in memory.
+
+encode and decode handle the common types inline, genericEncode and
+genericDecode dispatch every value through the encoding and decoding function
+tables. Both produce the same wire format.
 """
 __RCSID__ = "$Id$"
 
@@ -221,25 +229,419 @@ g_dEncodeFunctions[ types.DictType ] = encodeDict
 g_dDecodeFunctions[ "d" ] = decodeDict
 
 
+#Generic encode and decode, dispatching every value through the function tables
+def genericEncode( uObject ):
+  eList = []
+  g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
+  return "".join( eList )
+
+def genericDecode( data ):
+  if not data:
+    return data
+  return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
+
+#Fast encode and decode. Same wire format, but the common types are handled
+#inline and the types not handled here fall back to the function tables
+_intType = types.IntType
+_longType = types.LongType
+_floatType = types.FloatType
+_boolType = types.BooleanType
+_strType = types.StringType
+_unicodeType = types.UnicodeType
+_noneType = types.NoneType
+_listType = types.ListType
+_tupleType = types.TupleType
+_dictType = types.DictType
+
+_dateTimeBuilders = { 'a' : datetime.datetime, 'd' : datetime.date, 't' : datetime.time }
+
+#Cached length prefixes of the strings
+_stringPrefixes = [ "s%s:" % length for length in range( 1024 ) ]
+
+def _fastEncode( uObject, eList ):
+  append = eList.append
+  objType = type( uObject )
+  if objType is _strType:
+    length = len( uObject )
+    if length < 1024:
+      append( _stringPrefixes[ length ] )
+    else:
+      append( "s%s:" % length )
+    append( uObject )
+  elif objType is _intType:
+    append( "i%se" % uObject )
+  elif objType is _dictType:
+    append( "d" )
+    for key in sorted( uObject ):
+      if type( key ) is _strType and len( key ) < 1024:
+        append( _stringPrefixes[ len( key ) ] )
+        append( key )
+      else:
+        _fastEncode( key, eList )
+      value = uObject[ key ]
+      valueType = type( value )
+      if valueType is _strType and len( value ) < 1024:
+        append( _stringPrefixes[ len( value ) ] )
+        append( value )
+      elif valueType is _intType:
+        append( "i%se" % value )
+      else:
+        _fastEncode( value, eList )
+    append( "e" )
+  elif objType is _listType or objType is _tupleType:
+    if objType is _listType:
+      append( "l" )
+    else:
+      append( "t" )
+    if uObject:
+      #Lists of only ints or only strings are encoded in one go
+      firstType = type( uObject[0] )
+      if firstType is _intType or firstType is _strType:
+        for value in uObject:
+          if type( value ) is not firstType:
+            break
+        else:
+          if firstType is _intType:
+            append( ( "i%se" * len( uObject ) ) % tuple( uObject ) )
+          else:
+            for value in uObject:
+              if len( value ) < 1024:
+                append( _stringPrefixes[ len( value ) ] )
+              else:
+                append( "s%s:" % len( value ) )
+              append( value )
+          append( "e" )
+          return
+      for value in uObject:
+        _fastEncode( value, eList )
+    append( "e" )
+  elif objType is _floatType:
+    append( "f%se" % uObject )
+  elif objType is _boolType:
+    if uObject:
+      append( "b1" )
+    else:
+      append( "b0" )
+  elif objType is _noneType:
+    append( "n" )
+  elif objType is _dateTimeType and uObject.tzinfo is None:
+    append( "zati%sei%sei%sei%sei%sei%sei%sene" % ( uObject.year, uObject.month, uObject.day,
+                                                     uObject.hour, uObject.minute, uObject.second,
+                                                     uObject.microsecond ) )
+  elif objType is _longType:
+    append( "I%se" % uObject )
+  elif objType is _unicodeType:
+    valueStr = uObject.encode( 'utf-8' )
+    append( "u%s:" % len( valueStr ) )
+    append( valueStr )
+  else:
+    g_dEncodeFunctions[ objType ]( uObject, eList )
+
+def _fastDecode( data, i ):
+  char = data[ i ]
+  if char == "d":
+    #Strings and ints are decoded inline, anything else recursively
+    oD = {}
+    index = data.index
+    i += 1
+    char = data[ i ]
+    while char != "e":
+      if char == "s":
+        colon = index( ":", i + 1 )
+        i = colon + 1 + int( data[ i + 1 : colon ] )
+        key = data[ colon + 1 : i ]
+      else:
+        key, i = _fastDecode( data, i )
+      char = data[ i ]
+      if char == "s":
+        colon = index( ":", i + 1 )
+        i = colon + 1 + int( data[ i + 1 : colon ] )
+        oD[ key ] = data[ colon + 1 : i ]
+      elif char == "i":
+        end = index( "e", i + 1 )
+        oD[ key ] = int( data[ i + 1 : end ] )
+        i = end + 1
+      else:
+        oD[ key ], i = _fastDecode( data, i )
+      char = data[ i ]
+    return ( oD, i + 1 )
+  if char == "l" or char == "t":
+    oL = []
+    append = oL.append
+    index = data.index
+    i += 1
+    itemChar = data[ i ]
+    while itemChar != "e":
+      if itemChar == "s":
+        colon = index( ":", i + 1 )
+        i = colon + 1 + int( data[ i + 1 : colon ] )
+        append( data[ colon + 1 : i ] )
+      elif itemChar == "i":
+        end = index( "e", i + 1 )
+        append( int( data[ i + 1 : end ] ) )
+        i = end + 1
+      else:
+        value, i = _fastDecode( data, i )
+        append( value )
+      itemChar = data[ i ]
+    if char == "t":
+      return ( tuple( oL ), i + 1 )
+    return ( oL, i + 1 )
+  if char == "s":
+    colon = data.index( ":", i + 1 )
+    end = colon + 1 + int( data[ i + 1 : colon ] )
+    return ( data[ colon + 1 : end ], end )
+  if char == "i":
+    end = data.index( "e", i + 1 )
+    return ( int( data[ i + 1 : end ] ), end + 1 )
+  if char == "f":
+    end = data.index( "e", i + 1 )
+    if end + 1 < len( data ) and data[ end + 1 ] in ( '+', '-' ):
+      eI = end
+      end = data.index( "e", end + 1 )
+      return ( float( data[ i + 1 : eI ] ) * 10 ** int( data[ eI + 1 : end ] ), end + 1 )
+    return ( float( data[ i + 1 : end ] ), end + 1 )
+  if char == "b":
+    return ( data[ i + 1 ] != "0", i + 2 )
+  if char == "n":
+    return ( None, i + 1 )
+  if char == "z" and data[ i + 1 ] in _dateTimeBuilders:
+    tupleObject, end = _fastDecode( data, i + 2 )
+    return ( _dateTimeBuilders[ data[ i + 1 ] ]( *tupleObject ), end )
+  if char == "I":
+    end = data.index( "e", i + 1 )
+    return ( long( data[ i + 1 : end ] ), end + 1 )
+  if char == "u":
+    colon = data.index( ":", i + 1 )
+    end = colon + 1 + int( data[ i + 1 : colon ] )
+    return ( unicode( data[ colon + 1 : end ], 'utf-8' ), end )
+  return g_dDecodeFunctions[ char ]( data, i )
+
 #Encode function
 def encode( uObject ):
-  try:
-    eList = []
-    #print "ENCODE FUNCTION : %s" % g_dEncodeFunctions[ type( uObject ) ]
-    g_dEncodeFunctions[ type( uObject ) ]( uObject, eList )
-    return "".join( eList )
-  except Exception:
-    raise
+  eList = []
+  _fastEncode( uObject, eList )
+  return "".join( eList )
 
 def decode( data ):
   if not data:
     return data
-  try:
-    #print "DECODE FUNCTION : %s" % g_dDecodeFunctions[ sStream [ iIndex ] ]
-    return g_dDecodeFunctions[ data[ 0 ] ]( data, 0 )
-  except Exception:
-    raise
+  return _fastDecode( data, 0 )
+
+#Encode in chunks
+g_dContainerIds = { types.ListType : "l", types.TupleType : "t" }
+
+def _iterDict( dValue ):
+  for key in sorted( dValue ):
+    yield key
+    yield dValue[ key ]
+
+def encodeInChunks( uObject, chunkSize = 1048576 ):
+  """
+  Generator yielding the encoded object in chunks of at least chunkSize chars
+  (except the last one). Joining the chunks gives the same as encode
+  """
+  eList = []
+  #Size and number of pieces in eList not yet yielded
+  eSize = 0
+  numPieces = 0
+  #Iterators over the containers being encoded
+  stack = [ iter( ( uObject, ) ) ]
+  while stack:
+    for obj in stack[-1]:
+      objType = type( obj )
+      if objType == types.ListType or objType == types.TupleType:
+        eList.append( g_dContainerIds[ objType ] )
+        stack.append( iter( obj ) )
+        break
+      elif objType == types.DictType:
+        eList.append( "d" )
+        stack.append( _iterDict( obj ) )
+        break
+      _fastEncode( obj, eList )
+      while numPieces < len( eList ):
+        eSize += len( eList[ numPieces ] )
+        numPieces += 1
+      if eSize >= chunkSize:
+        yield "".join( eList )
+        eList = []
+        eSize = 0
+        numPieces = 0
+    else:
+      stack.pop()
+      if stack:
+        eList.append( "e" )
+    #Container markers are one char each
+    eSize += len( eList ) - numPieces
+    numPieces = len( eList )
+    if eSize >= chunkSize:
+      yield "".join( eList )
+      eList = []
+      eSize = 0
+      numPieces = 0
+  if eList:
+    yield "".join( eList )
+
+#Decode in chunks
+
+class StreamDecoder:
+  """
+  Resumable decoder. The encoded data can be fed in chunks as it arrives and
+  the object is built while decoding, so only the chunk being decoded is kept
+  """
+
+  def __init__( self ):
+    self.__buffer = ""
+    self.__pos = 0
+    #Containers being decoded [ type char, decoded items, datetime type ]
+    self.__stack = []
+    #String split between chunks [ type char, pieces, missing length ]
+    self.__pendingString = False
+    self.__complete = False
+    self.__object = None
+
+  def isComplete( self ):
+    return self.__complete
+
+  def feed( self, data ):
+    """
+    Decode a new chunk of data
+      Returns True when the object is complete
+    """
+    if not self.__complete and self.__pendingString:
+      data = self.__feedPendingString( data )
+    if self.__pos:
+      self.__buffer = self.__buffer[ self.__pos: ]
+      self.__pos = 0
+    self.__buffer += data
+    if not self.__complete:
+      self.__parse( False )
+    return self.__complete
+
+  def getObject( self ):
+    """
+    Get the decoded object, raises if not enough data has been fed
+    """
+    if not self.__complete:
+      #A float at the end of the data can't be told apart from one with exponent until the end
+      self.__parse( True )
+      if not self.__complete:
+        raise ValueError( "Not enough data to decode the object" )
+    return self.__object
+
+  def getRemainingData( self ):
+    """
+    Get the data fed after the end of the object
+    """
+    if not self.__complete:
+      return ""
+    return self.__buffer[ self.__pos: ]
+
+  def __feedPendingString( self, data ):
+    pending = self.__pendingString
+    if len( data ) < pending[2]:
+      pending[1].append( data )
+      pending[2] -= len( data )
+      return ""
+    pending[1].append( data[ :pending[2] ] )
+    data = data[ pending[2]: ]
+    self.__pendingString = False
+    value = "".join( pending[1] )
+    if pending[0] == "u":
+      value = unicode( value, 'utf-8' )
+    self.__addValue( value )
+    return data
 
+  def __addValue( self, value ):
+    while self.__stack:
+      frame = self.__stack[-1]
+      if frame[0] != "z":
+        frame[1].append( value )
+        return
+      self.__stack.pop()
+      value = _dateTimeBuilders[ frame[2] ]( *value )
+    self.__object = value
+    self.__complete = True
+
+  def __parse( self, final ):
+    data = self.__buffer
+    pos = self.__pos
+    dataLen = len( data )
+    while pos < dataLen and not self.__complete:
+      char = data[ pos ]
+      if char == "e" and self.__stack and self.__stack[-1][0] != "z":
+        frame = self.__stack.pop()
+        if frame[0] == "l":
+          value = frame[1]
+        elif frame[0] == "t":
+          value = tuple( frame[1] )
+        else:
+          items = frame[1]
+          value = dict( zip( items[::2], items[1::2] ) )
+        pos += 1
+      elif char in "ltd":
+        self.__stack.append( [ char, [], None ] )
+        pos += 1
+        continue
+      elif char == "z":
+        if pos + 1 >= dataLen:
+          break
+        if data[ pos + 1 ] not in _dateTimeBuilders:
+          raise Exception( "Unexpected type %s while decoding a datetime object" % data[ pos + 1 ] )
+        self.__stack.append( [ char, None, data[ pos + 1 ] ] )
+        pos += 2
+        continue
+      elif char == "i" or char == "I":
+        end = data.find( "e", pos + 1 )
+        if end == -1:
+          break
+        if char == "i":
+          value = int( data[ pos + 1 : end ] )
+        else:
+          value = long( data[ pos + 1 : end ] )
+        pos = end + 1
+      elif char == "f":
+        end = data.find( "e", pos + 1 )
+        if end == -1 or ( end + 1 == dataLen and not final ):
+          break
+        if end + 1 < dataLen and data[ end + 1 ] in ( '+', '-' ):
+          expEnd = data.find( "e", end + 1 )
+          if expEnd == -1:
+            break
+          value = float( data[ pos + 1 : end ] ) * 10 ** int( data[ end + 1 : expEnd ] )
+          end = expEnd
+        else:
+          value = float( data[ pos + 1 : end ] )
+        pos = end + 1
+      elif char == "b":
+        if pos + 1 >= dataLen:
+          break
+        value = data[ pos + 1 ] != "0"
+        pos += 2
+      elif char == "n":
+        value = None
+        pos += 1
+      elif char == "s" or char == "u":
+        colon = data.find( ":", pos + 1 )
+        if colon == -1:
+          break
+        start = colon + 1
+        end = start + int( data[ pos + 1 : colon ] )
+        if end > dataLen:
+          self.__pendingString = [ char, [ data[ start: ] ], end - dataLen ]
+          pos = dataLen
+          break
+        value = data[ start : end ]
+        if char == "u":
+          value = unicode( value, 'utf-8' )
+        pos = end
+      else:
+        raise ValueError( "Unexpected type %s while decoding" % char )
+      self.__addValue( value )
+    if pos >= dataLen:
+      self.__buffer = ""
+      pos = 0
+    self.__pos = pos
 
 if __name__ == "__main__":
   gObject = {2:"3", True : ( 3, None ), 2.0 * 10 ** 20 : 2.0 * 10 ** -10 }
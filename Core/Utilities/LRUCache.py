@@ -0,0 +1,151 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import threading
+
+class LRUCache:
+  """
+  Thread safe cache with a bounded number of entries. When it is full the
+  least recently used entry is dropped to make room for a new one
+  """
+
+  #Positions in the linked list nodes
+  __PREV, __NEXT, __KEY, __VALUE = range( 4 )
+
+  def __init__( self, maxSize = 1000 ):
+    """
+    Initialize the cache
+      Arguments:
+        - maxSize : maximum number of entries kept
+    """
+    if maxSize < 1:
+      raise ValueError( "LRUCache maxSize has to be at least 1" )
+    self.__maxSize = maxSize
+    self.__lock = threading.Lock()
+    self.__cache = {}
+    #Circular doubly linked list, the most recently used next to the root
+    self.__root = []
+    self.__root[:] = [ self.__root, self.__root, None, None ]
+    self.__hits = 0
+    self.__misses = 0
+
+  def __unlink( self, node ):
+    node[ self.__PREV ][ self.__NEXT ] = node[ self.__NEXT ]
+    node[ self.__NEXT ][ self.__PREV ] = node[ self.__PREV ]
+
+  def __linkFirst( self, node ):
+    root = self.__root
+    first = root[ self.__NEXT ]
+    node[ self.__PREV ] = root
+    node[ self.__NEXT ] = first
+    first[ self.__PREV ] = node
+    root[ self.__NEXT ] = node
+
+  def get( self, cKey, default = None ):
+    """
+    Get a record from the cache, default if it's not there
+      Arguments:
+        - cKey : identification key of the record
+    """
+    self.__lock.acquire()
+    try:
+      node = self.__cache.get( cKey )
+      if node is None:
+        self.__misses += 1
+        return default
+      self.__hits += 1
+      self.__unlink( node )
+      self.__linkFirst( node )
+      return node[ self.__VALUE ]
+    finally:
+      self.__lock.release()
+
+  def add( self, cKey, value ):
+    """
+    Add or replace a record in the cache
+      Arguments:
+        - cKey : identification key of the record
+        - value : value of the record
+    """
+    self.__lock.acquire()
+    try:
+      node = self.__cache.get( cKey )
+      if node is not None:
+        node[ self.__VALUE ] = value
+        self.__unlink( node )
+        self.__linkFirst( node )
+        return
+      if len( self.__cache ) >= self.__maxSize:
+        last = self.__root[ self.__PREV ]
+        self.__unlink( last )
+        del( self.__cache[ last[ self.__KEY ] ] )
+      node = [ None, None, cKey, value ]
+      self.__linkFirst( node )
+      self.__cache[ cKey ] = node
+    finally:
+      self.__lock.release()
+
+  def exists( self, cKey ):
+    """
+    Returns True/False if the key is in the cache. It doesn't refresh the entry
+    """
+    self.__lock.acquire()
+    try:
+      return cKey in self.__cache
+    finally:
+      self.__lock.release()
+
+  def delete( self, cKey ):
+    """
+    Delete a key from the cache
+    """
+    self.__lock.acquire()
+    try:
+      node = self.__cache.pop( cKey, None )
+      if node is not None:
+        self.__unlink( node )
+    finally:
+      self.__lock.release()
+
+  def purgeAll( self ):
+    """
+    Purge all entries
+    """
+    self.__lock.acquire()
+    try:
+      self.__cache = {}
+      self.__root[:] = [ self.__root, self.__root, None, None ]
+    finally:
+      self.__lock.release()
+
+  def getKeys( self ):
+    """
+    Get the keys from the most to the least recently used
+    """
+    self.__lock.acquire()
+    try:
+      keys = []
+      node = self.__root[ self.__NEXT ]
+      while node is not self.__root:
+        keys.append( node[ self.__KEY ] )
+        node = node[ self.__NEXT ]
+      return keys
+    finally:
+      self.__lock.release()
+
+  def getMaxSize( self ):
+    return self.__maxSize
+
+  def getStats( self ):
+    """
+    Get the size and the hits and misses of the cache
+    """
+    self.__lock.acquire()
+    try:
+      return { 'Size' : len( self.__cache ), 'MaxSize' : self.__maxSize,
+               'Hits' : self.__hits, 'Misses' : self.__misses }
+    finally:
+      self.__lock.release()
+
+  def __len__( self ):
+    return len( self.__cache )
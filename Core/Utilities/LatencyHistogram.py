@@ -0,0 +1,70 @@
+# $HeadURL$
+__RCSID__ = "$Id$"
+
+import math
+
+class LatencyHistogram:
+  """
+  Histogram of durations in logarithmic buckets. It takes constant memory
+  whatever the number of values, and the percentiles are accurate to the
+  width of a bucket ( growthFactor - 1 of the value )
+  """
+
+  def __init__( self, minValue = 0.0001, growthFactor = 1.1 ):
+    """
+    Initialize the histogram
+      Arguments:
+        - minValue : upper bound of the first bucket
+        - growthFactor : ratio between the bounds of two consecutive buckets
+    """
+    if minValue <= 0 or growthFactor <= 1:
+      raise ValueError( "LatencyHistogram needs minValue > 0 and growthFactor > 1" )
+    self.__minValue = float( minValue )
+    self.__growthFactor = float( growthFactor )
+    self.__logFactor = math.log( growthFactor )
+    self.__buckets = {}
+    self.__count = 0
+    self.__total = 0.0
+    self.__max = 0.0
+
+  def add( self, value ):
+    """
+    Add a value to the histogram
+    """
+    if value <= self.__minValue:
+      bucket = 0
+    else:
+      bucket = int( math.ceil( math.log( value / self.__minValue ) / self.__logFactor ) )
+    self.__buckets[ bucket ] = self.__buckets.get( bucket, 0 ) + 1
+    self.__count += 1
+    self.__total += value
+    if value > self.__max:
+      self.__max = value
+
+  def getCount( self ):
+    return self.__count
+
+  def getMean( self ):
+    if not self.__count:
+      return 0.0
+    return self.__total / self.__count
+
+  def getMax( self ):
+    return self.__max
+
+  def getPercentile( self, percentile ):
+    """
+    Get the value below which the given percentage of values are. It is the upper
+    bound of the bucket the value falls in, but never more than the maximum value
+    """
+    if not self.__count:
+      return 0.0
+    rank = max( 1, int( math.ceil( self.__count * percentile / 100.0 ) ) )
+    seen = 0
+    buckets = self.__buckets.keys()
+    buckets.sort()
+    for bucket in buckets:
+      seen += self.__buckets[ bucket ]
+      if seen >= rank:
+        break
+    return min( self.__max, self.__minValue * self.__growthFactor ** bucket )
@@ -3,18 +3,21 @@
 ########################################################################
 """ DIRAC Basic MySQL Class
     It provides access to the basic MySQL methods in a multithread-safe mode
-    keeping used connections in a python Queue for further reuse.
+    keeping used connections in a ConnectionPool for further reuse.
 
     These are the coded methods:
 
-    __init__( host, user, passwd, name, [maxConnsInQueue=10] )
+    __init__( host, user, passwd, name, [maxConnsInQueue=10], [maxIdleTime], [maxLifeTime], [pingIdleTime] )
 
-    Initializes the Queue and tries to connect to the DB server,
+    Initializes the ConnectionPool and tries to connect to the DB server,
     using the _connect method.
-    "maxConnsInQueue" defines the size of the Queue of open connections
-    that are kept for reuse. It also defined the maximum number of open
-    connections available from the object.
+    "maxConnsInQueue" defines the size of the pool of open connections
+    that are kept for reuse. It also defined the maximum number of
+    connections used at the same time by the _query/_update methods.
     maxConnsInQueue = 0 means unlimited and it is not supported.
+    Idle connections are closed after "maxIdleTime" seconds, any connection
+    is closed after "maxLifeTime" seconds and connections are only pinged
+    when they have been idle for more than "pingIdleTime" seconds.
 
 
     _except( methodName, exception, errorMessage )
@@ -31,23 +34,35 @@
     Returns S_OK or S_ERROR.
 
 
-    _query( cmd, [conn] )
+    _query( cmd, [conn], [params] )
 
     Executes SQL command "cmd".
-    Gets a connection from the Queue (or open a new one if none is available),
-    the used connection is  back into the Queue.
+    Gets a connection from the pool (or open a new one if none is available),
+    the used connection is  back into the pool.
     If a connection to the the DB is passed as second argument this connection
-    is used and is not  in the Queue.
+    is used and is not  in the pool.
+    If "params" is given (tuple or dict), the values are bound by the driver
+    to the %s ( or %(name)s ) placeholders in "cmd" instead of being
+    interpolated by the caller. Literal % in "cmd" has then to be written as %%.
     Returns S_OK with fetchall() out in Value or S_ERROR upon failure.
 
 
-    _update( cmd, [conn] )
+    _update( cmd, [conn], [params] )
 
     Executes SQL command "cmd" and issue a commit
-    Gets a connection from the Queue (or open a new one if none is available),
-    the used connection is  back into the Queue.
+    Gets a connection from the pool (or open a new one if none is available),
+    the used connection is  back into the pool.
     If a connection to the the DB is passed as second argument this connection
-    is used and is not  in the Queue
+    is used and is not  in the pool
+    "params" are bound as in _query.
+    Returns S_OK with number of updated registers in Value or S_ERROR upon failure.
+
+
+    _updateMany( cmd, paramsList, [conn] )
+
+    Executes SQL command "cmd" once for each params tuple in "paramsList"
+    and issue a single commit. Multi-row INSERTs are sent to the server
+    as one statement by the driver.
     Returns S_OK with number of updated registers in Value or S_ERROR upon failure.
 
     _createTables( tableDict )
@@ -68,17 +83,27 @@
 
     _getConnection()
 
-    Gets a connection from the Queue (or open a new one if none is available)
-    Returns S_OK with connection in Value or S_ERROR
-    the calling method is responsible for closing this connection once it is no
-    longer needed.
+    Gets a connection from the pool (or open a new one if none is available)
+    Returns S_OK with a PooledConnection in Value or S_ERROR
+    The connection has to be given back to the pool with its release() method,
+    if it is only garbage collected it is accounted as a leak.
+    Any transaction left open is rolled back when the connection goes back to
+    the pool, so callers have to commit what they want to keep.
+    It does not count against "maxConnsInQueue" so that it can be kept while
+    other methods are called without risk of exhausting the pool.
+
+    getPoolStats()
+
+    Returns S_OK with a dict of the pool counters (Waits, Creations, Leaks,
+    Evictions) and of the number of Idle, InUse and Detached connections.
+    The counters are also reported to gMonitor.
 
 """
 
 __RCSID__ = "$Id$"
 
 
-from DIRAC                                  import gLogger
+from DIRAC                                  import gLogger, gMonitor
 from DIRAC                                  import S_OK, S_ERROR
 
 import MySQLdb
@@ -86,7 +111,6 @@ import MySQLdb
 MySQLdb.server_init( ['--defaults-file=/opt/dirac/etc/my.cnf', '--datadir=/opt/mysql/db'], ['mysqld'] )
 gInstancesCount = 0
 
-import Queue
 import types
 import time
 import threading
@@ -113,6 +137,278 @@ def _checkFields( inFields, inValues ):
   return S_OK()
 
 
+class ConnectionPool:
+  """
+  Bounded pool of MySQL connections
+    - At most maxSize connections are handed out at the same time in bounded mode,
+      further checkouts wait up to checkoutTimeout seconds for a free one
+    - Detached (unbounded) checkouts are not limited, but go back to the pool too
+    - Idle connections older than maxIdleTime and connections older than
+      maxLifeTime are closed
+    - Connections are only pinged if they have been idle for more than pingIdleTime
+  """
+
+  __counterDefs = ( ( 'Waits', 'Waits for a free connection', 'waits/min' ),
+                    ( 'Creations', 'New connections opened', 'connections/min' ),
+                    ( 'Evictions', 'Connections closed by the pool', 'connections/min' ),
+                    ( 'Leaks', 'Connections not released before being garbage collected', 'connections/min' ) )
+
+  def __init__( self, connectFunction, maxSize, maxIdleTime = 600, maxLifeTime = 3600,
+                pingIdleTime = 30, checkoutTimeout = 60, monitorName = "" ):
+    self.__connect = connectFunction
+    self.__maxSize = maxSize
+    self.__maxIdleTime = maxIdleTime
+    self.__maxLifeTime = maxLifeTime
+    self.__pingIdleTime = pingIdleTime
+    self.__checkoutTimeout = checkoutTimeout
+    self.__monitorName = monitorName
+    # Reentrant, connections may be returned from a __del__ while the lock is held
+    self.__cond = threading.Condition( threading.RLock() )
+    # List of ( connection, creationTime, lastUseTime ), the most recently used at the end
+    self.__idle = []
+    # id( connection ) -> ( creationTime, bounded )
+    self.__checkedOut = {}
+    self.__numBounded = 0
+    self.__counters = {}
+    for counter, description, unit in self.__counterDefs:
+      self.__counters[ counter ] = 0
+    self.__registerActivities()
+
+  def __registerActivities( self ):
+    if not self.__monitorName:
+      return
+    for counter, description, unit in self.__counterDefs:
+      gMonitor.registerActivity( "%sConnection%s" % ( self.__monitorName, counter ),
+                                 "%s to %s" % ( description, self.__monitorName ),
+                                 "MySQL pool", unit, gMonitor.OP_SUM )
+
+  def __count( self, counter, value = 1 ):
+    self.__counters[ counter ] += value
+    if not self.__monitorName:
+      return
+    activity = "%sConnection%s" % ( self.__monitorName, counter )
+    try:
+      gMonitor.addMark( activity, value )
+    except Exception:
+      # The monitor may have been initialized after the pool was created
+      try:
+        self.__registerActivities()
+        gMonitor.addMark( activity, value )
+      except Exception:
+        pass
+
+  def __close( self, connection ):
+    try:
+      connection.close()
+    except Exception:
+      pass
+
+  def __popIdle( self, now ):
+    """
+    Get the most recently used idle connection, evicting the expired ones.
+    Requires the lock to be held. Returns the entry and the connections to close
+    """
+    toClose = []
+    valid = []
+    for entry in self.__idle:
+      connection, creationTime, lastUseTime = entry
+      if now - lastUseTime > self.__maxIdleTime or now - creationTime > self.__maxLifeTime:
+        toClose.append( connection )
+      else:
+        valid.append( entry )
+    self.__idle = valid
+    if toClose:
+      self.__count( 'Evictions', len( toClose ) )
+    if self.__idle:
+      return self.__idle.pop(), toClose
+    return False, toClose
+
+  def get( self, bounded = True ):
+    """
+    Get a connection from the pool. Raises an exception if a new connection
+    can't be opened or no connection is freed before the checkout timeout
+    """
+    start = time.time()
+    self.__cond.acquire()
+    try:
+      if bounded:
+        waited = False
+        while self.__numBounded >= self.__maxSize:
+          if not waited:
+            waited = True
+            self.__count( 'Waits' )
+          remaining = self.__checkoutTimeout - ( time.time() - start )
+          if remaining <= 0:
+            raise Exception( 'No free connection after %s seconds' % self.__checkoutTimeout )
+          self.__cond.wait( remaining )
+        self.__numBounded += 1
+    finally:
+      self.__cond.release()
+
+    try:
+      while True:
+        now = time.time()
+        self.__cond.acquire()
+        try:
+          entry, toClose = self.__popIdle( now )
+        finally:
+          self.__cond.release()
+        for connection in toClose:
+          self.__close( connection )
+        if not entry:
+          break
+        connection, creationTime, lastUseTime = entry
+        if now - lastUseTime > self.__pingIdleTime:
+          try:
+            # This will try to reconnect if the connection has timed out
+            connection.ping( True )
+          except Exception:
+            self.__cond.acquire()
+            try:
+              self.__count( 'Evictions' )
+            finally:
+              self.__cond.release()
+            self.__close( connection )
+            continue
+        self.__registerCheckout( connection, creationTime, bounded )
+        return connection
+      connection = self.__connect()
+      self.__cond.acquire()
+      try:
+        self.__count( 'Creations' )
+      finally:
+        self.__cond.release()
+      self.__registerCheckout( connection, time.time(), bounded )
+      return connection
+    except:
+      if bounded:
+        self.__releaseSlot()
+      raise
+
+  def __registerCheckout( self, connection, creationTime, bounded ):
+    self.__cond.acquire()
+    try:
+      self.__checkedOut[ id( connection ) ] = ( creationTime, bounded )
+    finally:
+      self.__cond.release()
+
+  def __releaseSlot( self ):
+    self.__cond.acquire()
+    try:
+      self.__numBounded -= 1
+      self.__cond.notify()
+    finally:
+      self.__cond.release()
+
+  def put( self, connection, discard = False ):
+    """
+    Give back a connection to the pool. It is closed if discard is True,
+    it is too old or the pool has already enough idle connections
+    """
+    if not discard:
+      try:
+        # End any open transaction so that its snapshot and locks are not reused
+        connection.rollback()
+      except Exception:
+        discard = True
+    now = time.time()
+    toClose = False
+    self.__cond.acquire()
+    try:
+      creationTime, bounded = self.__checkedOut.pop( id( connection ), ( now, False ) )
+      if bounded:
+        self.__numBounded -= 1
+        self.__cond.notify()
+      if discard or now - creationTime > self.__maxLifeTime or len( self.__idle ) >= self.__maxSize:
+        self.__count( 'Evictions' )
+        toClose = True
+      else:
+        self.__idle.append( ( connection, creationTime, now ) )
+    finally:
+      self.__cond.release()
+    if toClose:
+      self.__close( connection )
+
+  def registerLeak( self ):
+    self.__cond.acquire()
+    try:
+      self.__count( 'Leaks' )
+    finally:
+      self.__cond.release()
+
+  def getStats( self ):
+    self.__cond.acquire()
+    try:
+      stats = dict( self.__counters )
+      stats[ 'Idle' ] = len( self.__idle )
+      stats[ 'InUse' ] = self.__numBounded
+      stats[ 'Detached' ] = max( 0, len( self.__checkedOut ) - self.__numBounded )
+      stats[ 'MaxSize' ] = self.__maxSize
+      return stats
+    finally:
+      self.__cond.release()
+
+  def close( self ):
+    """
+    Close all the idle connections
+    """
+    self.__cond.acquire()
+    try:
+      idle = self.__idle
+      self.__idle = []
+    finally:
+      self.__cond.release()
+    for connection, creationTime, lastUseTime in idle:
+      self.__close( connection )
+
+
+class PooledConnection:
+  """
+  Wrapper of a MySQL connection checked out from a ConnectionPool
+  It behaves as the wrapped connection and returns it to the pool when
+  released or, as a last resort, when garbage collected (counted as a leak)
+  """
+
+  def __init__( self, pool, connection ):
+    self.__pool = pool
+    self.__connection = connection
+
+  def __getattr__( self, name ):
+    connection = self.__dict__.get( '_PooledConnection__connection' )
+    if connection is None:
+      raise AttributeError( name )
+    return getattr( connection, name )
+
+  def release( self ):
+    connection = self.__dict__.get( '_PooledConnection__connection' )
+    if connection is not None:
+      self.__connection = None
+      self.__pool.put( connection )
+
+  def close( self ):
+    connection = self.__dict__.get( '_PooledConnection__connection' )
+    if connection is not None:
+      self.__connection = None
+      self.__pool.put( connection, discard = True )
+
+  #Only usable in with statements, which need python 2.6 (or the with_statement future in 2.5)
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, excType, excValue, traceback ):
+    self.release()
+    return False
+
+  def __del__( self ):
+    connection = self.__dict__.get( '_PooledConnection__connection' )
+    if connection is not None:
+      self.__connection = None
+      try:
+        self.__pool.registerLeak()
+        self.__pool.put( connection )
+      except Exception:
+        pass
+
 
 
 class MySQL:
@@ -121,7 +417,8 @@ class MySQL:
   """
   __initialized = False
 
-  def __init__( self, hostName, userName, passwd, dbName, maxQueueSize = 3 ):
+  def __init__( self, hostName, userName, passwd, dbName, maxQueueSize = 3,
+                maxIdleTime = 600, maxLifeTime = 3600, pingIdleTime = 30 ):
     """
     set MySQL connection parameters and try to connect
     """
@@ -143,10 +440,12 @@ class MySQL:
     self.__userName = str( userName )
     self.__passwd = str( passwd )
     self.__dbName = str( dbName )
-    # Create the connection Queue to reuse connections
-    self.__connectionQueue = Queue.Queue( maxQueueSize )
-    # Create the connection Semaphore to limit total number of open connection
-    self.__connectionSemaphore = threading.Semaphore( maxQueueSize )
+    # Create the connection pool to reuse connections and limit the number of them in use
+    self.__connectionPool = ConnectionPool( self.__newConnection, maxQueueSize,
+                                            maxIdleTime = maxIdleTime,
+                                            maxLifeTime = maxLifeTime,
+                                            pingIdleTime = pingIdleTime,
+                                            monitorName = self.__dbName )
 
     self.__initialized = True
     self._connect()
@@ -155,14 +454,8 @@ class MySQL:
   def __del__( self ):
     global gInstancesCount
     try:
-      while 1 and self.__initialized:
-        self.__connectionSemaphore.release()
-        try:
-          connection = self.__connectionQueue.get_nowait()
-          connection.close()
-        except Queue.Empty:
-          self.logger.debug( 'No more connection in Queue' )
-          break
+      if self.__initialized:
+        self.__connectionPool.close()
       if gInstancesCount == 1:
         # only when the last instance of a MySQL object is deleted, the server
         # can be ended
@@ -243,16 +536,16 @@ class MySQL:
     """
     self.logger.debug( '_escapeValues:', inValues )
 
-    retDict = self.__getConnection()
-    if not retDict['OK']:
-      return retDict
-    connection = retDict['Value']
-
     inEscapeValues = []
 
     if not inValues:
       return S_OK( inEscapeValues )
 
+    retDict = self.__getConnection()
+    if not retDict['OK']:
+      return retDict
+    connection = retDict['Value']
+
     for value in inValues:
       if type( value ) in StringTypes:
         retDict = self.__escapeString( value, connection )
@@ -268,7 +561,7 @@ class MySQL:
 
   def _connect( self ):
     """
-    open connection to MySQL DB and put Connection into Queue
+    open connection to MySQL DB and put Connection into the pool
     set connected flag to True and return S_OK
     return S_ERROR upon failure
     """
@@ -280,7 +573,7 @@ class MySQL:
                         '[%s@%s] by user %s/%s.' %
                         ( self.__dbName, self.__hostName, self.__userName, self.__passwd ) )
     try:
-      self.__newConnection()
+      self.__putConnection( self.__connectionPool.get() )
       self.logger.debug( '_connect: Connected.' )
       self._connected = True
       return S_OK()
@@ -288,26 +581,26 @@ class MySQL:
       return self._except( '_connect', x, 'Could not connect to DB.' )
 
 
-  def _query( self, cmd, conn = None ):
+  def _query( self, cmd, conn = None, params = None ):
     """
     execute MySQL query command
+    if params are given they are bound to the placeholders in cmd
     return S_OK structure with fetchall result as tuple
     it returns an empty tuple if no matching rows are found
     return S_ERROR upon error
     """
     self.logger.debug( '_query:', cmd )
+    if params is not None:
+      self.logger.debug( '_query params:', params )
 
-    if conn:
-      connection = conn
-    else:
-      retDict = self._getConnection()
-      if not retDict['OK']:
-        return retDict
-      connection = retDict[ 'Value' ]
+    retDict = self.__getConnection( conn = conn )
+    if not retDict['OK']:
+      return retDict
+    connection = retDict[ 'Value' ]
 
     try:
       cursor = connection.cursor()
-      if cursor.execute( cmd ):
+      if cursor.execute( cmd, params ):
         res = cursor.fetchall()
       else:
         res = ()
@@ -317,7 +610,7 @@ class MySQL:
         self.logger.debug( '_query:', res )
       else:
         self.logger.debug( '_query: Total %d records returned' % len( res ) )
-        self.logger.debug( '_query: %s ...' % str( res[:10] ) )
+        self.logger.debug( '_query: First 10 records', res[:10] )
 
       retDict = S_OK( res )
     except Exception , x:
@@ -328,16 +621,21 @@ class MySQL:
       cursor.close()
     except Exception:
       pass
+    if not conn:
+      self.__putConnection( connection )
 
     return retDict
 
 
-  def _update( self, cmd, conn = None ):
+  def _update( self, cmd, conn = None, params = None ):
     """ execute MySQL update command
+        if params are given they are bound to the placeholders in cmd
         return S_OK with number of updated registers upon success
         return S_ERROR upon error
     """
     self.logger.debug( '_update:', cmd )
+    if params is not None:
+      self.logger.debug( '_update params:', params )
 
     retDict = self.__getConnection( conn = conn )
     if not retDict['OK']:
@@ -346,7 +644,7 @@ class MySQL:
 
     try:
       cursor = connection.cursor()
-      res = cursor.execute( cmd )
+      res = cursor.execute( cmd, params )
       connection.commit()
       self.logger.debug( '_update: %s.' % res )
       retDict = S_OK( res )
@@ -366,6 +664,43 @@ class MySQL:
     return retDict
 
 
+  def _updateMany( self, cmd, paramsList, conn = None ):
+    """ execute MySQL update command once per params tuple in paramsList
+        with a single commit
+        return S_OK with number of updated registers upon success
+        return S_ERROR upon error
+    """
+    self.logger.debug( '_updateMany: %s ( %d sets of params )' % ( cmd, len( paramsList ) ) )
+    if not paramsList:
+      return S_OK( 0 )
+
+    retDict = self.__getConnection( conn = conn )
+    if not retDict['OK']:
+      return retDict
+    connection = retDict['Value']
+
+    try:
+      cursor = connection.cursor()
+      res = cursor.executemany( cmd, paramsList )
+      connection.commit()
+      self.logger.debug( '_updateMany: %s.' % res )
+      retDict = S_OK( res )
+      if cursor.lastrowid:
+        retDict[ 'lastRowId' ] = cursor.lastrowid
+    except Exception, x:
+      self.logger.debug( '_updateMany: "%s".' % cmd )
+      retDict = self._except( '_updateMany', x, 'Execution failed.' )
+
+    try:
+      cursor.close()
+    except Exception:
+      pass
+    if not conn:
+      self.__putConnection( connection )
+
+    return retDict
+
+
   def _createTables( self, tableDict, force = False ):
     """
     tableDict:
@@ -610,90 +945,66 @@ class MySQL:
 
   def __newConnection( self ):
     """
-    Create a New connection and put it in the Queue
+    Open a new connection, used by the ConnectionPool
     """
     self.logger.debug( '__newConnection:' )
 
-    connection = MySQLdb.connect( host = self.__hostName,
-                                  user = self.__userName,
-                                  passwd = self.__passwd,
-                                  db = self.__dbName )
-    self.__putConnection( connection )
+    return MySQLdb.connect( host = self.__hostName,
+                            user = self.__userName,
+                            passwd = self.__passwd,
+                            db = self.__dbName )
 
 
   def __putConnection( self, connection ):
     """
-    Put a connection in the Queue, if the queue is full, the connection is closed
+    Put a connection back in the pool, if the pool is full, the connection is closed
     """
     self.logger.debug( '__putConnection:' )
 
-    # Release the semaphore first, in case something fails
-    self.__connectionSemaphore.release()
     try:
-      self.__connectionQueue.put_nowait( connection )
-    except Queue.Full, x:
-      self.logger.debug( '__putConnection: Full Queue' )
-      try:
-        connection.close()
-      except:
-        pass
+      self.__connectionPool.put( connection )
     except Exception, x:
-      self._except( '__putConnection', x, 'Failed to put Connection in Queue' )
+      self._except( '__putConnection', x, 'Failed to put Connection in the pool' )
 
   def _getConnection( self ):
     """
-    Return a new connection to the DB
-    It uses the private method __getConnection
+    Return a connection to the DB wrapped in a PooledConnection
+    It does not count against the pool size, release it once it is no longer needed
     """
     self.logger.debug( '_getConnection:' )
 
-    retDict = self.__getConnection( trial = 0 )
-    self.__connectionSemaphore.release()
-    return retDict
+    try:
+      connection = self.__connectionPool.get( bounded = False )
+    except Exception, x:
+      return self._except( '_getConnection', x, 'Failed to get connection from the pool' )
+    return S_OK( PooledConnection( self.__connectionPool, connection ) )
 
-  def __getConnection( self, conn = None, trial = 0 ):
+  def getPoolStats( self ):
     """
-    Return a new connection to the DB,
+    Return the counters of the connection pool
+    """
+    return S_OK( self.__connectionPool.getStats() )
+
+  def __getConnection( self, conn = None ):
+    """
+    Return a connection to the DB from the pool,
     if conn is provided then just return it.
-    then try the Queue, if it is empty add a newConnection to the Queue and retry
-    it will retry maxConnectRetry to open a new connection and will return
-    an error if it fails.
+    If a new connection can not be opened it will retry maxConnectRetry times
+    and will return an error if it fails.
     """
     self.logger.debug( '__getConnection:' )
 
     if conn:
       return S_OK( conn )
 
-    try:
-      self.__connectionSemaphore.acquire()
-      connection = self.__connectionQueue.get_nowait()
-      self.logger.debug( '__getConnection: Got a connection from Queue' )
-      if connection:
-        try:
-          # This will try to reconect if the connection has timeout
-          connection.ping( True )
-        except:
-          # if the ping fails try with a new connection from the Queue
-          self.__connectionSemaphore.release()
-          return self.__getConnection()
-        return S_OK( connection )
-    except Queue.Empty, x:
-      self.__connectionSemaphore.release()
-      self.logger.debug( '__getConnection: Empty Queue' )
+    for trial in range( min( 10, maxConnectRetry ) ):
       try:
-        if trial == min( 10, maxConnectRetry ):
-          return S_ERROR( 'Could not get a connection after %s retries.' % maxConnectRetry )
-        try:
-          self.__newConnection()
-          return self.__getConnection()
-        except Exception, x:
-          self.logger.debug( '__getConnection: Fails to get connection from Queue', x )
-          time.sleep( trial * 5.0 )
-          newtrial = trial + 1
-          return self.__getConnection( trial = newtrial )
+        return S_OK( self.__connectionPool.get() )
+      except MySQLdb.Error, x:
+        self.logger.debug( '__getConnection: Fails to open a new connection', x )
+        time.sleep( trial * 5.0 )
       except Exception, x:
-        return self._except( '__getConnection:', x, 'Failed to get connection from Queue' )
-    except Exception, x:
-      return self._except( '__getConnection:', x, 'Failed to get connection from Queue' )
+        return self._except( '__getConnection:', x, 'Failed to get connection from the pool' )
+    return S_ERROR( 'Could not get a connection after %s retries.' % maxConnectRetry )
 
 
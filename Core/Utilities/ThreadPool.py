@@ -67,11 +67,12 @@ from DIRAC.Core.Utilities.ReturnValues import S_OK, S_ERROR
 
 class WorkingThread( threading.Thread ):
 
-  def __init__( self, oPendingQueue, oResultsQueue, **kwargs ):
+  def __init__( self, oPendingQueue, oResultsQueue, oTakeCallback = None, **kwargs ):
     threading.Thread.__init__( self, **kwargs )
     self.setDaemon( 1 )
     self.__pendingQueue = oPendingQueue
     self.__resultsQueue = oResultsQueue
+    self.__takeCallback = oTakeCallback
     self.__threadAlive = True
     self.__working = False
     self.start()
@@ -89,7 +90,9 @@ class WorkingThread( threading.Thread ):
         self.__pendingQueue.put( oJob )
         break
       self.__working = True
-      oJob.process()
+      #The pool may decide the job has waited for too long
+      if not self.__takeCallback or self.__takeCallback( oJob ):
+        oJob.process()
       self.__working = False
       if oJob.hasCallback():
         self.__resultsQueue.put( oJob, block = True )
@@ -103,7 +106,9 @@ class ThreadedJob:
                 kwargs = None,
                 sTJId = None,
                 oCallback = None,
-                oExceptionCallback = None ):
+                oExceptionCallback = None,
+                maxQueueTime = 0,
+                oShedCallback = None ):
     self.__jobFunction = oCallable
     self.__jobArgs = args or []
     self.__jobKwArgs = kwargs or {}
@@ -114,6 +119,38 @@ class ThreadedJob:
     self.__exceptionRaised = False
     self.__jobResult = None
     self.__jobException = None
+    self.__queuedTime = 0
+    self.__maxQueueTime = maxQueueTime
+    self.__shedCallback = oShedCallback
+
+  def setQueuedTime( self ):
+    self.__queuedTime = time.time()
+
+  def getQueueWaitTime( self ):
+    """
+    Seconds since the job was queued
+    """
+    if not self.__queuedTime:
+      return 0
+    return max( 0, time.time() - self.__queuedTime )
+
+  def hasExpired( self, waitTime ):
+    """
+    Has the job waited in the queue for longer than its maxQueueTime?
+    """
+    return self.__maxQueueTime and waitTime > self.__maxQueueTime
+
+  def shed( self ):
+    """
+    Drop the job without processing it. The shed callback gets the job arguments
+    """
+    if not self.__shedCallback:
+      return
+    try:
+      self.__shedCallback( *self.__jobArgs, **self.__jobKwArgs )
+    except Exception:
+      if gLogger:
+        gLogger.exception( "Exception in shed callback" )
 
   def __showException( self, threadedJob, exceptionInfo ):
     if gLogger:
@@ -164,8 +201,70 @@ class ThreadPool( threading.Thread ):
     self.__pendingQueue = Queue.Queue( iMaxQueuedRequests )
     self.__resultsQueue = Queue.Queue( iMaxQueuedRequests + iMaxThreads )
     self.__workingThreadsList = []
+    self.__threadsLock = threading.Lock()
+    self.__queueWaitCallback = None
+    self.__targetQueueLatency = 0
+    self.__rejectedJobs = 0
+    self.__shedJobs = 0
+    self.__lastShrinkTime = time.time()
     self.__spawnNeededWorkingThreads()
 
+  def setQueueWaitCallback( self, oCallback ):
+    """
+    Call oCallback with the seconds each job waited in the queue when a worker takes it
+    """
+    self.__queueWaitCallback = oCallback
+
+  def setTargetQueueLatency( self, seconds ):
+    """
+    Spawn more threads when the oldest queued job has waited for longer than this
+    and stop the idle ones gradually. 0 (the default) keeps the fixed pool behaviour
+    """
+    self.__targetQueueLatency = seconds
+
+  def __takeJob( self, oJob ):
+    waitTime = oJob.getQueueWaitTime()
+    if self.__queueWaitCallback:
+      try:
+        self.__queueWaitCallback( waitTime )
+      except Exception:
+        if gLogger:
+          gLogger.exception( "Exception in queue wait callback" )
+    #The queue isn't drained fast enough, grow without waiting for the pool thread
+    if self.__targetQueueLatency and waitTime > self.__targetQueueLatency:
+      self.__spawnNeededWorkingThreads()
+    if oJob.hasExpired( waitTime ):
+      self.__shedJobs += 1
+      oJob.shed()
+      return False
+    return True
+
+  def getQueueAge( self ):
+    """
+    Seconds the oldest job in the queue has been waiting
+    """
+    self.__pendingQueue.mutex.acquire()
+    try:
+      if not self.__pendingQueue.queue:
+        return 0
+      oldestJob = self.__pendingQueue.queue[0]
+    finally:
+      self.__pendingQueue.mutex.release()
+    return oldestJob.getQueueWaitTime()
+
+  def getQueueStats( self ):
+    """
+    Get the length and age of the queue, the threads and the jobs rejected
+    because the queue was full or shed because they waited for too long
+    """
+    return { 'Pending' : self.pendingJobs(),
+             'MaxPending' : self.__pendingQueue.maxsize,
+             'QueueAge' : self.getQueueAge(),
+             'Threads' : len( self.__workingThreadsList ),
+             'Working' : self.__countWorkingThreads(),
+             'Rejected' : self.__rejectedJobs,
+             'Shed' : self.__shedJobs }
+
   def getMaxThreads( self ):
     return self.__maxThreads
 
@@ -179,7 +278,8 @@ class ThreadPool( threading.Thread ):
     return self.__countWaitingThreads()
 
   def __spawnWorkingThread( self ):
-    self.__workingThreadsList.append( WorkingThread( self.__pendingQueue, self.__resultsQueue ) )
+    self.__workingThreadsList.append( WorkingThread( self.__pendingQueue, self.__resultsQueue,
+                                                     self.__takeJob ) )
 
   def __killWorkingThread( self ):
     if self.__strictLimits:
@@ -208,28 +308,56 @@ class ThreadPool( threading.Thread ):
     return iWorkingThreads
 
   def __spawnNeededWorkingThreads( self ):
-    while len( self.__workingThreadsList ) < self.__minThreads:
-      self.__spawnWorkingThread()
-    while self.__countWaitingThreads() == 0 and \
-          len( self.__workingThreadsList ) < self.__maxThreads:
-      self.__spawnWorkingThread()
+    self.__threadsLock.acquire()
+    try:
+      while len( self.__workingThreadsList ) < self.__minThreads:
+        self.__spawnWorkingThread()
+      while self.__countWaitingThreads() == 0 and \
+            len( self.__workingThreadsList ) < self.__maxThreads:
+        self.__spawnWorkingThread()
+      #Jobs are waiting for too long, start a thread for each one
+      if self.__targetQueueLatency and self.getQueueAge() > self.__targetQueueLatency:
+        threadsToSpawn = min( self.pendingJobs() - self.__countWaitingThreads(),
+                              self.__maxThreads - len( self.__workingThreadsList ) )
+        for i in range( max( threadsToSpawn, 0 ) ):
+          self.__spawnWorkingThread()
+    finally:
+      self.__threadsLock.release()
 
   def __killExceedingWorkingThreads( self ):
-    threadsToKill = len( self.__workingThreadsList ) - self.__maxThreads
-    for i in range ( max( threadsToKill, 0 ) ):
-      self.__killWorkingThread()
-    threadsToKill = self.__countWaitingThreads() - self.__minThreads
-    for i in range ( max( threadsToKill, 0 ) ):
-      self.__killWorkingThread()
+    self.__threadsLock.acquire()
+    try:
+      threadsToKill = len( self.__workingThreadsList ) - self.__maxThreads
+      for i in range ( max( threadsToKill, 0 ) ):
+        self.__killWorkingThread()
+      if not self.__targetQueueLatency:
+        threadsToKill = self.__countWaitingThreads() - self.__minThreads
+        for i in range ( max( threadsToKill, 0 ) ):
+          self.__killWorkingThread()
+        return
+      #Idle threads are stopped one per second so that bursts don't respawn them
+      if time.time() - self.__lastShrinkTime < 1 or self.pendingJobs():
+        return
+      if self.__countWaitingThreads() > max( self.__minThreads, 1 ):
+        self.__killWorkingThread()
+        self.__lastShrinkTime = time.time()
+    finally:
+      self.__threadsLock.release()
 
 
   def queueJob( self, oTJob, blocking = True ):
     if not isinstance( oTJob, ThreadedJob ):
       raise TypeError( "Jobs added to the thread pool must be ThreadedJob instances" )
+    oTJob.setQueuedTime()
     try:
       self.__pendingQueue.put( oTJob, block = blocking )
     except Queue.Full:
+      self.__rejectedJobs += 1
       return S_ERROR( "Queue is full" )
+    #Don't wait for the pool thread if there aren't enough threads to take the jobs
+    if self.__targetQueueLatency and self.pendingJobs() > self.__countWaitingThreads() and \
+       len( self.__workingThreadsList ) < self.__maxThreads:
+      self.__spawnNeededWorkingThreads()
     return S_OK()
 
   def generateJobAndQueueIt( self,
@@ -239,8 +367,11 @@ class ThreadPool( threading.Thread ):
                              sTJId = None,
                              oCallback = None,
                              oExceptionCallback = None,
-                             blocking = True ):
-    oTJ = ThreadedJob( oCallable, args, kwargs, sTJId, oCallback, oExceptionCallback )
+                             blocking = True,
+                             maxQueueTime = 0,
+                             oShedCallback = None ):
+    oTJ = ThreadedJob( oCallable, args, kwargs, sTJId, oCallback, oExceptionCallback,
+                       maxQueueTime, oShedCallback )
     return self.queueJob( oTJ, blocking )
 
   def pendingJobs( self ):
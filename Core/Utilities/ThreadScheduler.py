@@ -30,6 +30,15 @@ class ThreadScheduler:
   def disableCreateReactorThread( self ):
     self.__createReactorThread = False
 
+  def afterFork( self ):
+    """
+    Only the thread calling fork survives in the child process. Start a new
+    executor there for the inherited tasks
+    """
+    self.__thId = False
+    if self.__hood:
+      self.__createExecutorIfNeeded()
+
   def addPeriodicTask( self, period, taskFunc, taskArgs = (), executions = 0, elapsedTime = 0 ):
     if not callable( taskFunc ):
       return S_ERROR( "%s is not callable" % str( taskFunc ) )
@@ -0,0 +1,82 @@
+########################################################################
+# $HeadURL $
+# File: CFGBenchmark.py
+########################################################################
+
+""" Benchmark of the CFG parser, serializer, clone and merge
+
+    Generates configurations with 1k to 100k options shaped like a CS
+    ( a Registry with many users and Systems with agents and services )
+    and measures the operations done at every agent start and refresh.
+
+    python CFGBenchmark.py [ repetitions ]
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+from DIRAC.Core.Utilities.CFG import CFG
+
+OPTION_COUNTS = ( 1000, 10000, 100000 )
+
+def generateCFG( numOptions ):
+  """ cfg text with about numOptions options """
+  lines = [ "# Generated configuration", "DIRAC", "{", "  Setup = Production",
+            "  Configuration", "  {", "    Version = 2011-03-04 05:06:07.000000", "  }", "}",
+            "Registry", "{", "  Users", "  {" ]
+  numUsers = numOptions / 10
+  for i in range( numUsers ):
+    lines.extend( [ "    user%06d" % i, "    {",
+                    "      DN = /DC=org/DC=example/OU=People/CN=user%06d" % i,
+                    "      Email = user%06d@example.org" % i, "    }" ] )
+  lines.extend( [ "  }", "}", "Systems", "{" ] )
+  numComponents = ( numOptions - numUsers * 2 ) / 8
+  for i in range( numComponents ):
+    if i % 50 == 0:
+      if i:
+        lines.extend( [ "    }", "  }" ] )
+      lines.extend( [ "  System%03d" % ( i / 50 ), "  {", "    Agents", "    {" ] )
+    lines.extend( [ "      # Agent number %s" % i, "      Agent%03d" % ( i % 50 ), "      {",
+                    "        PollingTime = 120", "        LogLevel = INFO",
+                    "        MaxCycles = 500", "        Status = Active",
+                    "        Sites = LCG.CERN.ch, LCG.CNAF.it, LCG.PIC.es",
+                    "        Sites += LCG.GRIDKA.de",
+                    "        Shifter = DataManager",
+                    "        Enabled = True", "      }" ] )
+  if numComponents:
+    lines.extend( [ "    }", "  }" ] )
+  lines.append( "}" )
+  return "\n".join( lines )
+
+def timeIt( function, repetitions ):
+  """ best time of the repetitions, less sensitive to the load of the machine """
+  best = False
+  for i in range( repetitions ):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    if best is False or elapsed < best:
+      best = elapsed
+  return max( best, 0.000001 )
+
+def main( repetitions ):
+  localCFG = CFG().loadFromBuffer( "DIRAC\n{\n  Setup = Certification\n}\nLocalSite\n{\n  Site = LCG.CERN.ch\n}\n" )
+  for numOptions in OPTION_COUNTS:
+    data = generateCFG( numOptions )
+    cfg = CFG().loadFromBuffer( data )
+    print "%s options (%.1f KiB, best of %s)" % ( numOptions, len( data ) / 1024.0, repetitions )
+    operations = ( ( "loadFromBuffer", lambda: CFG().loadFromBuffer( data ) ),
+                   ( "serialize", lambda: cfg.serialize() ),
+                   ( "clone", lambda: cfg.clone() ),
+                   ( "mergeWith", lambda: cfg.mergeWith( localCFG ) ),
+                   ( "clone + modify", lambda: cfg.clone()[ 'DIRAC' ].setOption( 'Setup', 'Test' ) ) )
+    for name, function in operations:
+      elapsed = timeIt( function, repetitions )
+      print "  %-16s %10.3f ms" % ( name, elapsed * 1000 )
+
+if __name__ == "__main__":
+  repetitions = 5
+  if len( sys.argv ) > 1:
+    repetitions = int( sys.argv[1] )
+  main( repetitions )
@@ -0,0 +1,102 @@
+########################################################################
+# $HeadURL $
+# File: CFGTestCase.py
+########################################################################
+
+""".. module:: CFGTestCase
+
+Test cases for DIRAC.Core.Utilities.CFG module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC.Core.Utilities.CFG import CFG
+import unittest
+
+CFG_DATA = """# The DIRAC section
+DIRAC
+{
+  Setup = Production
+  #A list
+  Sites = LCG.CERN.ch, LCG.PIC.es
+  Sites += LCG.CNAF.it
+  Equation = a = b
+  Configuration
+  {
+    Version = 2011-03-04
+  }
+}
+Registry
+{
+  Users
+  {
+    someuser
+    {
+      DN = /DC=org/CN=someuser
+    }
+  }
+}
+"""
+
+########################################################################
+class CFGTestCase( unittest.TestCase ):
+  """py:class CFGTestCase
+  Test case for DIRAC.Core.Utilities.CFG module.
+  """
+
+  def testParse( self ):
+    """ options, appended values, comments and sections """
+    cfg = CFG().loadFromBuffer( CFG_DATA )
+    self.assertEqual( cfg.listSections(), [ 'DIRAC', 'Registry' ] )
+    self.assertEqual( cfg[ 'DIRAC' ].listOptions(), [ 'Setup', 'Sites', 'Equation' ] )
+    self.assertEqual( cfg[ 'DIRAC' ][ 'Sites' ], "LCG.CERN.ch, LCG.PIC.es, LCG.CNAF.it" )
+    self.assertEqual( cfg[ 'DIRAC' ][ 'Equation' ], "a = b" )
+    self.assertEqual( cfg[ 'DIRAC' ].getComment( 'Sites' ), "A list\n" )
+    self.assertEqual( cfg.getOption( "/Registry/Users/someuser/DN" ), "/DC=org/CN=someuser" )
+    self.assertEqual( CFG().loadFromBuffer( cfg.serialize() ), cfg )
+
+  def testCloneIsolation( self ):
+    """ clones share the contents until modified """
+    cfg = CFG().loadFromBuffer( CFG_DATA )
+    clonedCFG = cfg.clone()
+    clonedCFG[ 'Registry' ][ 'Users' ][ 'someuser' ].setOption( 'DN', '/CN=other' )
+    cfg[ 'DIRAC' ].deleteKey( 'Setup' )
+    self.assertEqual( cfg.getOption( "/Registry/Users/someuser/DN" ), "/DC=org/CN=someuser" )
+    self.assertEqual( clonedCFG.getOption( "/Registry/Users/someuser/DN" ), "/CN=other" )
+    self.assertEqual( clonedCFG.getOption( "/DIRAC/Setup" ), "Production" )
+    self.assertEqual( cfg.getOption( "/DIRAC/Setup" ), None )
+
+  def testCloneHandedOutSections( self ):
+    """ sections got before cloning still modify only the original """
+    cfg = CFG()
+    section = cfg.createNewSection( 'A' )
+    subSection = section.createNewSection( 'B' )
+    clonedCFG = cfg.clone()
+    section.setOption( 'k', 'v' )
+    subSection.setOption( 'l', 'w' )
+    self.assertEqual( cfg.getOption( "/A/k" ), "v" )
+    self.assertEqual( cfg[ 'A' ][ 'B' ][ 'l' ], "w" )
+    self.assertEqual( clonedCFG[ 'A' ].listOptions(), [] )
+    self.assertEqual( clonedCFG[ 'A' ][ 'B' ].listOptions(), [] )
+    self.assert_( cfg[ 'A' ] is section )
+
+  def testMergeIsolation( self ):
+    """ merged CFGs don't modify the ones they come from """
+    cfg = CFG().loadFromBuffer( CFG_DATA )
+    localCFG = CFG().loadFromBuffer( "DIRAC\n{\n  Setup = Test\n}\nLocal\n{\n  Site = LCG.CERN.ch\n}\n" )
+    mergedCFG = cfg.mergeWith( localCFG )
+    self.assertEqual( mergedCFG.getOption( "/DIRAC/Setup" ), "Test" )
+    self.assertEqual( mergedCFG.getOption( "/DIRAC/Configuration/Version" ), "2011-03-04" )
+    mergedCFG.setOption( "Registry/Users/someuser/DN", "/CN=merged" )
+    mergedCFG[ 'Local' ].setOption( 'Site', 'LCG.PIC.es' )
+    self.assertEqual( cfg.getOption( "/Registry/Users/someuser/DN" ), "/DC=org/CN=someuser" )
+    self.assertEqual( localCFG.getOption( "/Local/Site" ), "LCG.CERN.ch" )
+    self.assertEqual( mergedCFG.getOption( "/Local/Site" ), "LCG.PIC.es" )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( CFGTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
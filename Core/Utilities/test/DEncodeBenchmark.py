@@ -0,0 +1,96 @@
+########################################################################
+# $HeadURL $
+# File: DEncodeBenchmark.py
+########################################################################
+
+""" Micro-benchmark of DEncode
+
+    Measures the encoding and decoding throughput of the generic and the fast
+    codecs for payloads like the ones exchanged by the DIRAC services.
+
+    python DEncodeBenchmark.py [ repetitions ]
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+import random
+import datetime
+from DIRAC.Core.Utilities import DEncode
+
+def jobAttributes( rand, numJobs ):
+  """ job id -> attributes, as returned by getJobsAttributes """
+  now = datetime.datetime( 2011, 3, 4, 5, 6, 7 )
+  result = {}
+  for jobID in range( 1000000, 1000000 + numJobs ):
+    result[ jobID ] = { 'JobID' : str( jobID ), 'Status' : rand.choice( [ 'Waiting', 'Running', 'Done' ] ),
+                        'MinorStatus' : 'Application Finished Successfully', 'Site' : 'LCG.CERN.ch',
+                        'Owner' : 'someuser', 'OwnerGroup' : 'some_user', 'JobGroup' : '00001234',
+                        'SubmissionTime' : now, 'LastUpdateTime' : now, 'RescheduleCounter' : 0,
+                        'UserPriority' : 1, 'VerifiedFlag' : True }
+  return { 'OK' : True, 'Value' : result }
+
+def replicaMap( rand, numFiles ):
+  """ lfn -> se -> pfn, as returned by getReplicas """
+  successful = {}
+  for i in range( numFiles ):
+    lfn = "/some/vo/data/2011/RAW/FULL/%08d/run_%08d_%04d.raw" % ( i // 100, i, rand.randint( 0, 9999 ) )
+    successful[ lfn ] = dict( [ ( se, "srm://%s.example.org:8443/srm/managerv2?SFN=/castor%s" % ( se, lfn ) )
+                                for se in rand.sample( [ 'CERN-RAW', 'CNAF-RAW', 'PIC-RAW', 'GRIDKA-RAW' ], 2 ) ] )
+  return { 'OK' : True, 'Value' : { 'Successful' : successful, 'Failed' : {} } }
+
+def accountingRecords( rand, numRecords ):
+  """ ( type, start, end, values ) lists, as sent by the DataStoreClient """
+  records = []
+  for i in range( numRecords ):
+    start = datetime.datetime( 2011, 3, 4, 5, 6, 7 )
+    records.append( ( 'Job', start, start, [ 'someuser', 'some_user', 'LCG.CERN.ch', 'MCSimulation', 'DIRAC',
+                                            'Done', 'Done', rand.randint( 0, 100000 ), rand.random() * 100,
+                                            rand.randint( 0, 10 ** 9 ), 1, 0, 0, 1, 0 ] ) )
+  return records
+
+def idList( rand, numIds ):
+  """ list of ints, as used for bulk job operations """
+  return [ rand.randint( 1, 10 ** 7 ) for i in range( numIds ) ]
+
+def timeIt( function, argument, repetitions ):
+  """ best time of the repetitions, less sensitive to the load of the machine """
+  best = False
+  for i in range( repetitions ):
+    start = time.time()
+    function( argument )
+    elapsed = time.time() - start
+    if best is False or elapsed < best:
+      best = elapsed
+  return max( best, 0.000001 )
+
+def main( repetitions ):
+  rand = random.Random( 1 )
+  payloads = ( ( "job attributes", jobAttributes( rand, 1000 ) ),
+               ( "replica map", replicaMap( rand, 2000 ) ),
+               ( "accounting records", accountingRecords( rand, 2000 ) ),
+               ( "job id list", idList( rand, 20000 ) ) )
+  codecs = ( ( "generic", DEncode.genericEncode, DEncode.genericDecode ),
+             ( "fast", DEncode.encode, DEncode.decode ) )
+  for name, payload in payloads:
+    encoded = DEncode.encode( payload )
+    megaBytes = len( encoded ) / 1048576.0
+    print "%s (%.1f KiB, best of %s)" % ( name, len( encoded ) / 1024.0, repetitions )
+    reference = False
+    for codecName, encodeFunction, decodeFunction in codecs:
+      encodeTime = timeIt( encodeFunction, payload, repetitions )
+      decodeTime = timeIt( decodeFunction, encoded, repetitions )
+      if not reference:
+        reference = ( encodeTime, decodeTime )
+      print "  %-8s encode %7.1f MiB/s %6.2fx   decode %7.1f MiB/s %6.2fx" % ( codecName,
+                                                                             megaBytes / encodeTime,
+                                                                             reference[0] / encodeTime,
+                                                                             megaBytes / decodeTime,
+                                                                             reference[1] / decodeTime )
+
+if __name__ == "__main__":
+  repetitions = 10
+  if len( sys.argv ) > 1:
+    repetitions = int( sys.argv[1] )
+  main( repetitions )
@@ -0,0 +1,78 @@
+########################################################################
+# $HeadURL $
+# File: DEncodeTestCase.py
+########################################################################
+
+""".. module:: DEncodeTestCase
+
+Test cases for DIRAC.Core.Utilities.DEncode module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC.Core.Utilities import DEncode
+import datetime
+import unittest
+
+########################################################################
+class DEncodeTestCase( unittest.TestCase ):
+  """py:class DEncodeTestCase
+  Test case for DIRAC.Core.Utilities.DEncode module.
+  """
+
+  def setUp( self ):
+    self.objects = [ 1, 2L ** 70, -3.5, 2.0 * 10 ** 20, 2.0 * 10 ** -10, True, "", "abc", u"\xe1\xe9",
+                     None, [], (), {}, datetime.datetime( 2011, 3, 4, 5, 6, 7, 8 ),
+                     datetime.date( 2011, 3, 4 ), datetime.time( 5, 6, 7 ),
+                     { 'OK' : True, 'Value' : [ ( "lfn%s" % i, { 'se' : "x" * i, 'size' : i * 1.5 } ) for i in range( 200 ) ] },
+                     [ [ [ [] ] ], ( {}, [ None ] ), { ( 1, 2 ) : [ datetime.date( 2011, 1, 1 ) ] } ] ]
+
+  def testFastCodec( self ):
+    """ fast codec has the same wire format as the generic one """
+    objects = self.objects + [ range( 100 ), [ 1, True, 2 ], [ 1, 2L ], [ "a", u"b" ], ( "x" * 5000, "y" ),
+                               { 'a' : 1, 2 : "b", 'c' : [ 1.5 ], 'd' : "z" * 5000, ( 1, ) : { None : False } } ]
+    for obj in objects:
+      encoded = DEncode.genericEncode( obj )
+      self.assertEqual( DEncode.encode( obj ), encoded )
+      self.assertEqual( DEncode.decode( encoded ), DEncode.genericDecode( encoded ) )
+    self.assertRaises( KeyError, DEncode.encode, object() )
+    self.assertRaises( KeyError, DEncode.decode, "x" )
+
+  def testEncodeInChunks( self ):
+    """ chunks join to the encoded string """
+    for obj in self.objects:
+      encoded = DEncode.encode( obj )
+      for chunkSize in ( 1, 7, 100, 1048576 ):
+        chunks = list( DEncode.encodeInChunks( obj, chunkSize ) )
+        self.assertEqual( "".join( chunks ), encoded )
+        for chunk in chunks[:-1]:
+          self.assert_( len( chunk ) >= chunkSize )
+
+  def testStreamDecoder( self ):
+    """ decoding chunk by chunk gives the same as decode """
+    for obj in self.objects:
+      encoded = DEncode.encode( obj )
+      for chunkSize in ( 1, 3, 64, len( encoded ) ):
+        decoder = DEncode.StreamDecoder()
+        for i in range( 0, len( encoded ), chunkSize ):
+          decoder.feed( encoded[ i : i + chunkSize ] )
+        self.assertEqual( decoder.getObject(), DEncode.decode( encoded )[0] )
+
+  def testRemainingData( self ):
+    """ data after the object is kept """
+    decoder = DEncode.StreamDecoder()
+    self.assertFalse( decoder.feed( "l" ) )
+    self.assertRaises( ValueError, decoder.getObject )
+    self.assert_( decoder.feed( "s3:abcei1" ) )
+    self.assertEqual( decoder.getObject(), [ "abc" ] )
+    decoder.feed( "2e" )
+    self.assertEqual( decoder.getRemainingData(), "i12e" )
+    self.assertRaises( ValueError, DEncode.StreamDecoder().feed, "x" )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( DEncodeTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
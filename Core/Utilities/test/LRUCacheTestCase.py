@@ -0,0 +1,91 @@
+########################################################################
+# $HeadURL $
+# File: LRUCacheTestCase.py
+########################################################################
+
+""".. module:: LRUCacheTestCase
+
+Test cases for DIRAC.Core.Utilities.LRUCache module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC.Core.Utilities.LRUCache import LRUCache
+import threading
+import unittest
+
+########################################################################
+class LRUCacheTestCase( unittest.TestCase ):
+  """py:class LRUCacheTestCase
+  Test case for DIRAC.Core.Utilities.LRUCache module.
+  """
+
+  def testGetAdd( self ):
+    """ get/add tests """
+    cache = LRUCache( 3 )
+    self.assertEqual( cache.get( "a" ), None )
+    self.assertEqual( cache.get( "a", False ), False )
+    cache.add( "a", 1 )
+    self.assertEqual( cache.get( "a" ), 1 )
+    cache.add( "a", 2 )
+    self.assertEqual( cache.get( "a" ), 2 )
+    self.assertEqual( len( cache ), 1 )
+    self.assertEqual( cache.getStats()[ 'Hits' ], 2 )
+    self.assertEqual( cache.getStats()[ 'Misses' ], 2 )
+
+  def testEviction( self ):
+    """ least recently used entry is dropped """
+    cache = LRUCache( 3 )
+    for key in ( "a", "b", "c" ):
+      cache.add( key, key )
+    # refresh a, b is now the oldest
+    cache.get( "a" )
+    cache.add( "d", "d" )
+    self.assertEqual( len( cache ), 3 )
+    self.assertFalse( cache.exists( "b" ) )
+    self.assertEqual( cache.getKeys(), [ "d", "a", "c" ] )
+    # replacing refreshes too
+    cache.add( "c", "C" )
+    cache.add( "e", "e" )
+    self.assertEqual( cache.getKeys(), [ "e", "c", "d" ] )
+
+  def testDelete( self ):
+    """ delete/purgeAll tests """
+    cache = LRUCache( 2 )
+    cache.add( "a", 1 )
+    cache.add( "b", 2 )
+    cache.delete( "a" )
+    cache.delete( "x" )
+    self.assertEqual( cache.getKeys(), [ "b" ] )
+    cache.purgeAll()
+    self.assertEqual( len( cache ), 0 )
+    self.assertEqual( cache.getKeys(), [] )
+    cache.add( "c", 3 )
+    self.assertEqual( cache.get( "c" ), 3 )
+    self.assertRaises( ValueError, LRUCache, 0 )
+
+  def testThreads( self ):
+    """ concurrent access keeps the cache bounded and consistent """
+    cache = LRUCache( 50 )
+    def work( offset ):
+      for i in range( 1000 ):
+        key = ( offset + i ) % 80
+        value = cache.get( key )
+        if value is not None:
+          self.assertEqual( value, key * 2 )
+        cache.add( key, key * 2 )
+    threads = [ threading.Thread( target = work, args = ( i * 7, ) ) for i in range( 5 ) ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual( len( cache ), 50 )
+    self.assertEqual( len( cache.getKeys() ), 50 )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( LRUCacheTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
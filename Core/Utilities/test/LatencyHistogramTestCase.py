@@ -0,0 +1,61 @@
+########################################################################
+# $HeadURL $
+# File: LatencyHistogramTestCase.py
+########################################################################
+
+""".. module:: LatencyHistogramTestCase
+
+Test cases for DIRAC.Core.Utilities.LatencyHistogram module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC.Core.Utilities.LatencyHistogram import LatencyHistogram
+import random
+import unittest
+
+########################################################################
+class LatencyHistogramTestCase( unittest.TestCase ):
+  """py:class LatencyHistogramTestCase
+  Test case for DIRAC.Core.Utilities.LatencyHistogram module.
+  """
+
+  def testEmpty( self ):
+    """ empty histogram """
+    histogram = LatencyHistogram()
+    self.assertEqual( histogram.getCount(), 0 )
+    self.assertEqual( histogram.getMean(), 0.0 )
+    self.assertEqual( histogram.getPercentile( 99 ), 0.0 )
+    self.assertRaises( ValueError, LatencyHistogram, 0 )
+    self.assertRaises( ValueError, LatencyHistogram, 0.001, 1 )
+
+  def testPercentiles( self ):
+    """ percentiles within the bucket width of the exact ones """
+    rand = random.Random( 1 )
+    values = [ rand.expovariate( 10 ) for i in range( 10000 ) ]
+    histogram = LatencyHistogram()
+    for value in values:
+      histogram.add( value )
+    values.sort()
+    self.assertEqual( histogram.getCount(), len( values ) )
+    self.assertAlmostEqual( histogram.getMean(), sum( values ) / len( values ) )
+    self.assertEqual( histogram.getMax(), values[-1] )
+    for percentile in ( 1, 50, 95, 99, 100 ):
+      exact = values[ max( 0, len( values ) * percentile / 100 - 1 ) ]
+      estimated = histogram.getPercentile( percentile )
+      self.assert_( exact <= estimated <= exact * 1.1 + 0.0001, "p%s %s vs %s" % ( percentile, estimated, exact ) )
+
+  def testSmallValues( self ):
+    """ values below the first bucket """
+    histogram = LatencyHistogram( 0.01 )
+    for value in ( 0, 0.001, 0.005 ):
+      histogram.add( value )
+    self.assertEqual( histogram.getPercentile( 50 ), 0.005 )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( LatencyHistogramTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
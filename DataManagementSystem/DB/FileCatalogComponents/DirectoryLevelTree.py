@@ -134,16 +134,19 @@ class DirectoryLevelTree(DirectoryTreeBase):
       lPath = "LPATH%d" % (level)
       result = self.db._getConnection()
       conn = result['Value']
-      req = "LOCK TABLES FC_DirectoryLevelTree WRITE; "
-      result = self.db._query(req,conn)
-      req = " SELECT @tmpvar:=max(%s)+1 FROM FC_DirectoryLevelTree WHERE Parent=%d; " % (lPath,parentDirID) 
-      result = self.db._query(req,conn)
-      req = "UPDATE FC_DirectoryLevelTree SET %s=@tmpvar WHERE DirID=%d; " % (lPath,dirID)   
-      result = self.db._update(req,conn)
-      req = "UNLOCK TABLES;"
-      result = self.db._query(req,conn)      
-      if not result['OK']:
-        return result
+      try:
+        req = "LOCK TABLES FC_DirectoryLevelTree WRITE; "
+        result = self.db._query(req,conn)
+        req = " SELECT @tmpvar:=max(%s)+1 FROM FC_DirectoryLevelTree WHERE Parent=%d; " % (lPath,parentDirID) 
+        result = self.db._query(req,conn)
+        req = "UPDATE FC_DirectoryLevelTree SET %s=@tmpvar WHERE DirID=%d; " % (lPath,dirID)   
+        result = self.db._update(req,conn)
+        req = "UNLOCK TABLES;"
+        result = self.db._query(req,conn)      
+        if not result['OK']:
+          return result
+      finally:
+        conn.release()
     return S_OK(dirID)
 
   def makeDir_andrei(self,path):
@@ -190,35 +193,38 @@ class DirectoryLevelTree(DirectoryTreeBase):
       
     result = self.db._getConnection()
     conn = result['Value']  
-    result = self.db._query("LOCK TABLES FC_DirectoryLevelTree WRITE; ",conn)
-    result = self.db._insert('FC_DirectoryLevelTree',names,values,conn)    
-    if not result['OK']:
-      resUnlock = self.db._query("UNLOCK TABLES;",conn)      
-      if result['Message'].find('Duplicate') != -1:
-        #The directory is already added
-        resFind = self.findDir(path)
-        if not resFind['OK']:
-          return resFind
-        dirID = resFind['Value']
-        result = S_OK(dirID)
-        result['NewDirectory'] = False
-        return result
-      else:
-        return result 
-    dirID = result['lastRowId']
-    
-    # Update the path number
-    if parentDirID:
-      lPath = "LPATH%d" % (level)
-      req = " SELECT @tmpvar:=max(%s)+1 FROM FC_DirectoryLevelTree WHERE Parent=%d; " % (lPath,parentDirID) 
-      result = self.db._query(req,conn)
-      req = "UPDATE FC_DirectoryLevelTree SET %s=@tmpvar WHERE DirID=%d; " % (lPath,dirID)   
-      result = self.db._update(req,conn)
-      result = self.db._query("UNLOCK TABLES;",conn)      
+    try:
+      result = self.db._query("LOCK TABLES FC_DirectoryLevelTree WRITE; ",conn)
+      result = self.db._insert('FC_DirectoryLevelTree',names,values,conn)    
       if not result['OK']:
-        return result
-    else:
-      result = self.db._query("UNLOCK TABLES;",conn)     
+        resUnlock = self.db._query("UNLOCK TABLES;",conn)      
+        if result['Message'].find('Duplicate') != -1:
+          #The directory is already added
+          resFind = self.findDir(path)
+          if not resFind['OK']:
+            return resFind
+          dirID = resFind['Value']
+          result = S_OK(dirID)
+          result['NewDirectory'] = False
+          return result
+        else:
+          return result 
+      dirID = result['lastRowId']
+    
+      # Update the path number
+      if parentDirID:
+        lPath = "LPATH%d" % (level)
+        req = " SELECT @tmpvar:=max(%s)+1 FROM FC_DirectoryLevelTree WHERE Parent=%d; " % (lPath,parentDirID) 
+        result = self.db._query(req,conn)
+        req = "UPDATE FC_DirectoryLevelTree SET %s=@tmpvar WHERE DirID=%d; " % (lPath,dirID)   
+        result = self.db._update(req,conn)
+        result = self.db._query("UNLOCK TABLES;",conn)      
+        if not result['OK']:
+          return result
+      else:
+        result = self.db._query("UNLOCK TABLES;",conn)     
+    finally:
+      conn.release()
       
     result = S_OK(dirID)
     result['NewDirectory'] = True
@@ -152,9 +152,9 @@ class FileManager(FileManagerBase):
       dirID = lfns[lfn]['DirID']
       fileName = os.path.basename(lfn)
       size = lfns[lfn]['Size']
-      insertTuples.append("(%d,%d,%d,%d,%d,'%s')" % (dirID,size,uid,gid,statusID,fileName))
-    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES %s" % (','.join(insertTuples))
-    res = self.db._update(req,connection)
+      insertTuples.append((dirID,size,uid,gid,statusID,fileName))
+    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName) VALUES (%s,%s,%s,%s,%s,%s)"
+    res = self.db._updateMany(req,insertTuples,connection)
     if not res['OK']:
       return res
     # Get the fileIDs for the inserted files
@@ -180,10 +180,10 @@ class FileManager(FileManagerBase):
       guid = fileInfo.get('GUID','')
       dirName = os.path.dirname(lfn)
       toDelete.append(fileID)
-      insertTuples.append("(%d,'%s','%s','%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d)" % (fileID,guid,checksum,checksumtype,self.db.umask))
+      insertTuples.append((fileID,guid,checksum,checksumtype,self.db.umask))
     if insertTuples:
-      req = "INSERT INTO FC_FileInfo (FileID,GUID,Checksum,CheckSumType,CreationDate,ModificationDate,Mode) VALUES %s" % ','.join(insertTuples)
-      res = self.db._update(req)
+      req = "INSERT INTO FC_FileInfo (FileID,GUID,Checksum,CheckSumType,CreationDate,ModificationDate,Mode) VALUES (%s,%s,%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%s)"
+      res = self.db._updateMany(req,insertTuples)
       if not res['OK']:
         self._deleteFiles(toDelete,connection=connection)
         for lfn in lfns.keys():
@@ -281,8 +281,8 @@ class FileManager(FileManagerBase):
         for seID,repID in repDict.items():
           successful[fileIDLFNs[fileID]] = True
           insertTuples.remove((fileID,seID))
-    req = "INSERT INTO FC_Replicas (FileID,SEID,Status) VALUES %s" % (','.join(["(%d,%d,%d)" % (tuple[0],tuple[1],statusID) for tuple in insertTuples]))
-    res = self.db._update(req,connection)
+    req = "INSERT INTO FC_Replicas (FileID,SEID,Status) VALUES (%s,%s,%s)"
+    res = self.db._updateMany(req,[(fileID,seID,statusID) for fileID,seID in insertTuples],connection)
     if not res['OK']:
       return res
     res = self._getRepIDsForReplica(insertTuples, connection=connection)
@@ -317,10 +317,10 @@ class FileManager(FileManagerBase):
         return res
       seID = res['Value']
       toDelete.append(repID)
-      insertTuples.append("(%d,'%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),'%s')" % (repID,replicaType,pfn))    
+      insertTuples.append((repID,replicaType,pfn))
     if insertTuples:
-      req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % (','.join(insertTuples))
-      res = self.db._update(req,connection)    
+      req = "INSERT INTO FC_ReplicaInfo (RepID,RepType,CreationDate,ModificationDate,PFN) VALUES (%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%s)"
+      res = self.db._updateMany(req,insertTuples,connection)    
       if not res['OK']:
         for lfn in lfns.keys():
           failed[lfn] = res['Message']
@@ -18,12 +18,7 @@ class FileManagerBase:
     self.statusDict = {}
 
   def _getConnection( self, connection ):
-    if connection:
-      return connection
-    res = self.db._getConnection()
-    if res['OK']:
-      return res['Value']
-    gLogger.warn( "Failed to get MySQL connection", res['Message'] )
+    # Without a connection each query takes one from the pool and gives it back
     return connection
 
   def setDatabase( self, database ):
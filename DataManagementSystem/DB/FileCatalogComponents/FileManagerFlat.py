@@ -97,9 +97,9 @@ class FileManagerFlat(FileManagerBase):
       if not directoryFiles.has_key(dirName):
         directoryFiles[dirName] = []
       directoryFiles[dirName].append(fileName)  
-      insertTuples.append("(%d,%d,%d,%d,%d,'%s','%s','%s','%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),%d)" % (dirID,size,uid,gid,statusID,fileName,guid,checksum,checksumtype,self.db.umask))
-    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode) VALUES %s" % (','.join(insertTuples))
-    res = self.db._update(req,connection)
+      insertTuples.append((dirID,size,uid,gid,statusID,fileName,guid,checksum,checksumtype,self.db.umask))
+    req = "INSERT INTO FC_Files (DirID,Size,UID,GID,Status,FileName,GUID,Checksum,ChecksumType,CreationDate,ModificationDate,Mode) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%s)"
+    res = self.db._updateMany(req,insertTuples,connection)
     if not res['OK']:
       return res
     # Get the fileIDs for the inserted files
@@ -201,11 +201,11 @@ class FileManagerFlat(FileManagerBase):
         directorySESizeDict[dirID][seID] = {'Files':0,'Size':0}
       directorySESizeDict[dirID][seID]['Size'] += lfns[lfn]['Size']
       directorySESizeDict[dirID][seID]['Files'] += 1
-      insertTuples[lfn] = ("(%d,%d,%d,'%s',UTC_TIMESTAMP(),UTC_TIMESTAMP(),'%s')" % (fileID,seID,statusID,replicaType,pfn))
+      insertTuples[lfn] = (fileID,seID,statusID,replicaType,pfn)
       deleteTuples.append((fileID,seID))
     if insertTuples:
-      req = "INSERT INTO FC_Replicas (FileID,SEID,Status,RepType,CreationDate,ModificationDate,PFN) VALUES %s" % ','.join(insertTuples.values())
-      res = self.db._update(req,connection)
+      req = "INSERT INTO FC_Replicas (FileID,SEID,Status,RepType,CreationDate,ModificationDate,PFN) VALUES (%s,%s,%s,%s,UTC_TIMESTAMP(),UTC_TIMESTAMP(),%s)"
+      res = self.db._updateMany(req,insertTuples.values(),connection)
       if not res['OK']:
         self.__deleteReplicas(deleteTuples,connection=connection)
         for lfn in insertTuples.keys():
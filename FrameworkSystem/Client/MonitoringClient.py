@@ -63,6 +63,7 @@ class MonitoringClient:
     self.timeStep = 60
     self.__initialized = False
     self.__enabled = True
+    self.__marksForwarder = False
 
   def disable( self ):
     self.__enabled = False
@@ -154,7 +155,7 @@ class MonitoringClient:
       return
     self.activitiesLock.acquire()
     try:
-      self.logger.debug( "Registering activity %s" % name )
+      self.logger.debug( "Registering activity", name )
       if name not in self.activitiesDefinitions:
         self.activitiesDefinitions[ name ] = { "category" : category,
                                                "description" : description,
@@ -167,6 +168,46 @@ class MonitoringClient:
     finally:
       self.activitiesLock.release()
 
+  def setMarksForwarder( self, marksForwarder ):
+    """
+    Hand the marks to a function instead of sending them to the server. It is
+    called periodically with the activities definitions and the raw marks
+
+    @type  marksForwarder: callable
+    @param marksForwarder: Function receiving ( activitiesDefinitions, activitiesMarks )
+    """
+    self.__marksForwarder = marksForwarder
+    ThreadScheduler.gThreadScheduler.addPeriodicTask( 60, self.flush )
+
+  def addForwardedMarks( self, activitiesDefinitions, activitiesMarks ):
+    """
+    Add the raw marks forwarded by another client, for instance a clone of the service
+
+    @type  activitiesDefinitions: dictionary
+    @param activitiesDefinitions: Definitions of the activities of the other client
+    @type  activitiesMarks: dictionary
+    @param activitiesMarks: Activity -> step time -> list of marks
+    """
+    for name in activitiesMarks:
+      if name not in self.activitiesDefinitions:
+        if name not in activitiesDefinitions:
+          continue
+        acDef = activitiesDefinitions[ name ]
+        self.registerActivity( name, acDef[ 'description' ], acDef[ 'category' ], acDef[ 'unit' ],
+                               acDef[ 'type' ], acDef[ 'bucketLength' ] )
+    self.activitiesLock.acquire()
+    try:
+      for name in activitiesMarks:
+        if name not in self.activitiesMarks:
+          continue
+        for markTime in activitiesMarks[ name ]:
+          if markTime in self.activitiesMarks[ name ]:
+            self.activitiesMarks[ name ][ markTime ].extend( activitiesMarks[ name ][ markTime ] )
+          else:
+            self.activitiesMarks[ name ][ markTime ] = list( activitiesMarks[ name ][ markTime ] )
+    finally:
+      self.activitiesLock.release()
+
   def __UTCStepTime( self, acName ):
     stepLength = self.activitiesDefinitions[ acName ][ 'bucketLength' ]
     nowEpoch = int( Time.toEpoch() )
@@ -191,7 +232,7 @@ class MonitoringClient:
       raise Exception( "Value %s is not valid" % value )
     self.activitiesLock.acquire()
     try:
-      self.logger.debug( "Adding mark to %s" % name )
+      self.logger.debug( "Adding mark to", name )
       markTime = self.__UTCStepTime( name )
       if markTime in self.activitiesMarks[ name ]:
         self.activitiesMarks[ name ][ markTime ].append( value )
@@ -235,6 +276,8 @@ class MonitoringClient:
   def flush( self, allData = False ):
     if not self.__enabled or not self.__initialized:
       return
+    if self.__marksForwarder:
+      return self.__forwardMarks()
     self.flushingLock.acquire()
     self.logger.debug( "Sending information to server" )
     try:
@@ -252,6 +295,18 @@ class MonitoringClient:
     finally:
       self.flushingLock.release()
 
+  def __forwardMarks( self ):
+    self.activitiesLock.acquire()
+    try:
+      acMarks = self.activitiesMarks
+      self.activitiesMarks = dict( [ ( name, {} ) for name in acMarks ] )
+    finally:
+      self.activitiesLock.release()
+    try:
+      self.__marksForwarder( self.activitiesDefinitions, acMarks )
+    except Exception, e:
+      self.logger.error( "Can't forward activities marks", str( e ) )
+
   def __disabled( self ):
     return gConfig.getValue( "%s/DisableMonitoring" % self.cfgSection, "false" ).lower() in \
         ( "yes", "y", "true", "1" )
@@ -104,10 +104,6 @@ class ProxyDB( DB ):
     """
     Generate a request  and store it for a given proxy Chain
     """
-    retVal = self._getConnection()
-    if not retVal[ 'OK' ]:
-      return retVal
-    connObj = retVal[ 'Value' ]
     retVal = proxyChain.generateProxyRequest()
     if not retVal[ 'OK' ]:
       return retVal
@@ -124,7 +120,7 @@ class ProxyDB( DB ):
     cmd += " VALUES ( 0, '%s', '%s', TIMESTAMPADD( SECOND, %s, UTC_TIMESTAMP() ) )" % ( userDN,
                                                                               allStr,
                                                                               self.__defaultRequestLifetime )
-    retVal = self._update( cmd, conn = connObj )
+    retVal = self._update( cmd )
     if not retVal[ 'OK' ]:
       return retVal
     #99% of the times we will stop here
@@ -520,12 +516,8 @@ class ProxyDB( DB ):
     return S_OK( ( chain, secsLeft ) )
 
   def __storeVOMSProxy( self, userDN, userGroup, vomsAttr, chain ):
-    retVal = self._getConnection()
-    if not retVal[ 'OK' ]:
-      return retVal
-    connObj = retVal[ 'Value' ]
     cmd = "DELETE FROM `ProxyDB_VOMSProxies` WHERE UserDN='%s' AND UserGroup='%s' AND VOMSAttr='%s'" % ( userDN, userGroup, vomsAttr )
-    retVal = self._update( cmd, conn = connObj )
+    retVal = self._update( cmd )
     if not retVal[ 'OK' ]:
       return retVal
     retVal1 = VOMS().getVOMSProxyInfo( chain, 'actimeleft' )
@@ -545,7 +537,7 @@ class ProxyDB( DB ):
     cmd = "INSERT INTO `ProxyDB_VOMSProxies` ( UserDN, UserGroup, VOMSAttr, Pem, ExpirationTime ) VALUES "
     cmd += "( '%s', '%s', '%s', '%s', TIMESTAMPADD( SECOND, %s, UTC_TIMESTAMP() ) )" % ( userDN, userGroup,
                                                                                          vomsAttr, pemData, secsLeft )
-    result = self._update( cmd, conn = connObj )
+    result = self._update( cmd )
     if not result[ 'OK' ]:
       return result
     return S_OK( secsLeft )
@@ -35,17 +35,17 @@ class SystemLoggingDB(DB):
     DB.__init__( self, 'SystemLoggingDB', 'Framework/SystemLoggingDB',
                  maxQueueSize)
 
-  def _query( self, cmd, conn=False ):
+  def _query( self, cmd, conn=False, params=None ):
     start = time.time()
-    ret = DB._query( self, cmd, conn )
+    ret = DB._query( self, cmd, conn, params )
     if DEBUG:
       print >> debugFile, time.time() - start, cmd.replace('\n','')
       debugFile.flush()
     return ret
 
-  def _update( self, cmd, conn=False ):
+  def _update( self, cmd, conn=False, params=None ):
     start = time.time()
-    ret = DB._update( self, cmd, conn )
+    ret = DB._update( self, cmd, conn, params )
     if DEBUG:
       print >> debugFile, time.time() - start, cmd.replace('\n','')
       debugFile.flush()
@@ -447,7 +447,7 @@ class UserProfileDB( DB ):
       userIds = result[ 'Value' ]
       return self.storeVarByUserId( userIds, profileName, varName, data, perms = perms, connObj = connObj )
     finally:
-      connObj.close()
+      connObj.release()
 
   def deleteVar( self, userName, userGroup, profileName, varName ):
     """
@@ -464,7 +464,7 @@ class UserProfileDB( DB ):
       userIds = result[ 'Value' ]
       return self.deleteVarByUserId( userIds, profileName, varName, connObj = connObj )
     finally:
-      connObj.close()
+      connObj.release()
 
   def __profilesCondGenerator( self, value, type, initialValue = False ):
     if type( value ) in types.StringTypes:
@@ -593,7 +593,7 @@ class UserProfileDB( DB ):
       userIds = result[ 'Value' ]
       return self.storeHashTagById( userIds, tagName, hashTag, connObj = connObj )
     finally:
-      connObj.close()
+      connObj.release()
 
   def retrieveHashTag( self, userName, userGroup, hashTag ):
     """
@@ -610,7 +610,7 @@ class UserProfileDB( DB ):
       userIds = result[ 'Value' ]
       return self.retrieveHashTagById( userIds, hashTag, connObj = connObj )
     finally:
-      connObj.close()
+      connObj.release()
 
   def retrieveAllHashTags( self, userName, userGroup ):
     """
@@ -627,4 +627,4 @@ class UserProfileDB( DB ):
       userIds = result[ 'Value' ]
       return self.retrieveAllHashTagsById( userIds, connObj = connObj )
     finally:
-      connObj.close()
+      connObj.release()
@@ -9,7 +9,6 @@ import traceback
 import os
 import os.path
 import re
-import inspect
 import Queue
 from DIRAC.FrameworkSystem.private.logging.LogLevels import LogLevels
 from DIRAC.FrameworkSystem.private.logging.Message import Message
@@ -31,6 +30,10 @@ class Logger:
     self._outputList = []
     self._subLoggersDict = {}
     self._logLevels = LogLevels()
+    #Absolute value of each level, compared with the minimum one before building any message
+    self._levelValues = {}
+    for levelName in self._logLevels.getLevels():
+      self._levelValues[ levelName ] = abs( self._logLevels.getLevelValue( levelName ) )
     self.__backendOptions = { 'showHeaders' : True }
     self.__preinitialize()
     self.__initialized = False
@@ -123,6 +126,9 @@ class Logger:
     levelName = levelName.upper()
     if levelName.upper() in self._logLevels.getLevels():
       self._minLevel = abs( self._logLevels.getLevelValue( levelName ) )
+      #Sub loggers discard messages with the level of their master
+      for subLogger in self._subLoggersDict.values():
+        subLogger.setLevel( levelName )
       return True
     return False
 
@@ -131,6 +137,8 @@ class Logger:
     return self._systemName
 
   def always( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.always ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.always,
                              Time.dateTime(),
@@ -140,6 +148,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def notice( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.notice ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.notice,
                              Time.dateTime(),
@@ -149,6 +159,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def info( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.info ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.info,
                              Time.dateTime(),
@@ -158,6 +170,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def verbose( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.verbose ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.verbose,
                              Time.dateTime(),
@@ -167,6 +181,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def debug( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.debug ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.debug,
                              Time.dateTime(),
@@ -176,6 +192,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def warn( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.warn ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.warn,
                              Time.dateTime(),
@@ -185,6 +203,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def error( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.error ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.error,
                              Time.dateTime(),
@@ -194,6 +214,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def exception( self, sMsg = "", sVarMsg = '', lException = False, lExcInfo = False ):
+    if self._levelValues[ self._logLevels.exception ] < self._minLevel:
+      return True
     if sVarMsg:
       sVarMsg += "\n%s" % self.__getExceptionString( lException, lExcInfo )
     else:
@@ -207,6 +229,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def fatal( self, sMsg, sVarMsg = '' ):
+    if self._levelValues[ self._logLevels.fatal ] < self._minLevel:
+      return True
     messageObject = Message( self._systemName,
                              self._logLevels.fatal,
                              Time.dateTime(),
@@ -216,6 +240,8 @@ class Logger:
     return self.processMessage( messageObject )
 
   def showStack( self ):
+    if self._levelValues[ self._logLevels.debug ] < self._minLevel:
+      return
     messageObject = Message( self._systemName,
                              self._logLevels.debug,
                              Time.dateTime(),
@@ -233,7 +259,7 @@ class Logger:
   #S_OK()
 
   def __testLevel( self, sLevel ):
-    return abs( self._logLevels.getLevelValue( sLevel ) ) >= self._minLevel
+    return self._levelValues[ sLevel ] >= self._minLevel
 
   def _processMessage( self, messageObject ):
     for backend in self._backendsDict:
@@ -274,10 +300,9 @@ class Logger:
 
   def __discoverCallingFrame( self ):
     if self.__testLevel( self._logLevels.debug ) and self._showCallingFrame:
-      oActualFrame = inspect.currentframe()
-      lOuterFrames = inspect.getouterframes( oActualFrame )
-      lCallingFrame = lOuterFrames[2]
-      return "%s:%s" % ( lCallingFrame[1].replace( sys.path[0], "" )[1:], lCallingFrame[2] )
+      #Only the caller of the logging method is needed, inspect would read the source of the whole stack
+      oCallingFrame = sys._getframe( 2 )
+      return "%s:%s" % ( oCallingFrame.f_code.co_filename.replace( sys.path[0], "" )[1:], oCallingFrame.f_lineno )
     else:
       return ""
 
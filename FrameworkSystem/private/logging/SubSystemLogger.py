@@ -16,6 +16,7 @@ class SubSystemLogger( Logger ):
         setattr( self, attrName, attrValue )
     self.__masterLogger = masterLogger
     self._subName = subName
+    self._minLevel = masterLogger._minLevel
 
   def processMessage( self, messageObject ):
     if self.__child:
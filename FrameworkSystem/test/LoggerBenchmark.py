@@ -0,0 +1,54 @@
+########################################################################
+# $HeadURL $
+# File: LoggerBenchmark.py
+########################################################################
+
+""" Benchmark of the logging calls
+
+    Measures the cost of debug, verbose and info calls of a sub logger
+    when their level is not shown, which is what hot paths pay on every
+    call, and compares it with an empty function call and a shown message.
+
+    python LoggerBenchmark.py [ calls ]
+"""
+
+__RCSID__ = "$Id $"
+
+import sys
+import time
+from DIRAC.FrameworkSystem.private.logging.Logger import Logger
+
+def timeIt( function, calls ):
+  """ microseconds per call, best of three rounds """
+  best = False
+  for i in range( 3 ):
+    start = time.time()
+    for j in xrange( calls ):
+      function()
+    elapsed = time.time() - start
+    if best is False or elapsed < best:
+      best = elapsed
+  return best * 1000000.0 / calls
+
+def main( calls ):
+  logger = Logger()
+  logger.registerBackends( [] )
+  logger.setLevel( "NOTICE" )
+  subLogger = logger.getSubLogger( "Benchmark" )
+  records = [ ( i, "/DC=org/CN=user%s" % i, 3.5 ) for i in range( 100 ) ]
+  def noop( sMsg, sVarMsg = '' ):
+    pass
+  operations = ( ( "empty function", lambda: noop( "_query:", records ) ),
+                 ( "debug not shown", lambda: subLogger.debug( "_query:", records ) ),
+                 ( "verbose not shown", lambda: subLogger.verbose( "_query:", records ) ),
+                 ( "info not shown", lambda: subLogger.info( "_query:", records ) ),
+                 ( "notice shown", lambda: subLogger.notice( "_query:", records ) ) )
+  print "Sub logger at NOTICE level without backends (%s calls)" % calls
+  for name, function in operations:
+    print "  %-18s %8.3f us" % ( name, timeIt( function, calls ) )
+
+if __name__ == "__main__":
+  calls = 100000
+  if len( sys.argv ) > 1:
+    calls = int( sys.argv[1] )
+  main( calls )
@@ -32,12 +32,7 @@ class StorageManagementDB( DB ):
     self.STAGEPARAMS = ['ReplicaID', 'StageStatus', 'RequestID', 'StageRequestSubmitTime', 'StageRequestCompletedTime', 'PinLength', 'PinExpiryTime']
 
   def __getConnection( self, connection ):
-    if connection:
-      return connection
-    res = self._getConnection()
-    if res['OK']:
-      return res['Value']
-    gLogger.warn( "Failed to get MySQL connection", res['Message'] )
+    # Without a connection each query takes one from the pool and gives it back
     return connection
 
   def _caller( self ):
@@ -1301,15 +1301,11 @@ class TransformationDB( DB ):
     req = "INSERT INTO TransformationTasks(TransformationID, ExternalStatus, ExternalID, TargetSE, CreationTime, LastUpdateTime) VALUES\
      (%s,'%s','%d','%s', UTC_TIMESTAMP(), UTC_TIMESTAMP());" % ( transID, 'Created', 0, se )
     res = self._update( req, connection )
-    if not res['OK']:
-      self.lock.release()
-      gLogger.error( "Failed to publish task for transformation", res['Message'] )
-      return res
-    res = self._query( "SELECT LAST_INSERT_ID();", connection )
     self.lock.release()
     if not res['OK']:
+      gLogger.error( "Failed to publish task for transformation", res['Message'] )
       return res
-    taskID = int( res['Value'][0][0] )
+    taskID = int( res['lastRowId'] )
     gLogger.verbose( "Published task %d for transformation %d." % ( taskID, transID ) )
     # If we have input data then update their status, and taskID in the transformation table
     if lfns:
@@ -1411,12 +1407,7 @@ class TransformationDB( DB ):
     return self._update( req, connection )
 
   def __getConnection( self, connection ):
-    if connection:
-      return connection
-    res = self._getConnection()
-    if res['OK']:
-      return res['Value']
-    gLogger.warn( "Failed to get MySQL connection", res['Message'] )
+    # Without a connection each query takes one from the pool and gives it back
     return connection
 
   def _getConnectionTransID( self, connection, transName ):
@@ -75,104 +75,105 @@ class PilotStatusAgent( AgentModule ):
     else:
       return result
 
-    result = self.pilotDB.getPilotGroups( self.identityFieldsList,
-                                         {'Status': self.queryStateList } )
-    if not result['OK']:
-      self.log.error( 'Fail to get identities Groups', result['Message'] )
-      return result
-    if not result['Value']:
-      return S_OK()
-
-    pilotsToAccount = {}
-
-    for ownerDN, ownerGroup, gridType, broker in result['Value']:
-
-      if not gridType in self.eligibleGridTypes:
-        continue
+    try:
+      result = self.pilotDB.getPilotGroups( self.identityFieldsList,
+                                           {'Status': self.queryStateList } )
+      if not result['OK']:
+        self.log.error( 'Fail to get identities Groups', result['Message'] )
+        return result
+      if not result['Value']:
+        return S_OK()
 
-      self.log.verbose( 'Getting pilots for %s:%s @ %s %s' % ( ownerDN, ownerGroup, gridType, broker ) )
+      pilotsToAccount = {}
 
-      condDict1 = {'Status':'Done',
-                   'StatusReason':'Report from JobAgent',
-                   'OwnerDN':ownerDN,
-                   'OwnerGroup':ownerGroup,
-                   'GridType':gridType,
-                   'Broker':broker}
+      for ownerDN, ownerGroup, gridType, broker in result['Value']:
 
-      condDict2 = {'Status':self.queryStateList,
-                   'OwnerDN':ownerDN,
-                   'OwnerGroup':ownerGroup,
-                   'GridType':gridType,
-                   'Broker':broker}
+        if not gridType in self.eligibleGridTypes:
+          continue
 
-      for condDict in [ condDict1, condDict2]:
-        result = self.clearWaitingPilots( condDict )
-        if not result['OK']:
-          self.log.warn( 'Failed to clear Waiting Pilot Jobs' )
+        self.log.verbose( 'Getting pilots for %s:%s @ %s %s' % ( ownerDN, ownerGroup, gridType, broker ) )
 
-        result = self.pilotDB.selectPilots( condDict )
-        if not result['OK']:
-          self.log.warn( 'Failed to get the Pilot Agents' )
-          return result
-        if not result['Value']:
-          continue
-        refList = result['Value']
+        condDict1 = {'Status':'Done',
+                     'StatusReason':'Report from JobAgent',
+                     'OwnerDN':ownerDN,
+                     'OwnerGroup':ownerGroup,
+                     'GridType':gridType,
+                     'Broker':broker}
 
-        ret = gProxyManager.getPilotProxyFromVOMSGroup( ownerDN, ownerGroup )
-        if not ret['OK']:
-          self.log.error( ret['Message'] )
-          self.log.error( 'Could not get proxy:', 'User "%s", Group "%s"' % ( ownerDN, ownerGroup ) )
-          continue
-        proxy = ret['Value']
+        condDict2 = {'Status':self.queryStateList,
+                     'OwnerDN':ownerDN,
+                     'OwnerGroup':ownerGroup,
+                     'GridType':gridType,
+                     'Broker':broker}
 
-        self.log.verbose( "Getting status for %s pilots for owner %s and group %s" % ( len( refList ),
-                                                                                      ownerDN, ownerGroup ) )
+        for condDict in [ condDict1, condDict2]:
+          result = self.clearWaitingPilots( condDict )
+          if not result['OK']:
+            self.log.warn( 'Failed to clear Waiting Pilot Jobs' )
 
-        for start_index in range( 0, len( refList ), MAX_JOBS_QUERY ):
-          refsToQuery = refList[ start_index : start_index + MAX_JOBS_QUERY ]
-          self.log.verbose( 'Querying %d pilots of %s starting at %d' %
-                            ( len( refsToQuery ), len( refList ), start_index ) )
-          result = self.getPilotStatus( proxy, gridType, refsToQuery )
+          result = self.pilotDB.selectPilots( condDict )
           if not result['OK']:
-            if result['Message'] == 'Broker not Available':
-              self.log.error( 'Broker %s not Available' % broker )
-              break
-            self.log.warn( 'Failed to get pilot status:' )
-            self.log.warn( '%s:%s @ %s' % ( ownerDN, ownerGroup, gridType ) )
+            self.log.warn( 'Failed to get the Pilot Agents' )
+            return result
+          if not result['Value']:
             continue
+          refList = result['Value']
 
-          statusDict = result[ 'Value' ]
-          for pRef in statusDict:
-            pDict = statusDict[ pRef ]
-            if pDict:
-              if pDict['isParent']:
-                self.log.verbose( 'Clear parametric parent %s' % pRef )
-                result = self.clearParentJob( pRef, pDict, connection )
-                if not result['OK']:
-                  self.log.warn( result['Message'] )
+          ret = gProxyManager.getPilotProxyFromVOMSGroup( ownerDN, ownerGroup )
+          if not ret['OK']:
+            self.log.error( ret['Message'] )
+            self.log.error( 'Could not get proxy:', 'User "%s", Group "%s"' % ( ownerDN, ownerGroup ) )
+            continue
+          proxy = ret['Value']
+
+          self.log.verbose( "Getting status for %s pilots for owner %s and group %s" % ( len( refList ),
+                                                                                        ownerDN, ownerGroup ) )
+
+          for start_index in range( 0, len( refList ), MAX_JOBS_QUERY ):
+            refsToQuery = refList[ start_index : start_index + MAX_JOBS_QUERY ]
+            self.log.verbose( 'Querying %d pilots of %s starting at %d' %
+                              ( len( refsToQuery ), len( refList ), start_index ) )
+            result = self.getPilotStatus( proxy, gridType, refsToQuery )
+            if not result['OK']:
+              if result['Message'] == 'Broker not Available':
+                self.log.error( 'Broker %s not Available' % broker )
+                break
+              self.log.warn( 'Failed to get pilot status:' )
+              self.log.warn( '%s:%s @ %s' % ( ownerDN, ownerGroup, gridType ) )
+              continue
+
+            statusDict = result[ 'Value' ]
+            for pRef in statusDict:
+              pDict = statusDict[ pRef ]
+              if pDict:
+                if pDict['isParent']:
+                  self.log.verbose( 'Clear parametric parent %s' % pRef )
+                  result = self.clearParentJob( pRef, pDict, connection )
+                  if not result['OK']:
+                    self.log.warn( result['Message'] )
+                  else:
+                    self.log.info( 'Parameteric parent removed: %s' % pRef )
+                if pDict[ 'FinalStatus' ]:
+                  self.log.verbose( 'Marking Status for %s to %s' % ( pRef, pDict['Status'] ) )
+                  pilotsToAccount[ pRef ] = pDict
                 else:
-                  self.log.info( 'Parameteric parent removed: %s' % pRef )
-              if pDict[ 'FinalStatus' ]:
-                self.log.verbose( 'Marking Status for %s to %s' % ( pRef, pDict['Status'] ) )
-                pilotsToAccount[ pRef ] = pDict
-              else:
-                self.log.verbose( 'Setting Status for %s to %s' % ( pRef, pDict['Status'] ) )
-                result = self.pilotDB.setPilotStatus( pRef,
-                                                      pDict['Status'],
-                                                      pDict['DestinationSite'],
-                                                      updateTime = pDict['StatusDate'],
-                                                      conn = connection )
-
-          if len( pilotsToAccount ) > 100:
-            self.accountPilots( pilotsToAccount, connection )
-            pilotsToAccount = {}
-
-    self.accountPilots( pilotsToAccount, connection )
-    # Now handle pilots not updated in the last N days (most likely the Broker is no 
-    # longer available) and declare them Deleted.
-    result = self.handleOldPilots( connection )
-
-    connection.close()
+                  self.log.verbose( 'Setting Status for %s to %s' % ( pRef, pDict['Status'] ) )
+                  result = self.pilotDB.setPilotStatus( pRef,
+                                                        pDict['Status'],
+                                                        pDict['DestinationSite'],
+                                                        updateTime = pDict['StatusDate'],
+                                                        conn = connection )
+
+            if len( pilotsToAccount ) > 100:
+              self.accountPilots( pilotsToAccount, connection )
+              pilotsToAccount = {}
+
+      self.accountPilots( pilotsToAccount, connection )
+      # Now handle pilots not updated in the last N days (most likely the Broker is no 
+      # longer available) and declare them Deleted.
+      result = self.handleOldPilots( connection )
+    finally:
+      connection.release()
 
     return S_OK()
 
@@ -17,9 +17,11 @@
     getJobParameter()
     getJobParameters()
     getAllJobParameters()
+    getJobOptParametersForJobList()
     getInputData()
     getSubjobs()
     getJobJDL()
+    getJobJDLsForJobList()
 
     selectJobs()
     selectJobsWithStatus()
@@ -40,6 +42,8 @@
     rescheduleJobs()
 
     getMask()
+    getCachedSiteMask()
+    getSiteMaskVersion()
     setMask()
     allowSiteInMask()
     banSiteInMask()
@@ -51,6 +55,7 @@ __RCSID__ = "$Id$"
 
 import re, os, sys, string, types
 import time, datetime, operator
+import threading
 
 from DIRAC.Core.Utilities.ClassAd.ClassAdLight import ClassAd
 from types                                     import *
@@ -95,6 +100,13 @@ class JobDB( DB ):
 
     self.jobAttributeNames = []
 
+    # Site mask cache, checked against the SiteMaskVersion every siteMaskPollPeriod seconds
+    self.siteMaskPollPeriod = gConfig.getValue( self.cs_path + '/SiteMaskPollPeriod', 10 )
+    self.__siteMaskLock = threading.Lock()
+    self.__siteMaskCache = None
+    self.__siteMaskVersion = None
+    self.__siteMaskLastCheck = 0
+
     result = self.__getAttributeNames()
 
     if not result['OK']:
@@ -109,17 +121,17 @@ class JobDB( DB ):
     if DEBUG:
       result = self.dumpParameters()
 
-  def _query( self, cmd, conn = False ):
+  def _query( self, cmd, conn = False, params = None ):
     start = time.time()
-    ret = DB._query( self, cmd, conn )
+    ret = DB._query( self, cmd, conn, params )
     if DEBUG:
       print >> debugFile, time.time() - start, cmd.replace( '\n', '' )
       debugFile.flush()
     return ret
 
-  def _update( self, cmd, conn = False ):
+  def _update( self, cmd, conn = False, params = None ):
     start = time.time()
-    ret = DB._update( self, cmd, conn )
+    ret = DB._update( self, cmd, conn, params )
     if DEBUG:
       print >> debugFile, time.time() - start, cmd.replace( '\n', '' )
       debugFile.flush()
@@ -238,17 +250,17 @@ class JobDB( DB ):
     connection = res['Value']
     res = self._update( cmd, connection )
     if not res['OK']:
-      connection.close()
+      connection.release()
       return S_ERROR( '1 %s\n%s' % ( err, res['Message'] ) )
 
     cmd = 'SELECT LAST_INSERT_ID()'
     res = self._query( cmd, connection )
     if not res['OK']:
-      connection.close()
+      connection.release()
       return S_ERROR( '2 %s\n%s' % ( err, res['Message'] ) )
 
     try:
-      connection.close()
+      connection.release()
       jobID = int( res['Value'][0][0] )
       self.log.info( 'JobDB: New JobID served "%s"' % jobID )
     except Exception, x:
@@ -590,6 +602,36 @@ class JobDB( DB ):
     else:
       return S_ERROR( 'JobDB.getJobOptParameters: failed to retrieve parameters' )
 
+#############################################################################
+  def getJobOptParametersForJobList( self, jobIDList, paramList = [] ):
+    """ Get optimizer parameters for the jobs in the jobIDList with a single query.
+        Returns an S_OK structure with a dictionary of dictionaries as its Value:
+        ValueDict[jobID][parameter_name] = parameter_value
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    cmd = "SELECT JobID, Name, Value from OptimizerParameters WHERE JobID in (%s)" % jobList
+    if paramList:
+      ret = self._escapeValues( paramList )
+      if not ret['OK']:
+        return ret
+      cmd += " and Name in (%s)" % ','.join( ret['Value'] )
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return S_ERROR( 'JobDB.getJobOptParametersForJobList: failed to retrieve parameters' )
+
+    resultDict = {}
+    for jobID in jobIDList:
+      resultDict[int( jobID )] = {}
+    for jobID, name, value in result['Value']:
+      try:
+        resultDict[int( jobID )][name] = value.tostring()
+      except:
+        resultDict[int( jobID )][name] = value
+    return S_OK( resultDict )
+
 #############################################################################
   def getTimings( self, site, period = 3600 ):
     """ Get CPU and wall clock times for the jobs finished in the last hour
@@ -799,36 +841,45 @@ class JobDB( DB ):
 #############################################################################
   def setJobAttributes( self, jobID, attrNames, attrValues, update = False, datetime = None ):
     """ Set an attribute value for job specified by jobID.
+        jobID can also be a list of jobIDs to update all of them at once.
         The LastUpdate time stamp is refreshed if explicitely requested
     """
 
-    ret = self._escapeString( jobID )
-    if not ret['OK']:
-      return ret
-    jobID = ret['Value']
+    if type( jobID ) in ( ListType, TupleType ):
+      if not jobID:
+        return S_ERROR( 'JobDB.setAttributes: Nothing to do' )
+      jobIDList = [ str( jID ) for jID in jobID ]
+    else:
+      jobIDList = [ str( jobID ) ]
 
     if len( attrNames ) != len( attrValues ):
       return S_ERROR( 'JobDB.setAttributes: incompatible Argument length' )
 
     # FIXME: Need to check the validity of attrNames
+    # The values are bound by the driver, only the column names go in the statement
     attr = []
+    params = []
     for i in range( len( attrNames ) ):
-      ret = self._escapeString( attrValues[i] )
-      if not ret['OK']:
-        return ret
-      value = ret['Value']
-      attr.append( "%s=%s" % ( attrNames[i], value ) )
+      attr.append( "%s=%%s" % attrNames[i] )
+      value = attrValues[i]
+      if type( value ) in Time._allDateTypes:
+        value = str( value )
+      params.append( value )
     if update:
       attr.append( "LastUpdateTime=UTC_TIMESTAMP()" )
     if len( attr ) == 0:
       return S_ERROR( 'JobDB.setAttributes: Nothing to do' )
 
-    cmd = 'UPDATE Jobs SET %s WHERE JobID=%s' % ( ', '.join( attr ), jobID )
+    cmd = 'UPDATE Jobs SET %s WHERE JobID in (%s)' % ( ', '.join( attr ), ','.join( [ '%s' ] * len( jobIDList ) ) )
+    params.extend( jobIDList )
 
     if datetime:
-      cmd += ' AND LastUpdateTime < %s' % datetime
+      cmd += ' AND LastUpdateTime < %s'
+      if type( datetime ) in Time._allDateTypes:
+        datetime = str( datetime )
+      params.append( datetime )
 
-    res = self._update( cmd )
+    res = self._update( cmd, params = tuple( params ) )
     if res['OK']:
       return res
     else:
@@ -836,7 +887,7 @@ class JobDB( DB ):
 
 #############################################################################
   def setJobStatus( self, jobID, status = '', minor = '', application = '', appCounter = None ):
-    """ Set status of the job specified by its jobID
+    """ Set status of the job specified by its jobID or of a list of jobs
     """
 
     # Do not update the LastUpdate time stamp if setting the Stalled status
@@ -1169,12 +1220,12 @@ class JobDB( DB ):
     cmd = 'SELECT LAST_INSERT_ID()'
     res = self._query( cmd, connection )
     if not res['OK']:
-      connection.close()
+      connection.release()
       self.log.error( 'Can not retrieve LAST_INSERT_ID', res['Message'] )
       return res
 
     try:
-      connection.close()
+      connection.release()
       jobID = int( res['Value'][0][0] )
       self.log.info( 'JobDB: New JobID served "%s"' % jobID )
     except Exception, x:
@@ -1218,6 +1269,27 @@ class JobDB( DB ):
     else:
       return result
 
+#############################################################################
+  def getJobJDLsForJobList( self, jobIDList, original = False ):
+    """ Get the JDLs for the jobs in the jobIDList with a single query.
+        Returns an S_OK structure with a dictionary ValueDict[jobID] = JDL
+    """
+    if not jobIDList:
+      return S_OK( {} )
+    jobList = ','.join( [ str( int( jobID ) ) for jobID in jobIDList ] )
+    if original:
+      cmd = "SELECT JobID, OriginalJDL FROM JobJDLs WHERE JobID in (%s)" % jobList
+    else:
+      cmd = "SELECT JobID, JDL FROM JobJDLs WHERE JobID in (%s)" % jobList
+
+    result = self._query( cmd )
+    if not result['OK']:
+      return result
+    resultDict = {}
+    for jobID, jdl in result['Value']:
+      resultDict[int( jobID )] = jdl
+    return S_OK( resultDict )
+
 #############################################################################
   def insertJobIntoDB( self, jobID, JDL ):
     """ Insert the initial job JDL into the Job database
@@ -1725,6 +1797,69 @@ class JobDB( DB ):
 
     return S_OK( siteList )
 
+#############################################################################
+  def getSiteMaskVersion( self ):
+    """ Get the version of the site mask. It is increased every time the mask changes
+        and is cheap to poll to know if a cached mask is still valid
+    """
+    result = self._query( "SELECT Version FROM SiteMaskVersion WHERE Id=1" )
+    if not result['OK']:
+      return result
+    if not result['Value']:
+      return S_ERROR( 'Site mask version is not defined' )
+    return S_OK( int( result['Value'][0][0] ) )
+
+  def __bumpSiteMaskVersion( self ):
+    """ Increase the site mask version and invalidate the local cache
+    """
+    self.__siteMaskCache = None
+    result = self._update( "UPDATE SiteMaskVersion SET Version=Version+1 WHERE Id=1" )
+    if not result['OK']:
+      self.log.warn( 'Failed to increase the site mask version', result['Message'] )
+    return result
+
+  def __loadSiteMaskCache( self ):
+    """ Read the whole site mask into the cache
+    """
+    result = self._query( "SELECT Site,Status FROM SiteMask" )
+    if not result['OK']:
+      return result
+    siteMask = {}
+    for site, status in result['Value']:
+      siteMask.setdefault( status, set() ).add( site )
+    siteMaskCache = { 'All' : frozenset( [ site for site, status in result['Value'] ] ) }
+    for status in siteMask:
+      siteMaskCache[status] = frozenset( siteMask[status] )
+    self.__siteMaskCache = siteMaskCache
+    return S_OK( siteMaskCache )
+
+  def getCachedSiteMask( self, siteState = 'Active' ):
+    """ Get the set of sites with the given state from the site mask cache.
+        The cache is reloaded only if the site mask version has changed
+    """
+    siteMaskCache = self.__siteMaskCache
+    if siteMaskCache is None or time.time() - self.__siteMaskLastCheck > self.siteMaskPollPeriod:
+      self.__siteMaskLock.acquire()
+      try:
+        siteMaskCache = self.__siteMaskCache
+        if siteMaskCache is None or time.time() - self.__siteMaskLastCheck > self.siteMaskPollPeriod:
+          result = self.getSiteMaskVersion()
+          if result['OK']:
+            version = result['Value']
+          else:
+            # No version available, reload the mask every poll period
+            version = None
+          if siteMaskCache is None or version is None or version != self.__siteMaskVersion:
+            result = self.__loadSiteMaskCache()
+            if not result['OK']:
+              return result
+            siteMaskCache = result['Value']
+            self.__siteMaskVersion = version
+          self.__siteMaskLastCheck = time.time()
+      finally:
+        self.__siteMaskLock.release()
+    return S_OK( siteMaskCache.get( siteState, frozenset() ) )
+
 #############################################################################
   def getSiteMaskStatus( self ):
     """ Get the currently site mask status
@@ -1794,6 +1929,7 @@ class JobDB( DB ):
       result = self._update( req )
       if not result['OK']:
         return S_ERROR( 'Failed to update the Site Mask' )
+      self.__bumpSiteMaskVersion()
       # update the site mask logging record
       req = "INSERT INTO SiteMaskLogging VALUES (%s,%s,UTC_TIMESTAMP(),%s,%s)" % ( site, status, authorDN, comment )
       result = self._update( req )
@@ -1833,7 +1969,10 @@ class JobDB( DB ):
       req = "DELETE FROM SiteMask"
     else:
       req = "DELETE FROM SiteMask WHERE Site=%s" % site
-    return self._update( req )
+    result = self._update( req )
+    if result['OK']:
+      self.__bumpSiteMaskVersion()
+    return result
 
 #############################################################################
   def getSiteMaskLogging( self, siteList ):
@@ -182,6 +182,14 @@ CREATE TABLE SiteMaskLogging (
     Comment BLOB NOT NULL
 );
 
+DROP TABLE IF EXISTS SiteMaskVersion;
+CREATE TABLE SiteMaskVersion (
+    Id      TINYINT UNSIGNED NOT NULL,
+    Version INTEGER UNSIGNED NOT NULL DEFAULT 0,
+    PRIMARY KEY (Id)
+);
+INSERT INTO SiteMaskVersion VALUES (1,0);
+
 -- ------------------------------------------------------------------------------
 DROP TABLE IF EXISTS HeartBeatLoggingInfo;
 CREATE TABLE HeartBeatLoggingInfo (
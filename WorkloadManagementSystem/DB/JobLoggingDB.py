@@ -48,11 +48,19 @@ class JobLoggingDB(DB):
         components can be specified. Optionaly the time stamp of the status can
         be provided in a form of a string in a format '%Y-%m-%d %H:%M:%S' or
         as datetime.datetime object. If the time stamp is not provided the current
-        UTC time is used. 
+        UTC time is used. jobID can also be a list of jobIDs to add the same
+        record for all of them with a single insert.
     """
   
+    if type(jobID) in (ListType,TupleType):
+      jobIDList = jobID
+    else:
+      jobIDList = [jobID]
+    if not jobIDList:
+      return S_OK(0)
+
     event = 'status/minor/app=%s/%s/%s' % (status,minor,application)
-    self.gLogger.info("Adding record for job "+str(jobID)+": '"+event+"' from "+source)
+    self.gLogger.info("Adding record for job "+','.join([str(j) for j in jobIDList])+": '"+event+"' from "+source)
   
     if not date:
       # Make the UTC datetime string and float
@@ -80,9 +88,10 @@ class JobLoggingDB(DB):
         epoc = time.mktime(_date.timetuple()) - MAGIC_EPOC_NUMBER
         time_order = round(epoc,3)     
 
+    values = ["(%d,'%s','%s','%s','%s',%f,'%s')" % (int(j),status,minor,application,str(_date),time_order,source)
+              for j in jobIDList]
     cmd = "INSERT INTO LoggingInfo (JobId, Status, MinorStatus, ApplicationStatus, " + \
-          "StatusTime, StatusTimeOrder, StatusSource) VALUES (%d,'%s','%s','%s','%s',%f,'%s')" % \
-           (int(jobID),status,minor,application,str(_date),time_order,source)
+          "StatusTime, StatusTimeOrder, StatusSource) VALUES " + ','.join(values)
             
     return self._update( cmd )
     
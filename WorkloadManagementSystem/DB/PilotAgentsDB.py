@@ -73,23 +73,23 @@ class PilotAgentsDB(DB):
 
       result = self._update(req,connection)
       if not result['OK']:
-        connection.close()
+        connection.release()
         return result
 
       req = "SELECT LAST_INSERT_ID();"
       res = self._query(req,connection)
       if not res['OK']:
-        connection.close()
+        connection.release()
         return res
       pilotID = int(res['Value'][0][0])
 
       req = "INSERT INTO PilotRequirements (PilotID,Requirements) VALUES (%d,'%s')" % (pilotID,e_requirements)
       res = self._update(req,connection)
       if not res['OK']:
-        connection.close()
+        connection.release()
         return res
 
-    connection.close()
+    connection.release()
 
     return S_OK()
 
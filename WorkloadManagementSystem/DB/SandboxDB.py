@@ -260,20 +260,22 @@ class SandboxDB(DB):
     sprefix = "IS"
     if sandbox == "OutputSandbox":
       sprefix = "OS"
-    self.lock.acquire()
     req = "INSERT INTO %sPartitions (CreationDate,LastUpdate) VALUES (UTC_TIMESTAMP(),UTC_TIMESTAMP())" % sandbox
     result = self._getConnection()
     if result['OK']:
       connection = result['Value']
     else:
       return S_ERROR('Failed to get connection to MySQL: '+result['Message'])
-    res = self._update(req,connection)
-    if not res['OK']:
+    self.lock.acquire()
+    try:
+      res = self._update(req,connection)
+      if not res['OK']:
+        return res
+      req = "SELECT LAST_INSERT_ID();"
+      res = self._query(req,connection)
+    finally:
       self.lock.release()
-      return res
-    req = "SELECT LAST_INSERT_ID();"
-    res = self._query(req,connection)
-    self.lock.release()
+      connection.release()
     partID = int(res['Value'][0][0])
 
     req = """CREATE TABLE %s_%d(
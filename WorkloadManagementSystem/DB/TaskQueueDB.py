@@ -12,6 +12,7 @@ import time
 from DIRAC  import gConfig, gLogger, S_OK, S_ERROR
 from DIRAC.WorkloadManagementSystem.private.SharesCorrector import SharesCorrector
 from DIRAC.WorkloadManagementSystem.private.Queues import maxCPUSegments
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
 from DIRAC.Core.Utilities import List
 from DIRAC.Core.Base.DB import DB
 from DIRAC.Core.Security import Properties, CS
@@ -38,6 +39,7 @@ class TaskQueueDB( DB ):
     self.__csSection = "/Operations/Scheduling/%s/" % gConfig.getValue( "/DIRAC/Setup" )
     self.__ensureInsertionIsSingle = False
     self.__sharesCorrector = SharesCorrector( self.__csSection )
+    self.__matchIndex = False
     result = self.__initializeDB()
     if not result[ 'OK' ]:
       raise Exception( "Can't create tables: %s" % result[ 'Message' ] )
@@ -112,6 +114,78 @@ class TaskQueueDB( DB ):
 
     return self._createTables( tablesToCreate )
 
+  def enableMatchIndex( self ):
+    """
+    Keep the task queue definitions in memory and use them to match resources.
+    Only the job extraction will hit the DB
+    """
+    if not self.__matchIndex:
+      self.__matchIndex = TaskQueueMatchIndex( self.__multiValueDefFields,
+                                               self.__multiValueMatchFields,
+                                               self.__bannedJobMatchFields )
+    return self.syncMatchIndex()
+
+  def isMatchIndexEnabled( self ):
+    return self.__matchIndex != False
+
+  def syncMatchIndex( self ):
+    """
+    Synchronize the in memory match index with the DB. Only the definitions of
+    the task queues that are not yet known are loaded
+    """
+    if not self.__matchIndex:
+      return S_ERROR( "Match index is not enabled" )
+    result = self._query( "SELECT TQId, Priority, Enabled FROM `tq_TaskQueues`" )
+    if not result[ 'OK' ]:
+      return result
+    tqStates = {}
+    for tqId, priority, enabled in result[ 'Value' ]:
+      tqStates[ tqId ] = ( priority, enabled )
+    knownTQs = self.__matchIndex.getTaskQueueIds()
+    for tqId in knownTQs:
+      if tqId not in tqStates:
+        self.__matchIndex.removeTaskQueue( tqId )
+        continue
+      priority, enabled = tqStates.pop( tqId )
+      self.__matchIndex.setPriorities( [ tqId ], priority )
+      self.__matchIndex.setTaskQueueState( tqId, enabled )
+    if tqStates:
+      result = self.__loadTaskQueuesInMatchIndex( tqStates.keys() )
+      if not result[ 'OK' ]:
+        return result
+    return S_OK( len( self.__matchIndex ) )
+
+  def __loadTaskQueuesInMatchIndex( self, tqIdList, connObj = False ):
+    """
+    Load the definitions of the given task queues into the match index
+    """
+    maxTQsInQuery = 1000
+    for i in range( 0, len( tqIdList ), maxTQsInQuery ):
+      tqIds = ", ".join( [ str( tqId ) for tqId in tqIdList[ i : i + maxTQsInQuery ] ] )
+      sqlCmd = "SELECT TQId, Priority, Enabled, %s FROM `tq_TaskQueues` WHERE TQId in ( %s )" % ( ", ".join( self.__singleValueDefFields ),
+                                                                                                 tqIds )
+      result = self._query( sqlCmd, conn = connObj )
+      if not result[ 'OK' ]:
+        return result
+      tqDefs = {}
+      for record in result[ 'Value' ]:
+        tqDefDict = { 'Priority' : record[1], 'Enabled' : record[2] }
+        for iP in range( len( self.__singleValueDefFields ) ):
+          tqDefDict[ self.__singleValueDefFields[ iP ] ] = record[ iP + 3 ]
+        tqDefs[ record[0] ] = tqDefDict
+      for field in self.__multiValueDefFields:
+        sqlCmd = "SELECT TQId, Value FROM `tq_TQTo%s` WHERE TQId in ( %s )" % ( field, tqIds )
+        result = self._query( sqlCmd, conn = connObj )
+        if not result[ 'OK' ]:
+          return result
+        for tqId, value in result[ 'Value' ]:
+          if tqId in tqDefs:
+            tqDefs[ tqId ].setdefault( field, [] ).append( value )
+      for tqId in tqDefs:
+        tqDefDict = tqDefs[ tqId ]
+        self.__matchIndex.setTaskQueue( tqId, tqDefDict, tqDefDict[ 'Priority' ], tqDefDict[ 'Enabled' ] )
+    return S_OK()
+
   def enableAllTaskQueues( self ):
 
     result = self._getConnection()
@@ -119,20 +193,23 @@ class TaskQueueDB( DB ):
       return result
     connObj = result[ 'Value' ]
 
-    result = self._query( 'SELECT TQId from `tq_TaskQueues`', conn = connObj )
-    if not result['OK']:
-      return result
-    for ( tqId, ) in result['Value']:
-      result = self.deleteTaskQueueIfEmpty( tqId, connObj = connObj )
-      if not result['OK']:
-        return result
-      if result['Value']:
-        continue
-      result = self.setTaskQueueState( tqId, enabled = True, connObj = connObj )
+    try:
+      result = self._query( 'SELECT TQId from `tq_TaskQueues`', conn = connObj )
       if not result['OK']:
         return result
+      for ( tqId, ) in result['Value']:
+        result = self.deleteTaskQueueIfEmpty( tqId, connObj = connObj )
+        if not result['OK']:
+          return result
+        if result['Value']:
+          continue
+        result = self.setTaskQueueState( tqId, enabled = True, connObj = connObj )
+        if not result['OK']:
+          return result
 
-    return S_OK()
+      return S_OK()
+    finally:
+      connObj.release()
 
   def getGroupsInTQs( self ):
     cmdSQL = "SELECT DISTINCT( OwnerGroup ) FROM `tq_TaskQueues`"
@@ -185,6 +262,7 @@ class TaskQueueDB( DB ):
   def _checkTaskQueueDefinition( self, tqDefDict ):
     """
     Check a task queue definition dict is valid
+      Values are not escaped, they are bound as parameters in the queries
     """
     for field in self.__singleValueDefFields:
       if field not in tqDefDict:
@@ -196,20 +274,15 @@ class TaskQueueDB( DB ):
       else:
         if fieldValueType not in ( types.StringType, types.UnicodeType ):
           return S_ERROR( "Mandatory field %s value type is not valid: %s" % ( field, fieldValueType ) )
-        result = self._escapeString( tqDefDict[ field ] )
-        if not result[ 'OK' ]:
-          return result
-        tqDefDict[ field ] = result[ 'Value' ]
     for field in self.__multiValueDefFields:
       if field not in tqDefDict:
         continue
       fieldValueType = type( tqDefDict[ field ] )
       if fieldValueType not in ( types.ListType, types.TupleType ):
         return S_ERROR( "Multi value field %s value type is not valid: %s" % ( field, fieldValueType ) )
-      result = self._escapeValues( tqDefDict[ field ] )
-      if not result[ 'OK' ]:
-        return result
-      tqDefDict[ field ] = result[ 'Value' ]
+      for value in tqDefDict[ field ]:
+        if type( value ) not in ( types.StringType, types.UnicodeType ):
+          return S_ERROR( "Multi value field %s contains a value of invalid type: %s" % ( field, type( value ) ) )
     #FIXME: This is not used
     if 'PrivatePilots' in tqDefDict:
       validPilotTypes = self.getValidPilotTypes()
@@ -274,17 +347,21 @@ class TaskQueueDB( DB ):
       if not result[ 'OK' ]:
         return S_ERROR( "Can't create task queue: %s" % result[ 'Message' ] )
       connObj = result[ 'Value' ]
+      try:
+        return self.__createTaskQueue( tqDefDict, priority, enabled, connObj = connObj )
+      finally:
+        connObj.release()
     tqDefDict[ 'CPUTime' ] = self.fitCPUTimeToSegments( tqDefDict[ 'CPUTime' ] )
     sqlSingleFields = [ 'TQId', 'Priority' ]
-    sqlValues = [ "0", str( priority ) ]
+    sqlValues = [ 0, priority ]
     for field in self.__singleValueDefFields:
       sqlSingleFields.append( field )
       sqlValues.append( tqDefDict[ field ] )
     #Insert the TQ Disabled
     sqlSingleFields.append( "Enabled" )
-    sqlValues.append( str( int( enabled ) ) )
-    cmd = "INSERT INTO tq_TaskQueues ( %s ) VALUES ( %s )" % ( ", ".join( sqlSingleFields ), ", ".join( [ str( v ) for v in sqlValues ] ) )
-    result = self._update( cmd, conn = connObj )
+    sqlValues.append( int( enabled ) )
+    cmd = "INSERT INTO tq_TaskQueues ( %s ) VALUES ( %s )" % ( ", ".join( sqlSingleFields ), ", ".join( [ "%s" ] * len( sqlValues ) ) )
+    result = self._update( cmd, conn = connObj, params = tuple( sqlValues ) )
     if not result[ 'OK' ]:
       self.log.error( "Can't insert TQ in DB", result[ 'Value' ] )
       return result
@@ -299,12 +376,11 @@ class TaskQueueDB( DB ):
     for field in self.__multiValueDefFields:
       if field not in tqDefDict:
         continue
-      values = List.uniqueElements( [ value for value in tqDefDict[ field ] if value.strip() ] )
+      values = List.uniqueElements( [ value.strip() for value in tqDefDict[ field ] if value.strip() ] )
       if not values:
         continue
-      cmd = "INSERT INTO `tq_TQTo%s` ( TQId, Value ) VALUES " % field
-      cmd += ", ".join( [ "( %s, %s )" % ( tqId, str( value ) ) for value in values ] )
-      result = self._update( cmd, conn = connObj )
+      cmd = "INSERT INTO `tq_TQTo%s` ( TQId, Value ) VALUES ( %%s, %%s )" % field
+      result = self._updateMany( cmd, [ ( tqId, value ) for value in values ], conn = connObj )
       if not result[ 'OK' ]:
         self.log.error( "Failed to insert %s condition" % field, result[ 'Message' ] )
         self.cleanOrphanedTaskQueues( connObj = connObj )
@@ -336,6 +412,8 @@ class TaskQueueDB( DB ):
     updated = result['Value'] > 0
     if updated:
       self.log.info( "Set enabled = %s for TQ %s" % ( enabled, tqId ) )
+    if self.__matchIndex:
+      self.__matchIndex.setTaskQueueState( tqId, enabled )
     return S_OK( updated )
 
   def __hackJobPriority( self, jobPriority ):
@@ -359,47 +437,55 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Can't insert job: %s" % retVal[ 'Message' ] )
     connObj = retVal[ 'Value' ]
-    if not skipTQDefCheck:
-      tqDefDict = dict( tqDefDict )
-      retVal = self._checkTaskQueueDefinition( tqDefDict )
-      if not retVal[ 'OK' ]:
-        self.log.error( "TQ definition check failed", retVal[ 'Message' ] )
-        return retVal
-      tqDefDict = retVal[ 'Value' ]
-    tqDefDict[ 'CPUTime' ] = self.fitCPUTimeToSegments( tqDefDict[ 'CPUTime' ] )
-    self.log.info( "Inserting job %s with requirements: %s" % ( jobId, self.__strDict( tqDefDict ) ) )
-    retVal = self.findTaskQueue( tqDefDict, skipDefinitionCheck = True, connObj = connObj )
-    if not retVal[ 'OK' ]:
-      return retVal
-    tqInfo = retVal[ 'Value' ]
-    newTQ = False
-    if not tqInfo[ 'found' ]:
-      self.log.info( "Creating a TQ for job %s" % jobId )
-      retVal = self.__createTaskQueue( tqDefDict, 1, connObj = connObj )
+    try:
+      if not skipTQDefCheck:
+        tqDefDict = dict( tqDefDict )
+        retVal = self._checkTaskQueueDefinition( tqDefDict )
+        if not retVal[ 'OK' ]:
+          self.log.error( "TQ definition check failed", retVal[ 'Message' ] )
+          return retVal
+        tqDefDict = retVal[ 'Value' ]
+      tqDefDict[ 'CPUTime' ] = self.fitCPUTimeToSegments( tqDefDict[ 'CPUTime' ] )
+      self.log.info( "Inserting job %s with requirements: %s" % ( jobId, self.__strDict( tqDefDict ) ) )
+      retVal = self.findTaskQueue( tqDefDict, skipDefinitionCheck = True, connObj = connObj )
       if not retVal[ 'OK' ]:
         return retVal
-      tqId = retVal[ 'Value' ]
-      newTQ = True
-    else:
-      tqId = tqInfo[ 'tqId' ]
-      self.log.info( "Found TQ %s for job %s requirements" % ( tqId, jobId ) )
-      result = self.setTaskQueueState( tqId, False )
+      tqInfo = retVal[ 'Value' ]
+      newTQ = False
+      if not tqInfo[ 'found' ]:
+        self.log.info( "Creating a TQ for job %s" % jobId )
+        retVal = self.__createTaskQueue( tqDefDict, 1, connObj = connObj )
+        if not retVal[ 'OK' ]:
+          return retVal
+        tqId = retVal[ 'Value' ]
+        newTQ = True
+      else:
+        tqId = tqInfo[ 'tqId' ]
+        self.log.info( "Found TQ %s for job %s requirements" % ( tqId, jobId ) )
+        result = self.setTaskQueueState( tqId, False )
+        if not result[ 'OK' ]:
+          return result
+        if self.__ensureInsertionIsSingle and not result[ 'Value' ]:
+          time.sleep( 0.1 )
+          if numRetries <= 0:
+            self.log.info( "Couldn't manage to disable TQ %s for job %s insertion, max retries reached. Aborting" % ( tqId, jobId ) )
+            return S_ERROR( "Max reties reached for inserting job %s" % jobId )
+          self.log.info( "Couldn't manage to disable TQ %s for job %s insertion, retrying" % ( tqId, jobId ) )
+          return self.insertJob( jobId, tqDefDict, jobPriority, skipTQDefCheck = True, numRetries = numRetries - 1 )
+      result = self.__insertJobInTaskQueue( jobId, tqId, int( jobPriority ), checkTQExists = False, connObj = connObj )
       if not result[ 'OK' ]:
+        self.log.error( "Error inserting job in TQ", "Job %s TQ %s: %s" % ( jobId, tqId, result[ 'Message' ] ) )
         return result
-      if self.__ensureInsertionIsSingle and not result[ 'Value' ]:
-        time.sleep( 0.1 )
-        if numRetries <= 0:
-          self.log.info( "Couldn't manage to disable TQ %s for job %s insertion, max retries reached. Aborting" % ( tqId, jobId ) )
-          return S_ERROR( "Max reties reached for inserting job %s" % jobId )
-        self.log.info( "Couldn't manage to disable TQ %s for job %s insertion, retrying" % ( tqId, jobId ) )
-        return self.insertJob( jobId, tqDefDict, jobPriority, skipTQDefCheck = True, numRetries = numRetries - 1 )
-    result = self.__insertJobInTaskQueue( jobId, tqId, int( jobPriority ), checkTQExists = False, connObj = connObj )
-    if not result[ 'OK' ]:
-      self.log.error( "Error inserting job in TQ", "Job %s TQ %s: %s" % ( jobId, tqId, result[ 'Message' ] ) )
+      if newTQ:
+        self.recalculateTQSharesForEntity( tqDefDict[ 'OwnerDN' ], tqDefDict[ 'OwnerGroup' ], connObj = connObj )
+      result = self.setTaskQueueState( tqId, True )
+      if result[ 'OK' ] and newTQ and self.__matchIndex:
+        retVal = self.__loadTaskQueuesInMatchIndex( [ tqId ], connObj = connObj )
+        if not retVal[ 'OK' ]:
+          self.log.error( "Can't load TQ in the match index", "TQ %s: %s" % ( tqId, retVal[ 'Message' ] ) )
       return result
-    if newTQ:
-      self.recalculateTQSharesForEntity( tqDefDict[ 'OwnerDN' ], tqDefDict[ 'OwnerGroup' ], connObj = connObj )
-    return self.setTaskQueueState( tqId, True )
+    finally:
+      connObj.release()
 
   def __insertJobInTaskQueue( self, jobId, tqId, jobPriority, checkTQExists = True, connObj = False ):
     """
@@ -411,12 +497,17 @@ class TaskQueueDB( DB ):
       if not result[ 'OK' ]:
         return S_ERROR( "Can't insert job: %s" % result[ 'Message' ] )
       connObj = result[ 'Value' ]
+      try:
+        return self.__insertJobInTaskQueue( jobId, tqId, jobPriority, checkTQExists, connObj = connObj )
+      finally:
+        connObj.release()
     if checkTQExists:
-      result = self._query( "SELECT tqId FROM `tq_TaskQueues` WHERE TQId = %s" % tqId, conn = connObj )
+      result = self._query( "SELECT tqId FROM `tq_TaskQueues` WHERE TQId = %s", conn = connObj, params = ( tqId, ) )
       if not result[ 'OK' ] or len ( result[ 'Value' ] ) == 0:
         return S_OK( "Can't find task queue with id %s: %s" % ( tqId, result[ 'Message' ] ) )
     hackedPriority = self.__hackJobPriority( jobPriority )
-    return self._update( "INSERT INTO tq_Jobs ( TQId, JobId, Priority, RealPriority ) VALUES ( %s, %s, %s, %f )" % ( tqId, jobId, jobPriority, hackedPriority ), conn = connObj )
+    return self._update( "INSERT INTO tq_Jobs ( TQId, JobId, Priority, RealPriority ) VALUES ( %s, %s, %s, %s )",
+                         conn = connObj, params = ( tqId, jobId, jobPriority, float( hackedPriority ) ) )
 
   def findTaskQueue( self, tqDefDict, skipDefinitionCheck = False, connObj = False ):
     """
@@ -430,8 +521,10 @@ class TaskQueueDB( DB ):
       tqDefDict = result[ 'Value' ]
     sqlCmd = "SELECT `tq_TaskQueues`.TQId FROM `tq_TaskQueues` WHERE"
     sqlCondList = []
+    sqlParams = []
     for field in self.__singleValueDefFields:
-      sqlCondList.append( "`tq_TaskQueues`.%s = %s" % ( field, tqDefDict[ field ] ) )
+      sqlCondList.append( "`tq_TaskQueues`.%s = %%s" % field )
+      sqlParams.append( tqDefDict[ field ] )
     #MAGIC SUBQUERIES TO ENSURE STRICT MATCH
     for field in self.__multiValueDefFields:
       tableName = '`tq_TQTo%s`' % field
@@ -440,15 +533,15 @@ class TaskQueueDB( DB ):
         grouping = "GROUP BY %s.TQId" % tableName
         valuesList = List.uniqueElements( [ value.strip() for value in tqDefDict[ field ] if value.strip() ] )
         numValues = len( valuesList )
-        secondQuery = "%s AND %s.Value in (%s)" % ( firstQuery, tableName,
-                                                        ",".join( [ "%s" % str( value ) for value in valuesList ] ) )
+        secondQuery = "%s AND %s.Value in (%s)" % ( firstQuery, tableName, ",".join( [ "%s" ] * numValues ) )
         sqlCondList.append( "%s = (%s %s)" % ( numValues, firstQuery, grouping ) )
         sqlCondList.append( "%s = (%s %s)" % ( numValues, secondQuery, grouping ) )
+        sqlParams.extend( valuesList )
       else:
         sqlCondList.append( "`tq_TaskQueues`.TQId not in ( SELECT DISTINCT %s.TQId from %s )" % ( tableName, tableName ) )
     #END MAGIC: That was easy ;)
     sqlCmd = "%s  %s" % ( sqlCmd, " AND ".join( sqlCondList ) )
-    result = self._query( sqlCmd, conn = connObj )
+    result = self._query( sqlCmd, conn = connObj, params = tuple( sqlParams ) )
     if not result[ 'OK' ]:
       return S_ERROR( "Can't find task queue: %s" % result[ 'Message' ] )
     data = result[ 'Value' ]
@@ -464,6 +557,8 @@ class TaskQueueDB( DB ):
     """
     #Make a copy to avoid modification of original if escaping needs to be done
     tqMatchDict = dict( tqMatchDict )
+    #The match index works with the unescaped values
+    rawMatchDict = dict( tqMatchDict )
     self.log.info( "Starting match for requirements", self.__strDict( tqMatchDict ) )
     retVal = self._checkMatchDefinition( tqMatchDict )
     if not retVal[ 'OK' ]:
@@ -473,58 +568,166 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
     connObj = retVal[ 'Value' ]
-    preJobSQL = "SELECT `tq_Jobs`.JobId, `tq_Jobs`.TQId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
-    prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
-    postJobSQL = " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s" % numJobsPerTry
-    for matchTry in range( self.__maxMatchRetry ):
-      if 'JobID' in tqMatchDict:
-        # A certain JobID is required by the resource, so all TQ are to be considered
-        retVal = self.matchAndGetTaskQueue( tqMatchDict, numQueuesToGet = 0, skipMatchDictDef = True, connObj = connObj )
-        preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
-      else:
-        retVal = self.matchAndGetTaskQueue( tqMatchDict, 
-                                            numQueuesToGet = numQueuesPerTry, 
-                                            skipMatchDictDef = True, 
-                                            extraConditions = extraConditions,
-                                            connObj = connObj )
-      if not retVal[ 'OK' ]:
-        return retVal
-      tqList = retVal[ 'Value' ]
-      if len( tqList ) == 0:
-        self.log.info( "No TQ matches requirements" )
-        return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
-      for tqId, tqOwnerDN, tqOwnerGroup in tqList:
-        self.log.info( "Trying to extract jobs from TQ %s" % tqId )
-        retVal = self._query( prioSQL % tqId, conn = connObj )
+    try:
+      preJobSQL = "SELECT `tq_Jobs`.JobId, `tq_Jobs`.TQId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s AND `tq_Jobs`.Priority = %s"
+      prioSQL = "SELECT `tq_Jobs`.Priority FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT 1"
+      postJobSQL = " ORDER BY `tq_Jobs`.JobId ASC LIMIT %s" % numJobsPerTry
+      for matchTry in range( self.__maxMatchRetry ):
+        if 'JobID' in tqMatchDict:
+          # A certain JobID is required by the resource, so all TQ are to be considered
+          if self.__matchIndex:
+            retVal = S_OK( self.__matchIndex.match( rawMatchDict, numQueuesToGet = 0 ) )
+          else:
+            retVal = self.matchAndGetTaskQueue( tqMatchDict, numQueuesToGet = 0, skipMatchDictDef = True, connObj = connObj )
+          preJobSQL = "%s AND `tq_Jobs`.JobId = %s " % ( preJobSQL, tqMatchDict['JobID'] )
+        elif self.__matchIndex:
+          retVal = S_OK( self.__matchIndex.match( rawMatchDict,
+                                                  numQueuesToGet = numQueuesPerTry,
+                                                  extraConditions = extraConditions ) )
+        else:
+          retVal = self.matchAndGetTaskQueue( tqMatchDict, 
+                                              numQueuesToGet = numQueuesPerTry, 
+                                              skipMatchDictDef = True, 
+                                              extraConditions = extraConditions,
+                                              connObj = connObj )
         if not retVal[ 'OK' ]:
-          return S_ERROR( "Can't retrieve winning priority for matching job: %s" % retVal[ 'Message' ] )
-        if len( retVal[ 'Value' ] ) == 0:
-          continue
-        prio = retVal[ 'Value' ][0][0]
-        retVal = self._query( "%s %s" % ( preJobSQL % ( tqId, prio ), postJobSQL ), conn = connObj )
+          return retVal
+        tqList = retVal[ 'Value' ]
+        if len( tqList ) == 0:
+          self.log.info( "No TQ matches requirements" )
+          return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
+        for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+          self.log.info( "Trying to extract jobs from TQ %s" % tqId )
+          retVal = self._query( prioSQL % tqId, conn = connObj )
+          if not retVal[ 'OK' ]:
+            return S_ERROR( "Can't retrieve winning priority for matching job: %s" % retVal[ 'Message' ] )
+          if len( retVal[ 'Value' ] ) == 0:
+            if self.__matchIndex:
+              #The TQ may have been deleted by another process
+              self.__matchIndex.removeTaskQueue( tqId )
+            continue
+          prio = retVal[ 'Value' ][0][0]
+          retVal = self._query( "%s %s" % ( preJobSQL % ( tqId, prio ), postJobSQL ), conn = connObj )
+          if not retVal[ 'OK' ]:
+            return S_ERROR( "Can't begin transaction for matching job: %s" % retVal[ 'Message' ] )
+          jobTQList = [ ( row[0], row[1] ) for row in retVal[ 'Value' ] ]
+          if len( jobTQList ) == 0:
+            gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
+            result = self.deleteTaskQueueIfEmpty( tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
+            if not result[ 'OK' ]:
+              return result
+          while len( jobTQList ) > 0:
+            jobId, tqId = jobTQList.pop( random.randint( 0, len( jobTQList ) - 1 ) )
+            self.log.info( "Trying to extract job %s from TQ %s" % ( jobId, tqId ) )
+            retVal = self.deleteJob( jobId, connObj = connObj )
+            if not retVal[ 'OK' ]:
+              msgFix = "Could not take job"
+              msgVar = " %s out from the TQ %s: %s" % ( jobId, tqId, retVal[ 'Message' ] )
+              self.log.error( msgFix, msgVar )
+              return S_ERROR( msgFix + msgVar )
+            if retVal[ 'Value' ] == True :
+              self.log.info( "Extracted job %s with prio %s from TQ %s" % ( jobId, prio, tqId ) )
+              return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : tqMatchDict } )
+          self.log.info( "No jobs could be extracted from TQ %s" % tqId )
+      self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
+      return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
+    finally:
+      connObj.release()
+
+  def matchAndGetJobs( self, tqMatchDict, maxJobs, numQueuesPerTry = 10, extraConditions = {} ):
+    """
+    Match up to maxJobs jobs. The jobs of each matching TQ are locked, taken out
+    of the TQ in one transaction and returned as a list of ( jobId, tqId )
+    """
+    if 'JobID' in tqMatchDict or maxJobs <= 1:
+      retVal = self.matchAndGetJob( tqMatchDict, numQueuesPerTry = numQueuesPerTry, extraConditions = extraConditions )
+      if not retVal[ 'OK' ] or not retVal[ 'Value' ][ 'matchFound' ]:
+        return retVal
+      matchData = retVal[ 'Value' ]
+      return S_OK( { 'matchFound' : True,
+                     'jobs' : [ ( matchData[ 'jobId' ], matchData[ 'taskQueueId' ] ) ],
+                     'tqMatch' : matchData[ 'tqMatch' ] } )
+    #Make a copy to avoid modification of original if escaping needs to be done
+    tqMatchDict = dict( tqMatchDict )
+    #The match index works with the unescaped values
+    rawMatchDict = dict( tqMatchDict )
+    self.log.info( "Starting match of %s jobs for requirements" % maxJobs, self.__strDict( tqMatchDict ) )
+    retVal = self._checkMatchDefinition( tqMatchDict )
+    if not retVal[ 'OK' ]:
+      self.log.error( "TQ match request check failed", retVal[ 'Message' ] )
+      return retVal
+    retVal = self._getConnection()
+    if not retVal[ 'OK' ]:
+      return S_ERROR( "Can't connect to DB: %s" % retVal[ 'Message' ] )
+    connObj = retVal[ 'Value' ]
+    try:
+      lockSQL = "SELECT `tq_Jobs`.JobId FROM `tq_Jobs` WHERE `tq_Jobs`.TQId = %s ORDER BY RAND() / `tq_Jobs`.RealPriority ASC LIMIT %s FOR UPDATE"
+      matchedJobs = []
+      for matchTry in range( self.__maxMatchRetry ):
+        if self.__matchIndex:
+          retVal = S_OK( self.__matchIndex.match( rawMatchDict,
+                                                  numQueuesToGet = numQueuesPerTry,
+                                                  extraConditions = extraConditions ) )
+        else:
+          retVal = self.matchAndGetTaskQueue( tqMatchDict,
+                                              numQueuesToGet = numQueuesPerTry,
+                                              skipMatchDictDef = True,
+                                              extraConditions = extraConditions,
+                                              connObj = connObj )
         if not retVal[ 'OK' ]:
-          return S_ERROR( "Can't begin transaction for matching job: %s" % retVal[ 'Message' ] )
-        jobTQList = [ ( row[0], row[1] ) for row in retVal[ 'Value' ] ]
-        if len( jobTQList ) == 0:
-          gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
-          result = self.deleteTaskQueueIfEmpty( tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
-          if not result[ 'OK' ]:
-            return result
-        while len( jobTQList ) > 0:
-          jobId, tqId = jobTQList.pop( random.randint( 0, len( jobTQList ) - 1 ) )
-          self.log.info( "Trying to extract job %s from TQ %s" % ( jobId, tqId ) )
-          retVal = self.deleteJob( jobId, connObj = connObj )
+          self.__rollbackTransaction( connObj )
+          return retVal
+        tqList = retVal[ 'Value' ]
+        if len( tqList ) == 0:
+          self.log.info( "No TQ matches requirements" )
+          break
+        for tqId, tqOwnerDN, tqOwnerGroup in tqList:
+          numJobs = maxJobs - len( matchedJobs )
+          self.log.info( "Trying to extract %s jobs from TQ %s" % ( numJobs, tqId ) )
+          retVal = self._query( lockSQL % ( tqId, numJobs ), conn = connObj )
           if not retVal[ 'OK' ]:
-            msgFix = "Could not take job"
-            msgVar = " %s out from the TQ %s: %s" % ( jobId, tqId, retVal[ 'Message' ] )
-            self.log.error( msgFix, msgVar )
-            return S_ERROR( msgFix + msgVar )
-          if retVal[ 'Value' ] == True :
-            self.log.info( "Extracted job %s with prio %s from TQ %s" % ( jobId, prio, tqId ) )
-            return S_OK( { 'matchFound' : True, 'jobId' : jobId, 'taskQueueId' : tqId, 'tqMatch' : tqMatchDict } )
-        self.log.info( "No jobs could be extracted from TQ %s" % tqId )
-    self.log.info( "Could not find a match after %s match retries" % self.__maxMatchRetry )
-    return S_ERROR( "Could not find a match after %s match retries" % self.__maxMatchRetry )
+            self.__rollbackTransaction( connObj )
+            return S_ERROR( "Can't begin transaction for matching jobs: %s" % retVal[ 'Message' ] )
+          jobList = [ row[0] for row in retVal[ 'Value' ] ]
+          if not jobList:
+            #Nothing to take, release the locks of the select
+            self.__rollbackTransaction( connObj )
+          else:
+            #This commits the transaction and releases the locks
+            retVal = self._update( "DELETE FROM `tq_Jobs` WHERE JobId in ( %s )" % ", ".join( [ str( jobId ) for jobId in jobList ] ),
+                                   conn = connObj )
+            if not retVal[ 'OK' ]:
+              msgFix = "Could not take jobs"
+              msgVar = " %s out from the TQ %s: %s" % ( jobList, tqId, retVal[ 'Message' ] )
+              self.log.error( msgFix, msgVar )
+              self.__rollbackTransaction( connObj )
+              return S_ERROR( msgFix + msgVar )
+            self.log.info( "Extracted jobs %s from TQ %s" % ( ", ".join( [ str( jobId ) for jobId in jobList ] ), tqId ) )
+            matchedJobs.extend( [ ( jobId, tqId ) for jobId in jobList ] )
+          if len( jobList ) < numJobs:
+            gLogger.info( "Task queue %s seems to be empty, triggering a cleaning" % tqId )
+            result = self.deleteTaskQueueIfEmpty( tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
+            if not result[ 'OK' ]:
+              self.__rollbackTransaction( connObj )
+              return result
+          if len( matchedJobs ) >= maxJobs:
+            break
+        if len( matchedJobs ) >= maxJobs:
+          break
+      if not matchedJobs:
+        return S_OK( { 'matchFound' : False, 'tqMatch' : tqMatchDict } )
+      return S_OK( { 'matchFound' : True, 'jobs' : matchedJobs, 'tqMatch' : tqMatchDict } )
+    finally:
+      connObj.release()
+
+  def __rollbackTransaction( self, connObj ):
+    """
+    Roll back the open transaction of the connection, releasing its locks
+    """
+    retVal = self._query( "ROLLBACK", conn = connObj )
+    if not retVal[ 'OK' ]:
+      self.log.error( "Can't roll back transaction", retVal[ 'Message' ] )
+    return retVal
 
   def matchAndGetTaskQueue( self, tqMatchDict, numQueuesToGet = 1, skipMatchDictDef = False, 
                                   extraConditions = {}, connObj = False ):
@@ -593,7 +796,7 @@ class TaskQueueDB( DB ):
         else:
           for dn in dns:
             ownerConds.append( "( `tq_TaskQueues`.OwnerDN = %s AND `tq_TaskQueues`.OwnerGroup = %s )" % ( dn, group ) )
-      sqlCondList.append( " OR ".join( ownerConds ) )
+      sqlCondList.append( "( %s )" % " OR ".join( ownerConds ) )
     else:
       #If not both are defined, just add the ones that are defined
       for field in ( 'OwnerGroup', 'OwnerDN' ):
@@ -662,12 +865,16 @@ class TaskQueueDB( DB ):
     Delete a job from the task queues
     Return S_OK( True/False ) / S_ERROR
     """
-    self.log.info( "Deleting job %s" % jobId )
     if not connObj:
       retVal = self._getConnection()
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't delete job: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
+      try:
+        return self.deleteJob( jobId, connObj = connObj )
+      finally:
+        connObj.release()
+    self.log.info( "Deleting job %s" % jobId )
     retVal = self._query( "SELECT t.TQId, t.OwnerDN, t.OwnerGroup FROM `tq_TaskQueues` t, `tq_Jobs` j WHERE j.JobId = %s AND t.TQId = j.TQId" % jobId, conn = connObj )
     if not retVal[ 'OK' ]:
       return S_ERROR( "Could not get job from task queue %s: %s" % ( jobId, retVal[ 'Message' ] ) )
@@ -706,6 +913,10 @@ class TaskQueueDB( DB ):
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't get TQ for job: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
+      try:
+        return self.getTaskQueueForJob( jobId, connObj = connObj )
+      finally:
+        connObj.release()
 
     retVal = self._query( 'SELECT TQId FROM `tq_Jobs` WHERE JobId = %s ' % jobId, conn = connObj )
 
@@ -726,6 +937,10 @@ class TaskQueueDB( DB ):
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't get TQs for a job list: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
+      try:
+        return self.getTaskQueueForJobs( jobIDs, connObj = connObj )
+      finally:
+        connObj.release()
 
     jobString = ','.join( [ str( x ) for x in jobIDs ] )
     retVal = self._query( 'SELECT JobId,TQId FROM `tq_Jobs` WHERE JobId in (%s) ' % jobString, conn = connObj )
@@ -760,6 +975,10 @@ class TaskQueueDB( DB ):
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't insert job: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
+      try:
+        return self.deleteTaskQueueIfEmpty( tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
+      finally:
+        connObj.release()
     if not tqOwnerDN or not tqOwnerGroup:
       retVal = self.__getOwnerForTaskQueue( tqId, connObj = connObj )
       if not retVal[ 'OK' ]:
@@ -779,6 +998,8 @@ class TaskQueueDB( DB ):
         retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
         if not retVal[ 'OK' ]:
           return retVal
+      if self.__matchIndex:
+        self.__matchIndex.removeTaskQueue( tqId )
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       self.log.info( "Deleted empty and enabled TQ %s" % tqId )
       return S_OK( True )
@@ -788,12 +1009,16 @@ class TaskQueueDB( DB ):
     """
     Try to delete a task queue even if it has jobs
     """
-    self.log.info( "Deleting TQ %s" % tqId )
     if not connObj:
       retVal = self._getConnection()
       if not retVal[ 'OK' ]:
         return S_ERROR( "Can't insert job: %s" % retVal[ 'Message' ] )
       connObj = retVal[ 'Value' ]
+      try:
+        return self.deleteTaskQueue( tqId, tqOwnerDN, tqOwnerGroup, connObj = connObj )
+      finally:
+        connObj.release()
+    self.log.info( "Deleting TQ %s" % tqId )
     if not tqOwnerDN or not tqOwnerGroup:
       retVal = self.__getOwnerForTaskQueue( tqId, connObj = connObj )
       if not retVal[ 'OK' ]:
@@ -812,9 +1037,11 @@ class TaskQueueDB( DB ):
     if not retVal[ 'OK' ]:
       return S_ERROR( "Could not delete task queue %s: %s" % ( tqId, retVal[ 'Message' ] ) )
     for mvField in self.__multiValueDefFields:
-      retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % tqId, conn = connObj )
+      retVal = self._update( "DELETE FROM `tq_TQTo%s` WHERE TQId = %s" % ( mvField, tqId ), conn = connObj )
       if not retVal[ 'OK' ]:
         return retVal
+    if self.__matchIndex:
+      self.__matchIndex.removeTaskQueue( tqId )
     if delTQ > 0:
       self.recalculateTQSharesForEntity( tqOwnerDN, tqOwnerGroup, connObj = connObj )
       return S_OK( True )
@@ -928,10 +1155,6 @@ class TaskQueueDB( DB ):
       self.__sharesCorrector.update()
     self.__updateGlobalShares()
     self.log.info( "Recalculating shares for all TQs" )
-    retVal = self._getConnection()
-    if not retVal[ 'OK' ]:
-      return S_ERROR( "Can't insert job: %s" % retVal[ 'Message' ] )
-    connObj = retVal[ 'Value' ]
     result = self._query( "SELECT DISTINCT( OwnerGroup ) FROM `tq_TaskQueues`" )
     if not result[ 'OK' ]:
       return result
@@ -1024,7 +1247,9 @@ class TaskQueueDB( DB ):
     for prio in prioDict:
       tqList = ", ".join( [ str( tqId ) for tqId in prioDict[ prio ] ] )
       updateSQL = "UPDATE `tq_TaskQueues` SET Priority=%.4f WHERE TQId in ( %s )" % ( prio, tqList )
-      self._update( updateSQL, conn = connObj )
+      result = self._update( updateSQL, conn = connObj )
+      if result[ 'OK' ] and self.__matchIndex:
+        self.__matchIndex.setPriorities( prioDict[ prio ], prio )
     return S_OK()
 
   def getGroupShares( self ):
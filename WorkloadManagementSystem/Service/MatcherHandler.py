@@ -53,6 +53,15 @@ def initializeMatcherHandler( serviceInfo ):
 
   taskQueueDB.recalculateTQSharesForAll()
   gThreadScheduler.addPeriodicTask( 120, taskQueueDB.recalculateTQSharesForAll )
+
+  serviceCS = serviceInfo[ 'serviceSectionPath' ]
+  if gConfig.getValue( "%s/UseMatchIndex" % serviceCS, False ):
+    result = taskQueueDB.enableMatchIndex()
+    if not result[ 'OK' ]:
+      return result
+    gLogger.info( "Using in memory match index with %s task queues" % result[ 'Value' ] )
+    gThreadScheduler.addPeriodicTask( gConfig.getValue( "%s/MatchIndexSyncPeriod" % serviceCS, 30 ),
+                                      taskQueueDB.syncMatchIndex )
   gThreadScheduler.addPeriodicTask( 120, sendNumTaskQueues )
 
   sendNumTaskQueues()
@@ -76,14 +85,11 @@ class MatcherHandler( RequestHandler ):
     self.vo = getVO()
     self.pilotVersion = gConfig.getValue( '/Operations/%s/%s/Versions/PilotVersion' % ( self.vo, self.setup ), '' )
 
-  def selectJob( self, resourceDescription ):
-    """ Main job selection function to find the highest priority job
-        matching the resource capacity
+  def __getResourceDict( self, resourceDescription ):
+    """ Check and form the resource description dictionary to be used for the matching.
+        Returns S_OK( ( resourceDict, siteName ) )
     """
 
-    startTime = time.time()
-
-    # Check and form the resource description dictionary
     resourceDict = {}
     if type( resourceDescription ) in StringTypes:
       classAdAgent = ClassAd( resourceDescription )
@@ -131,7 +137,7 @@ class MatcherHandler( RequestHandler ):
                          ( resourceDict['DIRACVersion'], self.pilotVersion ) )
 
     # Get common site mask and check the agent site
-    result = jobDB.getSiteMask( siteState = 'Active' )
+    result = jobDB.getCachedSiteMask( siteState = 'Active' )
     if result['OK']:
       maskList = result['Value']
     else:
@@ -154,6 +160,11 @@ class MatcherHandler( RequestHandler ):
       for k, v in resourceDict.items():
         print k.rjust( 20 ), v
 
+    return S_OK( ( resourceDict, siteName ) )
+
+  def __getSiteExtraConditions( self, siteName ):
+    """ Get the job limits imposed onto the site, if any
+    """
     # Check if Job Limits are imposed onto the site
     extraConditions = {}
     if self.siteJobLimits:
@@ -162,6 +173,20 @@ class MatcherHandler( RequestHandler ):
         extraConditions = result['Value']
     if extraConditions:
       gLogger.info( 'Job Limits for site %s are: %s' % ( siteName, str( extraConditions ) ) )
+    return extraConditions
+
+  def selectJob( self, resourceDescription ):
+    """ Main job selection function to find the highest priority job
+        matching the resource capacity
+    """
+
+    startTime = time.time()
+
+    result = self.__getResourceDict( resourceDescription )
+    if not result['OK']:
+      return result
+    resourceDict, siteName = result['Value']
+    extraConditions = self.__getSiteExtraConditions( siteName )
 
     result = taskQueueDB.matchAndGetJob( resourceDict, extraConditions = extraConditions )
 
@@ -217,6 +242,81 @@ class MatcherHandler( RequestHandler ):
     resultDict['Group'] = resAtt['Value']['OwnerGroup']
     return S_OK( resultDict )
 
+  def selectJobs( self, resourceDescription, maxJobs ):
+    """ Select up to maxJobs jobs matching the resource capacity in one go.
+        The job information is retrieved and the job states are set with bulk
+        queries. Returns a list with a dictionary per job as in selectJob
+    """
+
+    startTime = time.time()
+
+    result = self.__getResourceDict( resourceDescription )
+    if not result['OK']:
+      return result
+    resourceDict, siteName = result['Value']
+    extraConditions = self.__getSiteExtraConditions( siteName )
+
+    result = taskQueueDB.matchAndGetJobs( resourceDict, maxJobs, extraConditions = extraConditions )
+    if not result['OK']:
+      return result
+    result = result['Value']
+    if not result['matchFound']:
+      return S_ERROR( 'No match found' )
+
+    jobIDs = [ jobID for jobID, tqID in result['jobs'] ]
+    resAtt = jobDB.getAttributesForJobList( jobIDs, ['OwnerDN', 'OwnerGroup', 'Status'] )
+    if not resAtt['OK']:
+      return S_ERROR( 'Could not retrieve job attributes' )
+    jobAttributes = resAtt['Value']
+    waitingJobIDs = []
+    for jobID in jobIDs:
+      if jobID not in jobAttributes:
+        gLogger.error( 'No attributes returned for job %s' % str( jobID ) )
+      elif not jobAttributes[jobID]['Status'] == 'Waiting':
+        # The job may have been matched already, it must not be handed out again
+        gLogger.error( 'Job %s matched by the TQ is not in Waiting state' % str( jobID ) )
+        result = taskQueueDB.deleteJob( jobID )
+      else:
+        waitingJobIDs.append( jobID )
+    jobIDs = waitingJobIDs
+    if not jobIDs:
+      return S_ERROR( 'No Waiting jobs among the matched ones' )
+
+    result = jobDB.setJobStatus( jobIDs, status = 'Matched', minor = 'Assigned' )
+    result = jobLoggingDB.addLoggingRecord( jobIDs,
+                                            status = 'Matched',
+                                            minor = 'Assigned',
+                                            source = 'Matcher' )
+
+    result = jobDB.getJobJDLsForJobList( jobIDs )
+    if not result['OK']:
+      return S_ERROR( 'Failed to get the job JDLs' )
+    jobJDLs = result['Value']
+    resOpt = jobDB.getJobOptParametersForJobList( jobIDs )
+    if resOpt['OK']:
+      jobOptParameters = resOpt['Value']
+    else:
+      jobOptParameters = {}
+
+    jobList = []
+    for jobID in jobIDs:
+      if jobID not in jobJDLs:
+        gLogger.error( 'Failed to get the JDL for job %s' % str( jobID ) )
+        continue
+      resultDict = {}
+      resultDict['JDL'] = jobJDLs[jobID]
+      resultDict['JobID'] = jobID
+      for key, value in jobOptParameters.get( jobID, {} ).items():
+        resultDict[key] = value
+      resultDict['DN'] = jobAttributes[jobID]['OwnerDN']
+      resultDict['Group'] = jobAttributes[jobID]['OwnerGroup']
+      jobList.append( resultDict )
+
+    matchTime = time.time() - startTime
+    gLogger.info( "Match time for %s jobs: [%s]" % ( len( jobList ), str( matchTime ) ) )
+    gMonitor.addMark( "matchTime", matchTime )
+    return S_OK( jobList )
+
   def getExtraConditions( self, site ):
     """ Get extra conditions allowing site throttling
     """
@@ -283,6 +383,20 @@ class MatcherHandler( RequestHandler ):
     gMonitor.addMark( "matchesDone" )
     return result
 
+##############################################################################
+  types_requestJobs = [ [StringType, DictType], [IntType, LongType] ]
+  def export_requestJobs( self, resourceDescription, maxJobs ):
+    """ Serve up to maxJobs jobs to the request of an agent with several slots.
+        The highest priority jobs matching the agent's site capacity are returned
+    """
+
+    if maxJobs < 1:
+      return S_ERROR( 'The number of requested jobs must be positive' )
+    result = self.selectJobs( resourceDescription, maxJobs )
+    if result['OK']:
+      gMonitor.addMark( "matchesDone", len( result['Value'] ) )
+    return result
+
 ##############################################################################
   types_getActiveTaskQueues = []
   def export_getActiveTaskQueues( self ):
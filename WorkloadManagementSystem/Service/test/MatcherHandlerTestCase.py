@@ -0,0 +1,111 @@
+########################################################################
+# $HeadURL $
+# File: MatcherHandlerTestCase.py
+########################################################################
+
+""".. module:: MatcherHandlerTestCase
+
+Test cases for DIRAC.WorkloadManagementSystem.Service.MatcherHandler module.
+
+"""
+
+__RCSID__ = "$Id $"
+
+## imports
+from DIRAC import S_OK
+import DIRAC.WorkloadManagementSystem.Service.MatcherHandler as MatcherHandlerModule
+from DIRAC.WorkloadManagementSystem.Service.MatcherHandler import MatcherHandler
+import unittest
+
+class FakeTaskQueueDB:
+  """ task queues matching the jobs it is given """
+
+  def __init__( self, matchedJobs ):
+    self.matchedJobs = matchedJobs
+    self.deletedJobs = []
+
+  def getSingleValueTQDefFields( self ):
+    return ( 'Site', 'CPUTime' )
+
+  def getMultiValueMatchFields( self ):
+    return ()
+
+  def matchAndGetJobs( self, resourceDict, maxJobs, extraConditions = None ):
+    return S_OK( { 'matchFound' : True, 'jobs' : [ ( jobID, 1 ) for jobID in self.matchedJobs[ :maxJobs ] ] } )
+
+  def deleteJob( self, jobID ):
+    self.deletedJobs.append( jobID )
+    return S_OK()
+
+class FakeJobDB:
+  """ jobs with the given states """
+
+  def __init__( self, jobStates ):
+    self.jobStates = jobStates
+    self.matchedJobs = []
+
+  def getCachedSiteMask( self, siteState = 'Active' ):
+    return S_OK( [ 'LCG.CERN.ch' ] )
+
+  def getAttributesForJobList( self, jobIDs, attrList ):
+    return S_OK( dict( [ ( jobID, { 'OwnerDN' : '/CN=owner', 'OwnerGroup' : 'user',
+                                    'Status' : self.jobStates[ jobID ] } ) for jobID in jobIDs ] ) )
+
+  def setJobStatus( self, jobIDs, status = '', minor = '' ):
+    self.matchedJobs.extend( jobIDs )
+    return S_OK()
+
+  def getJobJDLsForJobList( self, jobIDs ):
+    return S_OK( dict( [ ( jobID, "[ Executable = \"job%s\"; ]" % jobID ) for jobID in jobIDs ] ) )
+
+  def getJobOptParametersForJobList( self, jobIDs ):
+    return S_OK( {} )
+
+class FakeJobLoggingDB:
+
+  def addLoggingRecord( self, jobIDs, status = '', minor = '', source = '' ):
+    return S_OK()
+
+class MatcherHandlerForTest( MatcherHandler ):
+  """ handler that doesn't need a connection nor the CS """
+
+  def __init__( self ):
+    self.siteJobLimits = False
+    self.checkPilotVersion = False
+    self.serviceInfoDict = { 'clientSetup' : 'Test' }
+
+########################################################################
+class MatcherHandlerTestCase( unittest.TestCase ):
+  """py:class MatcherHandlerTestCase
+  Test case for DIRAC.WorkloadManagementSystem.Service.MatcherHandler module.
+  """
+
+  def setUp( self ):
+    self.taskQueueDB = FakeTaskQueueDB( [ 1, 2, 3 ] )
+    self.jobDB = FakeJobDB( { 1 : 'Waiting', 2 : 'Matched', 3 : 'Waiting' } )
+    MatcherHandlerModule.taskQueueDB = self.taskQueueDB
+    MatcherHandlerModule.jobDB = self.jobDB
+    MatcherHandlerModule.jobLoggingDB = FakeJobLoggingDB()
+    self.resourceDict = { 'Site' : 'LCG.CERN.ch', 'CPUTime' : 100000 }
+
+  def testSelectJobsOnlyWaiting( self ):
+    """ jobs not in Waiting state are taken out of the TQ and not handed out """
+    result = MatcherHandlerForTest().selectJobs( self.resourceDict, 3 )
+    self.assert_( result[ 'OK' ] )
+    self.assertEqual( [ jobDict[ 'JobID' ] for jobDict in result[ 'Value' ] ], [ 1, 3 ] )
+    self.assertEqual( self.jobDB.matchedJobs, [ 1, 3 ] )
+    self.assertEqual( self.taskQueueDB.deletedJobs, [ 2 ] )
+
+  def testSelectJobsNoneWaiting( self ):
+    """ an error is returned if none of the matched jobs is Waiting """
+    self.jobDB.jobStates = { 1 : 'Matched', 2 : 'Running', 3 : 'Killed' }
+    result = MatcherHandlerForTest().selectJobs( self.resourceDict, 3 )
+    self.assertFalse( result[ 'OK' ] )
+    self.assertEqual( self.jobDB.matchedJobs, [] )
+    self.assertEqual( self.taskQueueDB.deletedJobs, [ 1, 2, 3 ] )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( MatcherHandlerTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )
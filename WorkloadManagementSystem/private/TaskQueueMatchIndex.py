@@ -0,0 +1,270 @@
+########################################################################
+# $HeadURL$
+########################################################################
+""" In memory index of the task queue definitions used to match resources
+    to task queues without hitting the TaskQueueDB
+"""
+
+__RCSID__ = "$Id$"
+
+import random
+import threading
+import types
+from DIRAC.Core.Security import Properties, CS
+
+class TaskQueueMatchIndex:
+  """
+  Keeps the definition of the enabled task queues indexed by the values of
+  their multi value fields ( Sites, GridCEs, LHCbPlatforms, PilotTypes... ) and
+  by Setup, and reproduces the TaskQueueDB match semantics in memory
+  """
+
+  def __init__( self, multiValueDefFields, multiValueMatchFields, bannedJobMatchFields = ( 'Site', ) ):
+    self.__lock = threading.Lock()
+    self.__multiValueDefFields = multiValueDefFields
+    self.__multiValueMatchFields = multiValueMatchFields
+    self.__bannedJobMatchFields = bannedJobMatchFields
+    self.__tqDefs = {}
+    self.__setupIndex = {}
+    self.__valueIndex = {}
+    self.__unrestricted = {}
+    for field in self.__multiValueDefFields:
+      self.__valueIndex[ field ] = {}
+      self.__unrestricted[ field ] = set()
+
+  def __toList( self, value ):
+    if type( value ) in ( types.ListType, types.TupleType ):
+      return [ str( v ).strip() for v in value ]
+    return [ str( value ).strip() ]
+
+  def __isGiven( self, tqMatchDict, field ):
+    """
+    Check if a match condition is given as TaskQueueDB does it on the escaped values:
+    strings, even empty ones, are given, lists only if they are not empty
+    """
+    if field not in tqMatchDict:
+      return False
+    value = tqMatchDict[ field ]
+    if type( value ) in ( types.ListType, types.TupleType ):
+      return len( value ) > 0
+    return True
+
+  def __unindex( self, tqId ):
+    """
+    Remove a task queue from the indexes. Requires the lock to be held
+    """
+    tqDef = self.__tqDefs.pop( tqId, None )
+    if not tqDef:
+      return False
+    setupTQs = self.__setupIndex.get( tqDef[ 'Setup' ], set() )
+    setupTQs.discard( tqId )
+    if not setupTQs:
+      self.__setupIndex.pop( tqDef[ 'Setup' ], None )
+    for field in self.__multiValueDefFields:
+      values = tqDef[ field ]
+      if not values:
+        self.__unrestricted[ field ].discard( tqId )
+        continue
+      for value in values:
+        valueTQs = self.__valueIndex[ field ].get( value, set() )
+        valueTQs.discard( tqId )
+        if not valueTQs:
+          self.__valueIndex[ field ].pop( value, None )
+    return True
+
+  def __index( self, tqId, tqDef ):
+    """
+    Insert a task queue in the indexes. Requires the lock to be held
+    """
+    self.__unindex( tqId )
+    self.__tqDefs[ tqId ] = tqDef
+    self.__setupIndex.setdefault( tqDef[ 'Setup' ], set() ).add( tqId )
+    for field in self.__multiValueDefFields:
+      values = tqDef[ field ]
+      if not values:
+        self.__unrestricted[ field ].add( tqId )
+        continue
+      for value in values:
+        self.__valueIndex[ field ].setdefault( value, set() ).add( tqId )
+
+  def setTaskQueue( self, tqId, tqDefDict, priority = 1, enabled = True ):
+    """
+    Add or replace the definition of a task queue
+      - tqDefDict has to contain the unescaped OwnerDN, OwnerGroup, Setup and CPUTime
+        and optionally the multi value fields as lists
+    """
+    tqDef = { 'OwnerDN' : tqDefDict[ 'OwnerDN' ],
+              'OwnerGroup' : tqDefDict[ 'OwnerGroup' ],
+              'Setup' : tqDefDict[ 'Setup' ],
+              'CPUTime' : tqDefDict[ 'CPUTime' ],
+              'Priority' : float( priority ),
+              'Enabled' : bool( enabled ) }
+    for field in self.__multiValueDefFields:
+      tqDef[ field ] = frozenset( [ v.strip() for v in tqDefDict.get( field, [] ) if v.strip() ] )
+    self.__lock.acquire()
+    try:
+      self.__index( tqId, tqDef )
+    finally:
+      self.__lock.release()
+
+  def removeTaskQueue( self, tqId ):
+    """
+    Remove a task queue from the index
+    """
+    self.__lock.acquire()
+    try:
+      return self.__unindex( tqId )
+    finally:
+      self.__lock.release()
+
+  def setTaskQueueState( self, tqId, enabled ):
+    self.__lock.acquire()
+    try:
+      if tqId in self.__tqDefs:
+        self.__tqDefs[ tqId ][ 'Enabled' ] = bool( enabled )
+    finally:
+      self.__lock.release()
+
+  def setPriorities( self, tqIdList, priority ):
+    self.__lock.acquire()
+    try:
+      for tqId in tqIdList:
+        if tqId in self.__tqDefs:
+          self.__tqDefs[ tqId ][ 'Priority' ] = float( priority )
+    finally:
+      self.__lock.release()
+
+  def getTaskQueueIds( self ):
+    self.__lock.acquire()
+    try:
+      return self.__tqDefs.keys()
+    finally:
+      self.__lock.release()
+
+  def __len__( self ):
+    return len( self.__tqDefs )
+
+  def __candidatesForField( self, field, values, unrestrictedAllowed ):
+    """
+    Get the TQs that accept any of the values for a multi value field.
+    Requires the lock to be held
+    """
+    tableField = "%ss" % field
+    candidates = set()
+    if unrestrictedAllowed:
+      candidates.update( self.__unrestricted[ tableField ] )
+    for value in values:
+      candidates.update( self.__valueIndex[ tableField ].get( value, () ) )
+    return candidates
+
+  def __getOwnerConditions( self, tqMatchDict ):
+    """
+    Get the accepted owners as a tuple ( groupDNs, fieldValues )
+      - groupDNs maps each OwnerGroup to the set of accepted OwnerDNs, None meaning
+        any DN for groups with job sharing, or is False if not both are requested
+      - fieldValues maps OwnerGroup and/or OwnerDN to their accepted values otherwise
+    It looks up the group properties, so it has to be called without holding the lock
+    """
+    if 'OwnerDN' in tqMatchDict and 'OwnerGroup' in tqMatchDict:
+      dns = set( self.__toList( tqMatchDict[ 'OwnerDN' ] ) )
+      groupDNs = {}
+      for group in self.__toList( tqMatchDict[ 'OwnerGroup' ] ):
+        if Properties.JOB_SHARING in CS.getPropertiesForGroup( group ):
+          groupDNs[ group ] = None
+        else:
+          groupDNs[ group ] = dns
+      return ( groupDNs, {} )
+    fieldValues = {}
+    for field in ( 'OwnerGroup', 'OwnerDN' ):
+      if field in tqMatchDict:
+        fieldValues[ field ] = set( self.__toList( tqMatchDict[ field ] ) )
+    return ( False, fieldValues )
+
+  def __ownerMatches( self, tqDef, ownerConditions ):
+    groupDNs, fieldValues = ownerConditions
+    if groupDNs is not False:
+      if tqDef[ 'OwnerGroup' ] not in groupDNs:
+        return False
+      dns = groupDNs[ tqDef[ 'OwnerGroup' ] ]
+      return dns is None or tqDef[ 'OwnerDN' ] in dns
+    for field in fieldValues:
+      if tqDef[ field ] not in fieldValues[ field ]:
+        return False
+    return True
+
+  def match( self, tqMatchDict, numQueuesToGet = 1, extraConditions = {} ):
+    """
+    Get the task queues that match the requirements as a list of ( TQId, OwnerDN, OwnerGroup )
+    sorted by a random draw weighted with the TQ priority
+      - tqMatchDict has to contain unescaped values
+    """
+    ownerConditions = self.__getOwnerConditions( tqMatchDict )
+    self.__lock.acquire()
+    try:
+      if 'Setup' in tqMatchDict:
+        candidates = set()
+        for setup in self.__toList( tqMatchDict[ 'Setup' ] ):
+          candidates.update( self.__setupIndex.get( setup, () ) )
+      else:
+        candidates = set( self.__tqDefs )
+      #Narrow the candidates with the multi value indexes
+      for field in self.__multiValueMatchFields:
+        if not candidates:
+          break
+        if self.__isGiven( tqMatchDict, field ):
+          # Jobs for masked sites can be matched if they specified a GridCE
+          unrestrictedAllowed = field != 'GridCE' or 'Site' in tqMatchDict
+          candidates.intersection_update( self.__candidatesForField( field,
+                                                                     self.__toList( tqMatchDict[ field ] ),
+                                                                     unrestrictedAllowed ) )
+        elif field == 'PilotType' and field not in tqMatchDict:
+          #If the pilot type is not specified, none must be in the task queue
+          candidates.intersection_update( self.__unrestricted[ 'PilotTypes' ] )
+      #Check the rest of the conditions for the remaining candidates
+      cpuTime = False
+      if 'CPUTime' in tqMatchDict:
+        cpuTime = max( [ int( v ) for v in self.__toList( tqMatchDict[ 'CPUTime' ] ) ] )
+      bannedValues = {}
+      for field in self.__multiValueMatchFields:
+        values = set()
+        if field in self.__bannedJobMatchFields and self.__isGiven( tqMatchDict, field ):
+          values.update( self.__toList( tqMatchDict[ field ] ) )
+        bannedField = "Banned%s" % field
+        if self.__isGiven( tqMatchDict, bannedField ):
+          bannedValues[ "%ss" % field ] = set( self.__toList( tqMatchDict[ bannedField ] ) )
+        if values:
+          bannedValues[ "Banned%ss" % field ] = values
+      for field in extraConditions:
+        if field in self.__multiValueMatchFields:
+          bannedValues.setdefault( "%ss" % field, set() ).update( extraConditions[ field ] )
+      matched = []
+      for tqId in candidates:
+        tqDef = self.__tqDefs[ tqId ]
+        if not tqDef[ 'Enabled' ]:
+          continue
+        if cpuTime is not False and tqDef[ 'CPUTime' ] > cpuTime:
+          continue
+        if not self.__ownerMatches( tqDef, ownerConditions ):
+          continue
+        valid = True
+        for tableField in bannedValues:
+          if tqDef[ tableField ].intersection( bannedValues[ tableField ] ):
+            valid = False
+            break
+        if not valid:
+          continue
+        for field in extraConditions:
+          if field not in self.__multiValueMatchFields and tqDef.get( field ) in extraConditions[ field ]:
+            valid = False
+            break
+        if not valid:
+          continue
+        #Same ordering as RAND() / Priority
+        matched.append( ( random.random() / max( tqDef[ 'Priority' ], 0.000001 ),
+                          tqId, tqDef[ 'OwnerDN' ], tqDef[ 'OwnerGroup' ] ) )
+    finally:
+      self.__lock.release()
+    matched.sort()
+    if numQueuesToGet:
+      matched = matched[ :numQueuesToGet ]
+    return [ ( tqId, ownerDN, ownerGroup ) for dummy, tqId, ownerDN, ownerGroup in matched ]
@@ -0,0 +1,149 @@
+########################################################################
+# $HeadURL $
+# File: TaskQueueMatchIndexTestCase.py
+########################################################################
+
+""".. module:: TaskQueueMatchIndexTestCase
+
+Test cases for DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex module.
+
+The matches of the index are compared with the ones of the SQL generated by
+TaskQueueDB, run on an sqlite copy of the task queue tables.
+
+"""
+
+__RCSID__ = "$Id$"
+
+## imports
+import random
+import sqlite3
+import unittest
+from DIRAC.Core.Security import CS, Properties
+from DIRAC.WorkloadManagementSystem.DB.TaskQueueDB import TaskQueueDB
+from DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex import TaskQueueMatchIndex
+
+MULTI_VALUE_DEF_FIELDS = ( 'Sites', 'GridCEs', 'GridMiddlewares', 'BannedSites',
+                           'LHCbPlatforms', 'PilotTypes', 'SubmitPools', 'JobTypes' )
+MULTI_VALUE_MATCH_FIELDS = ( 'GridCE', 'Site', 'GridMiddleware', 'LHCbPlatform',
+                             'PilotType', 'SubmitPool', 'JobType' )
+BANNED_JOB_MATCH_FIELDS = ( 'Site', )
+
+GROUP_PROPERTIES = { 'prod' : [ Properties.JOB_SHARING ], 'user' : [] }
+
+TASK_QUEUES = [ ( 'user', '/CN=a', {} ),
+                ( 'user', '/CN=b', { 'Sites' : [ 'LCG.CERN.ch' ] } ),
+                ( 'user', '/CN=a', { 'PilotTypes' : [ 'private' ] } ),
+                ( 'prod', '/CN=a', { 'Sites' : [ 'LCG.PIC.es', 'LCG.CNAF.it' ] } ),
+                ( 'prod', '/CN=c', { 'BannedSites' : [ 'LCG.CERN.ch' ] } ),
+                ( 'prod', '/CN=c', { 'GridCEs' : [ 'ce.cern.ch' ], 'PilotTypes' : [ 'private', 'generic' ] } ),
+                ( 'user', '/CN=b', { 'Sites' : [ 'LCG.CERN.ch' ], 'SubmitPools' : [ 'pool1' ] } ) ]
+
+MATCH_DICTS = [ {},
+                { 'OwnerGroup' : 'user' },
+                { 'OwnerDN' : [ '/CN=b', '/CN=c' ] },
+                { 'OwnerGroup' : 'user', 'OwnerDN' : '/CN=a' },
+                { 'OwnerGroup' : [ 'user', 'prod' ], 'OwnerDN' : '/CN=a' },
+                { 'OwnerGroup' : 'prod', 'OwnerDN' : '/CN=b' },
+                { 'PilotType' : 'private' },
+                { 'PilotType' : [ 'generic', 'other' ] },
+                { 'PilotType' : '' },
+                { 'PilotType' : [] },
+                { 'Site' : 'LCG.CERN.ch' },
+                { 'Site' : [ 'LCG.PIC.es', 'LCG.CERN.ch' ], 'OwnerGroup' : 'prod' },
+                { 'GridCE' : 'ce.cern.ch' },
+                { 'GridCE' : 'ce.cern.ch', 'Site' : 'LCG.CERN.ch', 'PilotType' : 'generic' },
+                { 'BannedSite' : 'LCG.CERN.ch' },
+                { 'SubmitPool' : 'pool1', 'Site' : 'LCG.CERN.ch', 'OwnerGroup' : 'user', 'OwnerDN' : '/CN=b' },
+                { 'CPUTime' : 1000 },
+                { 'Setup' : 'Other' } ]
+
+class TaskQueueDBForTest( TaskQueueDB ):
+  """ TaskQueueDB that only generates SQL, without connecting to MySQL """
+
+  def __init__( self ):
+    self._TaskQueueDB__multiValueMatchFields = MULTI_VALUE_MATCH_FIELDS
+    self._TaskQueueDB__bannedJobMatchFields = BANNED_JOB_MATCH_FIELDS
+
+  def generateTQMatchSQL( self, tqMatchDict ):
+    return self._TaskQueueDB__generateTQMatchSQL( tqMatchDict, numQueuesToGet = 0 )[ 'Value' ]
+
+def getPropertiesForGroup( groupName, defaultValue = None ):
+  """ the SQL path looks up the escaped group names """
+  return GROUP_PROPERTIES.get( groupName.strip( "'" ), [] )
+
+def escapeMatchDict( tqMatchDict ):
+  """ quote the values as _checkMatchDefinition does """
+  escapedDict = {}
+  for field, value in tqMatchDict.items():
+    if field == 'CPUTime':
+      escapedDict[ field ] = value
+    elif type( value ) == type( [] ):
+      escapedDict[ field ] = [ "'%s'" % v for v in value ]
+    else:
+      escapedDict[ field ] = "'%s'" % value
+  return escapedDict
+
+########################################################################
+class TaskQueueMatchIndexTestCase( unittest.TestCase ):
+  """py:class TaskQueueMatchIndexTestCase
+  Test case for DIRAC.WorkloadManagementSystem.private.TaskQueueMatchIndex module.
+  """
+
+  def setUp( self ):
+    self.getPropertiesForGroup = CS.getPropertiesForGroup
+    CS.getPropertiesForGroup = getPropertiesForGroup
+    self.tqDB = TaskQueueDBForTest()
+    self.index = TaskQueueMatchIndex( MULTI_VALUE_DEF_FIELDS, MULTI_VALUE_MATCH_FIELDS,
+                                      BANNED_JOB_MATCH_FIELDS )
+    self.db = sqlite3.connect( ":memory:" )
+    self.db.create_function( "RAND", 0, random.random )
+    self.db.execute( "CREATE TABLE tq_TaskQueues ( TQId INTEGER, OwnerDN TEXT, OwnerGroup TEXT, "
+                     "Setup TEXT, CPUTime INTEGER, Priority REAL, Enabled INTEGER )" )
+    for field in MULTI_VALUE_DEF_FIELDS:
+      self.db.execute( "CREATE TABLE tq_TQTo%s ( TQId INTEGER, Value TEXT )" % field )
+    for tqId, ( group, dn, multiValues ) in enumerate( TASK_QUEUES ):
+      tqDefDict = { 'OwnerDN' : dn, 'OwnerGroup' : group, 'Setup' : 'Test', 'CPUTime' : 100 * ( tqId + 1 ) }
+      tqDefDict.update( multiValues )
+      self.index.setTaskQueue( tqId, tqDefDict )
+      self.db.execute( "INSERT INTO tq_TaskQueues VALUES ( ?, ?, ?, 'Test', ?, 1, 1 )",
+                       ( tqId, dn, group, tqDefDict[ 'CPUTime' ] ) )
+      for field, values in multiValues.items():
+        for value in values:
+          self.db.execute( "INSERT INTO tq_TQTo%s VALUES ( ?, ? )" % field, ( tqId, value ) )
+
+  def tearDown( self ):
+    CS.getPropertiesForGroup = self.getPropertiesForGroup
+    self.db.close()
+
+  def __sqlMatch( self, tqMatchDict ):
+    sqlCmd = self.tqDB.generateTQMatchSQL( escapeMatchDict( tqMatchDict ) )
+    return sorted( self.db.execute( sqlCmd ).fetchall() )
+
+  def __indexMatch( self, tqMatchDict ):
+    return sorted( self.index.match( tqMatchDict, numQueuesToGet = 0 ) )
+
+  def testSameMatchesAsSQL( self ):
+    """ owner, group, pilot type and site conditions """
+    for tqMatchDict in MATCH_DICTS:
+      self.assertEqual( self.__indexMatch( tqMatchDict ), self.__sqlMatch( tqMatchDict ), tqMatchDict )
+
+  def testDisabledAndRemoved( self ):
+    """ disabled and removed task queues are not matched """
+    self.index.setTaskQueueState( 0, False )
+    self.index.removeTaskQueue( 1 )
+    self.db.execute( "UPDATE tq_TaskQueues SET Enabled = 0 WHERE TQId = 0" )
+    self.db.execute( "DELETE FROM tq_TaskQueues WHERE TQId = 1" )
+    for tqMatchDict in MATCH_DICTS:
+      self.assertEqual( self.__indexMatch( tqMatchDict ), self.__sqlMatch( tqMatchDict ), tqMatchDict )
+
+  def testPriorityOrder( self ):
+    """ a limited number of task queues is returned, the higher priorities first """
+    self.index.setPriorities( [ 3 ], 1000000 )
+    self.assertEqual( len( self.index.match( {}, numQueuesToGet = 2 ) ), 2 )
+    self.assertEqual( self.index.match( { 'OwnerGroup' : 'prod' }, numQueuesToGet = 1 )[0][0], 3 )
+
+## test execution
+if __name__ == "__main__":
+  TESTLOADER = unittest.TestLoader()
+  SUITE = TESTLOADER.loadTestsFromTestCase( TaskQueueMatchIndexTestCase )
+  unittest.TextTestRunner( verbosity = 3 ).run( SUITE )